@@ -3,10 +3,12 @@
 """
 import asyncio
 import os
+import time
 from typing import Dict, List, Optional
 from pyrogram import Client
 from pyrogram.errors import FloodWait, SessionPasswordNeeded
-from config import API_ID, API_HASH, ACCOUNTS_FILE
+from config import API_ID, API_HASH, ACCOUNTS_FILE, CLAIM_ACCOUNTS
+from peer_cache import peer_cache
 
 
 class AccountManager:
@@ -109,8 +111,23 @@ class AccountManager:
         successful = sum(1 for r in results if r is True)
         print(f"✅ Успешно подключено {successful} из {len(accounts)} аккаунтов")
         
+        if self.clients:
+            await self.warm_up_peers()
+        
         return successful
 
+    async def warm_up_peers(self):
+        """
+        Разрешить и закрепить пиры ботов и чата рассылки на каждом клиенте,
+        чтобы при активации чеков не разрешать username
+        """
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            peer_cache.warm_up(client, self.get_account_info(phone))
+            for phone, client in self.clients.items()
+        ), return_exceptions=True)
+        print(peer_cache.report(time.perf_counter() - started))
+
     async def stop_all(self):
         """Остановить все клиенты"""
         self.running = False
@@ -138,6 +155,15 @@ class AccountManager:
         """Получить все клиенты"""
         return self.clients.copy()
 
+    def get_claim_clients(self) -> Dict[str, Client]:
+        """Получить клиенты аккаунтов, которые активируют найденные чеки"""
+        if not CLAIM_ACCOUNTS:
+            return self.clients.copy()
+        return {
+            phone: client for phone, client in self.clients.items()
+            if phone in CLAIM_ACCOUNTS
+        }
+
     def get_account_info(self, phone: str) -> str:
         """Получить информацию об аккаунте"""
         return self.account_info.get(phone, phone)
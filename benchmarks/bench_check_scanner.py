@@ -0,0 +1,167 @@
+"""
+Микробенчмарк: однопроходный CheckScanner против прежнего extract_checks
+
+Запуск: python benchmarks/bench_check_scanner.py [--repeat N]
+"""
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import CHECK_PATTERNS  # noqa: E402
+from check_scanner import CheckScanner  # noqa: E402
+
+_COMPILED = {
+    "cryptobot": [re.compile(p, re.IGNORECASE) for p in CHECK_PATTERNS["cryptobot"]],
+    "xrocket": [re.compile(p, re.IGNORECASE) for p in CHECK_PATTERNS["xrocket"]],
+}
+
+
+def legacy_extract_checks(text):
+    """Прежняя реализация CheckProcessor.extract_checks (без изменений)"""
+    checks = []
+    if "start=" not in text and "/start" not in text.lower():
+        return checks
+    text_clean = text.replace("\\", "").replace("\n", " ").replace("\r", " ")
+    for pattern in _COMPILED["cryptobot"]:
+        for match in pattern.finditer(text_clean):
+            url = match.group(0)
+            if "start=" in url:
+                parts = url.split("start=", 1)
+                if len(parts) > 1:
+                    check_code = parts[1].split("&")[0].split()[0].split("\n")[0].strip()
+                    if check_code.startswith("c") and len(check_code) >= 8:
+                        checks.append((check_code, "cryptobot"))
+            elif "/start" in url.lower():
+                parts = url.lower().split("/start", 1)
+                if len(parts) > 1:
+                    check_code = parts[1].strip().split()[0].strip()
+                    if check_code.startswith("c") and len(check_code) >= 8:
+                        checks.append((check_code, "cryptobot"))
+            elif url.startswith("c") and len(url) >= 8:
+                check_code = url.strip()
+                if len(check_code) >= 8 and check_code.replace("_", "").replace("-", "").isalnum():
+                    checks.append((check_code, "cryptobot"))
+    for pattern in _COMPILED["xrocket"]:
+        for match in pattern.finditer(text_clean):
+            url = match.group(0)
+            if "start=" in url:
+                parts = url.split("start=", 1)
+                if len(parts) > 1:
+                    check_code = parts[1].split("&")[0].split()[0].split("\n")[0].strip()
+                    if len(check_code) >= 8:
+                        checks.append((check_code, "xrocket"))
+            elif "/start" in url.lower():
+                parts = url.lower().split("/start", 1)
+                if len(parts) > 1:
+                    check_code = parts[1].strip().split()[0].strip()
+                    if len(check_code) >= 8:
+                        checks.append((check_code, "xrocket"))
+    seen = set()
+    unique_checks = []
+    for check in checks:
+        if check not in seen:
+            seen.add(check)
+            unique_checks.append(check)
+    return unique_checks
+
+
+def _code(rng, prefix="", length=16):
+    alphabet = string.ascii_letters + string.digits + "_-"
+    body = "".join(rng.choice(alphabet) for _ in range(length))
+    return prefix + body.strip("_-").ljust(length, "a")
+
+
+def realistic_corpus(rng, size):
+    """Обычный поток чатов: в основном болтовня, изредка чеки"""
+    chatter = [
+        "Всем привет! Кто сегодня идет на встречу?",
+        "Курс биткоина опять растет, смотрите https://coinmarketcap.com/currencies/bitcoin/",
+        "Закрепил правила чата, прочитайте пожалуйста",
+        "ok",
+        "Ссылка на канал: https://t.me/some_channel/1234",
+        "Новый пост: https://t.me/news?start=welcome",
+        "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4,
+    ]
+    corpus = []
+    for _ in range(size):
+        roll = rng.random()
+        if roll < 0.90:
+            corpus.append(rng.choice(chatter))
+        elif roll < 0.94:
+            corpus.append(f"💰 Раздача! https://t.me/CryptoBot?start={_code(rng, 'c')}")
+        elif roll < 0.97:
+            corpus.append(f"Ловите чек t.me/xrocket_bot?start={_code(rng, 'mci_')}\nкто первый")
+        elif roll < 0.99:
+            corpus.append(f"/start {_code(rng, 'c')}")
+        else:
+            corpus.append(
+                f"Два чека: @CryptoBot?start={_code(rng, 'c')} и "
+                f"https://t.me/XRocket?start={_code(rng, 't_')}"
+            )
+    return corpus
+
+
+def adversarial_corpus(rng, size):
+    """Тексты, которые заставляют паттерны работать по максимуму"""
+    templates = [
+        lambda: "start= " * 200,
+        lambda: "/start " + "c" * 4000,
+        lambda: "t.me/CryptoBot?start=" * 150,
+        lambda: " ".join(_code(rng, "c", 30) for _ in range(120)) + " /start",
+        lambda: "t.me/Crypto" * 300 + " start=",
+        lambda: "/START " + "-_" * 2000,
+        lambda: "\\".join(_code(rng, "c") for _ in range(200)) + " start=",
+        lambda: "\n".join(f"https://t.me/CryptoBot?start={_code(rng, 'c')}" for _ in range(50)),
+    ]
+    return [rng.choice(templates)() for _ in range(size)]
+
+
+def _normalize(checks):
+    # Прежняя реализация приводит коды из /start к нижнему регистру
+    return {(code.lower(), bot_type) for code, bot_type in checks}
+
+
+def _bench(func, corpus, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in corpus:
+            func(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(name, corpus, repeat):
+    scanner = CheckScanner()
+    mismatches = sum(
+        1 for text in corpus
+        if _normalize(legacy_extract_checks(text)) != _normalize(scanner.scan(text))
+    )
+    legacy = _bench(legacy_extract_checks, corpus, repeat)
+    current = _bench(scanner.scan, corpus, repeat)
+    per_msg = 1e6 / len(corpus)
+    print(f"{name}: {len(corpus)} сообщений, расхождений (без учета регистра): {mismatches}")
+    print(f"  legacy : {legacy * per_msg:8.2f} мкс/сообщение")
+    print(f"  scanner: {current * per_msg:8.2f} мкс/сообщение  (x{legacy / current:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    run("realistic", realistic_corpus(rng, args.size), args.repeat)
+    run("adversarial", adversarial_corpus(rng, max(args.size // 20, 50)), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Память на одну активацию в полете: прежние аргументы _activate_check_task против CheckCandidate
+
+Задачи активации создаются так же, как в process_message (каждый код - всем аккаунтам),
+и останавливаются на отправке боту; tracemalloc считает память задач и их аргументов.
+
+Для сравнения - память pyrogram Message с чеком и записи CheckCandidate
+(задачам активации, логам и базе нужна только запись).
+
+Запуск: python benchmarks/bench_claim_memory.py [--codes N] [--accounts N] [--repeat N]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tracemalloc
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_processor import CheckProcessor, BOT_USERNAMES  # noqa: E402
+from database import db  # noqa: E402
+from intake import CheckCandidate  # noqa: E402
+from metrics import metrics, now, STAGE_TOTAL  # noqa: E402
+from replay import build_message  # noqa: E402
+
+
+async def legacy_activate_check_task(self, client, check_code: str, bot_type: str,
+                                     bot_username: str, account_info: str, source_chat: str,
+                                     received_at: Optional[float] = None):
+    """Прежняя реализация CheckProcessor._activate_check_task"""
+    success, result = await self.activate_check(
+        client, check_code, bot_type, bot_username, account_info, received_at
+    )
+    if received_at is not None and not (result and (result.get("cached") or result.get("expired"))):
+        metrics.observe_since(STAGE_TOTAL, received_at, bot_type)
+
+    if success:
+        amount = result.get("amount") if result else None
+        currency = result.get("currency", "UNKNOWN") if result else "UNKNOWN"
+        await db.add_check(
+            check_code=check_code,
+            bot_type=bot_type,
+            amount=amount,
+            currency=currency,
+            activated_by=account_info,
+            source_chat=source_chat
+        )
+        await db.update_stats(account_info, bot_type, amount or 0, currency)
+        print(f"✅ Чек активирован: {bot_type} - {check_code} - {amount} {currency} ({account_info})")
+        try:
+            from logger import logger
+            await logger.log_activated_check(
+                bot_type, check_code, amount or 0, currency, account_info, source_chat
+            )
+        except:  # noqa: E722
+            pass
+        if self.create_check_after_activation:
+            asyncio.create_task(
+                self._create_and_send_check_task(client, bot_type, bot_username, account_info)
+            )
+
+
+def make_codes(count: int, seed: int):
+    rng = random.Random(seed)
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+    return [
+        (
+            "c" + "".join(rng.choice(alphabet) for _ in range(14)),
+            rng.choice(["cryptobot", "xrocket"]),
+            -1001000000000 - rng.randrange(50),
+            rng.randrange(1, 10 ** 6),
+            f"Чат {rng.randrange(50)}",
+        )
+        for _ in range(count)
+    ]
+
+
+async def measure(shape: str, codes, accounts) -> float:
+    processor = CheckProcessor()
+    gate = asyncio.get_running_loop().create_future()
+
+    async def blocked_activate(client, check_code, bot_type, bot_username, account_info, received_at):
+        await gate
+        return False, {"error": "already_activated", "cached": True}
+
+    processor.activate_check = blocked_activate
+    client = object()
+    tasks = []
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for check_code, bot_type, chat_id, message_id, title in codes:
+        received_at = now()
+        # Строки кода и названия чата - из разобранного сообщения, в обоих вариантах одинаковые
+        check_code = "".join(check_code)
+        source_chat = "".join(title)
+        if shape == "legacy":
+            bot_username = BOT_USERNAMES[bot_type]
+            for account_info in accounts:
+                tasks.append(asyncio.create_task(legacy_activate_check_task(
+                    processor, client, check_code, bot_type, bot_username, account_info, source_chat, received_at
+                )))
+        else:
+            candidate = CheckCandidate(check_code, bot_type, chat_id, message_id, received_at, source_chat)
+            for account_info in accounts:
+                tasks.append(asyncio.create_task(
+                    processor._activate_check_task(client, candidate, account_info)
+                ))
+    await asyncio.sleep(0)  # задачи доходят до ожидания ответа бота
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    gate.set_result(None)
+    await asyncio.gather(*tasks)
+    return (current - baseline) / len(tasks)
+
+
+def record_sizes(codes) -> tuple:
+    """Память одного Message с чеком в кнопке и одной записи CheckCandidate"""
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    messages = [
+        build_message({
+            "chat_id": chat_id, "chat_title": title, "message_id": message_id, "caption": "Чек под постом",
+            "buttons": [{"text": "Забрать", "url": f"https://t.me/{BOT_USERNAMES[bot_type]}?start={code}"}],
+        })
+        for code, bot_type, chat_id, message_id, title in codes
+    ]
+    after_messages, _ = tracemalloc.get_traced_memory()
+    candidates = [
+        CheckCandidate("".join(code), bot_type, chat_id, message_id, now(), "".join(title))
+        for code, bot_type, chat_id, message_id, title in codes
+    ]
+    after_candidates, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del messages, candidates
+    return (after_messages - baseline) / len(codes), (after_candidates - after_messages) / len(codes)
+
+
+async def run(args):
+    codes = make_codes(args.codes, args.seed)
+    accounts = [f"+7900000{i:04d} ({1000 + i})" for i in range(args.accounts)]
+    claims = args.codes * args.accounts
+    print(f"Активаций в полете: {claims} ({args.codes} кодов x {args.accounts} аккаунтов)")
+
+    # Первый прогон прогревает кеши интерпретатора и в замер не входит
+    await measure("legacy", codes, accounts)
+    legacy, compact = [], []
+    for _ in range(args.repeat):
+        legacy.append(await measure("legacy", codes, accounts))
+        compact.append(await measure("candidate", codes, accounts))
+    legacy, compact = sorted(legacy)[len(legacy) // 2], sorted(compact)[len(compact) // 2]
+    print(f"  прежние аргументы: {legacy:.0f} байт на активацию")
+    print(f"  CheckCandidate:    {compact:.0f} байт на активацию (с записью, общей для аккаунтов)")
+    print(f"  разница: {legacy - compact:.0f} байт ({(1 - compact / legacy) * 100:.1f}%), "
+          f"{(legacy - compact) * claims / 2 ** 20:.2f} МБ на {claims} активаций")
+
+    message_size, candidate_size = record_sizes(codes)
+    print(f"Запись о чеке: pyrogram Message {message_size:.0f} байт, CheckCandidate {candidate_size:.0f} байт")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--codes", type=int, default=2000)
+    parser.add_argument("--accounts", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Бенчмарк пропускной способности записи: соединение на каждый вызов против очереди Database
+
+Запуск: python benchmarks/bench_database.py [--activations N]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+import aiosqlite
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+
+async def legacy_add_check(db_path, check_code, bot_type, amount, currency, activated_by, source_chat):
+    """Прежняя реализация Database.add_check"""
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("""
+            INSERT OR IGNORE INTO checks
+            (check_code, bot_type, amount, currency, activated_by, source_chat, message_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (check_code, bot_type, amount, currency, activated_by, source_chat, None))
+        await db.commit()
+
+
+async def legacy_update_stats(db_path, account_phone, bot_type, amount, currency):
+    """Прежняя реализация Database.update_stats"""
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("""
+            INSERT OR IGNORE INTO stats (account_phone, bot_type, checks_count, total_amount, currency)
+            VALUES (?, ?, 0, 0, ?)
+        """, (account_phone, bot_type, currency))
+        await db.execute("""
+            UPDATE stats SET
+                checks_count = checks_count + 1,
+                total_amount = total_amount + ?,
+                last_updated = CURRENT_TIMESTAMP
+            WHERE account_phone = ? AND bot_type = ?
+        """, (amount, account_phone, bot_type))
+        await db.commit()
+
+
+def make_activations(count, seed):
+    rng = random.Random(seed)
+    accounts = [f"+7900000{i:04d} ({1000 + i})" for i in range(20)]
+    return [
+        (
+            f"c{rng.getrandbits(64):016x}",
+            rng.choice(["cryptobot", "xrocket"]),
+            round(rng.uniform(0.1, 5.0), 2),
+            "USDT",
+            rng.choice(accounts),
+            f"chat_{rng.randrange(50)}",
+        )
+        for _ in range(count)
+    ]
+
+
+async def bench_legacy(db_path, activations, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def one(code, bot_type, amount, currency, account, chat):
+        nonlocal failures
+        async with semaphore:
+            # Как и в рабочем коде, ошибки записи (database is locked) теряют данные
+            try:
+                await legacy_add_check(db_path, code, bot_type, amount, currency, account, chat)
+                await legacy_update_stats(db_path, account, bot_type, amount, currency)
+            except Exception:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(*activation) for activation in activations))
+    return time.perf_counter() - started, failures
+
+
+async def bench_queued(db_path, activations):
+    database = Database(db_path)
+    await database.init()
+
+    async def one(code, bot_type, amount, currency, account, chat):
+        await database.add_check(code, bot_type, amount, currency, account, chat)
+        await database.update_stats(account, bot_type, amount, currency)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(*activation) for activation in activations))
+    await database.close()  # время включает полную запись очереди на диск
+    return time.perf_counter() - started
+
+
+async def count_rows(db_path):
+    async with aiosqlite.connect(db_path) as db:
+        async with db.execute("SELECT COUNT(*) FROM checks") as cursor:
+            checks = (await cursor.fetchone())[0]
+        async with db.execute("SELECT SUM(checks_count) FROM stats") as cursor:
+            stats = (await cursor.fetchone())[0]
+    return checks, stats
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activations", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    activations = make_activations(args.activations, args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        schema = Database(legacy_path)
+        await schema.init()
+        await schema.close()
+        legacy, failures = await bench_legacy(legacy_path, activations, args.concurrency)
+        legacy_rows = await count_rows(legacy_path)
+
+        queued_path = os.path.join(tmp, "queued.db")
+        queued = await bench_queued(queued_path, activations)
+        queued_rows = await count_rows(queued_path)
+
+    n = len(activations)
+    print(f"{n} активаций (checks, сумма stats.checks_count)")
+    print(f"  legacy : {legacy:7.2f} с, {n / legacy:9.0f} активаций/с, строки {legacy_rows}, "
+          f"ошибок записи {failures}")
+    print(f"  queued : {queued:7.2f} с, {n / queued:9.0f} активаций/с, строки {queued_rows}"
+          f"  (x{legacy / queued:.1f})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+"""
+Бенчмарк отсева дубликатов: прежний set с перестроением против RecentKeys
+
+Моделируется час потока в 1M сообщений (часы симулированные), каждое сообщение
+повторно приходит от другого аккаунта через несколько сотен сообщений.
+
+Запуск: python benchmarks/bench_dedup.py [--messages N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DEDUP_MAX_KEYS, DEDUP_WINDOW  # noqa: E402
+from dedup import RecentKeys  # noqa: E402
+
+
+class LegacyProcessed:
+    """Прежняя логика handle_message: set, перестраиваемый при 20000 записей"""
+
+    def __init__(self):
+        self.processed = set()
+
+    def add(self, key):
+        if key in self.processed:
+            return False
+        self.processed.add(key)
+        if len(self.processed) > 20000:
+            self.processed = set(list(self.processed)[-5000:])
+        return True
+
+    def __len__(self):
+        return len(self.processed)
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_stream(messages, seed, duplicate_lag):
+    """Поток ключей: каждое сообщение повторяется через duplicate_lag позиций"""
+    rng = random.Random(seed)
+    chats = [-1000000000000 - i for i in range(500)]
+    originals = [(rng.choice(chats), i, rng.getrandbits(60)) for i in range(messages)]
+    stream = []
+    for index, key in enumerate(originals):
+        stream.append((key, False))
+        if index >= duplicate_lag:
+            stream.append((originals[index - duplicate_lag], True))
+    return stream
+
+
+def run(name, structure, stream, clock, step):
+    missed = 0
+    worst = 0.0
+    started = time.perf_counter()
+    for key, is_duplicate in stream:
+        if clock is not None:
+            clock.now += step
+        op_started = time.perf_counter()
+        added = structure.add(key)
+        elapsed = time.perf_counter() - op_started
+        if elapsed > worst:
+            worst = elapsed
+        if is_duplicate and added:
+            missed += 1
+    total = time.perf_counter() - started
+    print(f"  {name:12s}: {total / len(stream) * 1e9:7.0f} нс/операция, "
+          f"худшая операция {worst * 1e3:7.3f} мс, пропущено повторов {missed}, "
+          f"ключей в памяти {len(structure)}")
+
+
+def measure_memory(factory, stream, clock, step):
+    tracemalloc.start()
+    structure = factory()
+    for key, _ in stream:
+        if clock is not None:
+            clock.now += step
+        structure.add(key)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--duplicate-lag", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    stream = make_stream(args.messages, args.seed, args.duplicate_lag)
+    step = 3600.0 / len(stream)  # весь поток укладывается в один час
+
+    print(f"{args.messages} сообщений за час, повтор каждого через {args.duplicate_lag} сообщений")
+    run("legacy set", LegacyProcessed(), stream, None, step)
+    clock = SimulatedClock()
+    run("RecentKeys", RecentKeys(DEDUP_WINDOW, DEDUP_MAX_KEYS, clock), stream, clock, step)
+
+    print("Пиковая память (tracemalloc, включая ключи):")
+    legacy_peak = measure_memory(LegacyProcessed, stream, None, step)
+    clock = SimulatedClock()
+    recent_peak = measure_memory(
+        lambda: RecentKeys(DEDUP_WINDOW, DEDUP_MAX_KEYS, clock), stream, clock, step
+    )
+    print(f"  legacy set  : {legacy_peak / 2 ** 20:7.1f} МБ")
+    print(f"  RecentKeys  : {recent_peak / 2 ** 20:7.1f} МБ "
+          f"(окно {DEDUP_WINDOW} с, максимум {DEDUP_MAX_KEYS} ключей)")
+
+
+if __name__ == "__main__":
+    main()
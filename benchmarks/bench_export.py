@@ -0,0 +1,84 @@
+"""
+Бенчмарк выгрузки чеков: fetchall со словарем на каждую строку против потоковой выгрузки export.py
+
+База заполняется --rows чеками (как в bench_reports), затем обе реализации пишут
+все чеки в CSV; tracemalloc считает пик памяти Python-объектов.
+
+Запуск: python benchmarks/bench_export.py [--rows N] [--format csv|jsonl]
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_reports import populate  # noqa: E402
+from database import db  # noqa: E402
+from export import export  # noqa: E402
+
+
+async def legacy_export(path: str, fmt: str) -> int:
+    """Прежний способ чтения (как get_stats): fetchall и словарь на каждую строку, затем запись"""
+    async with db._reader.execute("SELECT * FROM checks ORDER BY activated_at") as cursor:
+        rows = await cursor.fetchall()
+        columns = [desc[0] for desc in cursor.description]
+        records = [dict(zip(columns, row)) for row in rows]
+    with open(path, "w", encoding="utf-8", newline="") as stream:
+        if fmt == "csv":
+            writer = csv.DictWriter(stream, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(records)
+        else:
+            for record in records:
+                stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return len(records)
+
+
+async def streaming_export(path: str, fmt: str) -> int:
+    with open(path, "w", encoding="utf-8", newline="") as stream:
+        return await export("checks", stream, fmt)
+
+
+async def measure(name: str, func, path: str, fmt: str):
+    tracemalloc.start()
+    started = time.perf_counter()
+    written = await func(path, fmt)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = os.path.getsize(path) / 2 ** 20
+    print(f"{name:22s} {written:>10d} строк {elapsed:8.2f} с  пик памяти {peak / 2 ** 20:8.1f} МБ  файл {size:.1f} МБ")
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "export.db")
+        populate(db_path, args.rows, args.days, args.seed)
+        db.db_path = db_path
+        db.retention_days = 0
+        await db.init()
+        try:
+            await measure("fetchall + dict", legacy_export, os.path.join(tmp, "legacy.out"), args.format)
+            await measure("export.py (потоком)", streaming_export, os.path.join(tmp, "stream.out"), args.format)
+        finally:
+            await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Бенчмарк быстрого пути приема: разбор pyrogram Message для каждого обновления
+против RawIntakeGate (Message собирается только для обновлений с маркерами чеков)
+
+Меряется CPU на обновление и выделенная память (tracemalloc) на одном и том же
+потоке сырых обновлений UpdateNewChannelMessage.
+
+Запуск: python benchmarks/bench_raw_intake.py [--updates N] [--check-ratio 0.02]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyrogram import Client, raw  # noqa: E402
+from pyrogram.raw.core import TLObject  # noqa: E402
+
+from raw_intake import RawIntakeGate  # noqa: E402
+
+CHANNEL_ID = 1234567890
+SENDER_ID = 987654321
+
+
+def wire(obj):
+    """Прогнать объект через сериализацию, чтобы необязательные поля были как у реальных обновлений"""
+    return TLObject.read(BytesIO(obj.write()))
+
+
+def make_updates(count, check_ratio, seed):
+    rng = random.Random(seed)
+    chatter = [
+        "Всем привет, что нового?",
+        "Курс опять растет https://coinmarketcap.com/currencies/bitcoin/",
+        "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4,
+        "👍",
+    ]
+    updates = []
+    for index in range(count):
+        entities = []
+        markup = None
+        if rng.random() < check_ratio:
+            code = "c" + "".join(rng.choice("ABCDEFGHabcdefgh0123456789") for _ in range(14))
+            kind = rng.random()
+            if kind < 0.4:
+                text = f"Раздача! https://t.me/CryptoBot?start={code}"
+            elif kind < 0.7:
+                text = "Забрать чек"
+                entities = [raw.types.MessageEntityTextUrl(
+                    offset=0, length=7, url=f"https://t.me/CryptoBot?start={code}"
+                )]
+            else:
+                text = "Чек под постом"
+                markup = raw.types.ReplyInlineMarkup(rows=[raw.types.KeyboardButtonRow(buttons=[
+                    raw.types.KeyboardButtonUrl(text="🎁", url=f"https://t.me/xrocket_bot?start={code}")
+                ])])
+        else:
+            text = rng.choice(chatter)
+            if rng.random() < 0.2:
+                entities = [raw.types.MessageEntityBold(offset=0, length=3)]
+        message = raw.types.Message(
+            id=index + 1,
+            peer_id=raw.types.PeerChannel(channel_id=CHANNEL_ID),
+            from_id=raw.types.PeerUser(user_id=SENDER_ID),
+            date=1700000000 + index,
+            message=text,
+            entities=entities,
+            reply_markup=markup,
+        )
+        updates.append(wire(raw.types.UpdateNewChannelMessage(message=message, pts=index + 1, pts_count=1)))
+    users = {SENDER_ID: wire(raw.types.User(id=SENDER_ID, first_name="sender", access_hash=1))}
+    chats = {CHANNEL_ID: wire(raw.types.Channel(
+        id=CHANNEL_ID, title="Чат", photo=raw.types.ChatPhotoEmpty(), date=0,
+        access_hash=1, megagroup=True,
+    ))}
+    return updates, users, chats
+
+
+async def run_parser(parser, updates, users, chats):
+    parsed = 0
+    started = time.perf_counter()
+    for update in updates:
+        result, _ = await parser(update, users, chats)
+        if result is not None:
+            parsed += 1
+    return time.perf_counter() - started, parsed
+
+
+async def measure_allocations(parser, updates, users, chats):
+    tracemalloc.start()
+    kept = []  # держим результаты, как диспетчер держит их до обработчиков
+    for update in updates:
+        result, _ = await parser(update, users, chats)
+        kept.append(result)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--check-ratio", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    updates, users, chats = make_updates(args.updates, args.check_ratio, args.seed)
+
+    client = Client("bench_raw_intake", api_id=1, api_hash="0" * 32, in_memory=True)
+    update_type = raw.types.UpdateNewChannelMessage
+    full_parser = client.dispatcher.update_parsers[update_type]
+    gate = RawIntakeGate()
+    gate.install(client)
+    gated_parser = client.dispatcher.update_parsers[update_type]
+
+    full_time, full_parsed = await run_parser(full_parser, updates, users, chats)
+    gated_time, gated_parsed = await run_parser(gated_parser, updates, users, chats)
+    full_memory = await measure_allocations(full_parser, updates, users, chats)
+    gated_memory = await measure_allocations(gated_parser, updates, users, chats)
+
+    per_update = 1e6 / len(updates)
+    print(f"{len(updates)} обновлений, доля с чеками {args.check_ratio:.0%}")
+    print(f"  полный разбор : {full_time * per_update:7.2f} мкс/обновление, "
+          f"собрано Message {full_parsed}, память {full_memory / 2 ** 20:7.2f} МБ")
+    print(f"  RawIntakeGate : {gated_time * per_update:7.2f} мкс/обновление, "
+          f"собрано Message {gated_parsed}, память {gated_memory / 2 ** 20:7.2f} МБ "
+          f"(x{full_time / gated_time:.1f} по CPU)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
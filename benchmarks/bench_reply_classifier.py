@@ -0,0 +1,160 @@
+"""
+Микробенчмарк: табличный ReplyClassifier против прежней цепочки проверок
+(_classify_bot_reply + _extract_amount + _extract_currency) и извлечения ссылки на чек
+
+Корпус ответов ботов: benchmarks/fixtures/bot_replies.jsonl
+(bot, text, ожидаемые status, amount, currency; status null - не ответ на активацию)
+
+Запуск: python benchmarks/bench_reply_classifier.py [--repeat N]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reply_classifier import ReplyClassifier, extract_check_link  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "bot_replies.jsonl")
+
+_LEGACY_AMOUNT = re.compile(r"(\d+(?:\.\d+)?)\s*(?:usd|usdt|руб|rub)", re.IGNORECASE)
+_LEGACY_NUMBER = re.compile(r"\d+\.?\d*")
+
+
+def legacy_extract_amount(text):
+    match = _LEGACY_AMOUNT.search(text)
+    if match:
+        try:
+            return float(match.group(1))
+        except ValueError:
+            pass
+    numbers = _LEGACY_NUMBER.findall(text)
+    if numbers:
+        try:
+            return float(numbers[0])
+        except ValueError:
+            pass
+    return None
+
+
+def legacy_extract_currency(text):
+    if "$" in text or "usd" in text[:10].lower() or "usdt" in text[:10].lower():
+        return "USD"
+    elif "₽" in text or "руб" in text[:10].lower() or "rub" in text[:10].lower():
+        return "RUB"
+    elif "btc" in text[:10].lower():
+        return "BTC"
+    elif "eth" in text[:10].lower():
+        return "ETH"
+    return "UNKNOWN"
+
+
+def legacy_classify(text, bot_type=None):
+    """Прежняя реализация CheckProcessor._classify_bot_reply (по тексту)"""
+    if not text:
+        return None
+    text_lower = text.lower()
+    if "активирован" in text_lower or "activated" in text_lower or "получено" in text_lower:
+        return {"success": True, "amount": legacy_extract_amount(text),
+                "currency": legacy_extract_currency(text), "text": text}
+    elif "уже" in text_lower or "already" in text_lower:
+        return {"success": False, "error": "already_activated"}
+    elif ("не найден" in text_lower or "not found" in text_lower or "недействител" in text_lower
+          or "invalid" in text_lower or "истек" in text_lower or "expired" in text_lower):
+        return {"success": False, "error": "invalid_check"}
+    elif "капча" in text_lower or "captcha" in text_lower:
+        return {"success": False, "error": "captcha_required"}
+    return None
+
+
+def legacy_extract_check_link(text):
+    """Прежняя реализация _extract_check_link_from_text (регулярные выражения на каждом вызове)"""
+    if not text:
+        return None
+    patterns = [
+        r"t\.me/[^\s\)\]]+\?start=[^\s\)\]]+",
+        r"https?://t\.me/[^\s\)\]]+\?start=[^\s\)\]]+",
+        r"t\.me/[^\s\)\]]+",
+        r"https?://t\.me/[^\s\)\]]+",
+        r"https?://[^\s\)\]]+",
+    ]
+    for pattern in patterns:
+        matches = re.findall(pattern, text, re.IGNORECASE)
+        if matches:
+            link = matches[0].strip().rstrip('.,!?)')
+            if "start=" in link.lower() or "t.me" in link.lower():
+                return link
+    code_matches = re.findall(r"\bc[A-Za-z0-9_-]{10,}\b", text)
+    if code_matches:
+        return f"https://t.me/CryptoBot?start={code_matches[0]}"
+    return None
+
+
+def outcome(result):
+    if result is None:
+        return None, None, None
+    if result["success"]:
+        return "activated", result["amount"], result["currency"]
+    return result["error"], None, None
+
+
+def check_corpus(name, classify, corpus):
+    mismatches = 0
+    for row in corpus:
+        expected = (row["status"], row["amount"], row["currency"])
+        got = outcome(classify(row["text"], row["bot"]))
+        if got != expected:
+            mismatches += 1
+    print(f"  {name:16s}: расхождений с корпусом {mismatches} из {len(corpus)}")
+
+
+def timed(classify, corpus, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for row in corpus:
+            classify(row["text"], row["bot"])
+    return (time.perf_counter() - started) / (repeat * len(corpus))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(FIXTURES, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    classifier = ReplyClassifier()
+    print(f"Корпус: {len(corpus)} ответов")
+    check_corpus("прежний", legacy_classify, corpus)
+    check_corpus("ReplyClassifier", classifier.classify, corpus)
+
+    legacy_time = timed(legacy_classify, corpus, args.repeat)
+    new_time = timed(classifier.classify, corpus, args.repeat)
+    print(f"Разбор ответа: прежний {legacy_time * 1e6:.2f} мкс, "
+          f"ReplyClassifier {new_time * 1e6:.2f} мкс (x{legacy_time / new_time:.2f})")
+
+    link_replies = [
+        "Чек создан: https://t.me/CryptoBot?start=CQabcdEFGH1234 . Отправьте ссылку получателю.",
+        "Ваш чек готов!\n\nt.me/xrocket_bot?start=mc_AbCdEf123456",
+        "Код чека: cQwErTy1234567",
+    ] * 10
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for text in link_replies:
+            legacy_extract_check_link(text)
+    legacy_link = (time.perf_counter() - started) / (args.repeat * len(link_replies))
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for text in link_replies:
+            extract_check_link(text)
+    new_link = (time.perf_counter() - started) / (args.repeat * len(link_replies))
+    print(f"Ссылка на чек: прежняя {legacy_link * 1e6:.2f} мкс, "
+          f"предкомпилированная {new_link * 1e6:.2f} мкс (x{legacy_link / new_link:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Бенчмарк отчетов по истории: запросы к таблице checks целиком против сводок и индексов Database
+
+База заполняется --rows чеками за --days дней (по умолчанию 10 млн за 180 дней),
+затем Database.init() строит индексы и сводки по часам и дням.
+Отчеты: заработок по часам за сутки, доход аккаунтов за 7 дней, топ чатов-источников.
+
+Запуск: python benchmarks/bench_reports.py [--rows N] [--days N] [--db path]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+# Прежняя схема: только уникальный check_code и индекс по нему
+_LEGACY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS checks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        check_code TEXT UNIQUE NOT NULL,
+        bot_type TEXT NOT NULL,
+        amount REAL,
+        currency TEXT,
+        activated_by TEXT,
+        source_chat TEXT,
+        message_id INTEGER,
+        activated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        status TEXT DEFAULT 'activated'
+    );
+    CREATE INDEX IF NOT EXISTS idx_check_code ON checks(check_code);
+"""
+
+# Те же отчеты запросами к checks без новых индексов
+_LEGACY_QUERIES = {
+    "по часам за сутки": ("""
+        SELECT strftime('%Y-%m-%d %H:00:00', activated_at) AS bucket, bot_type, currency,
+               COUNT(*), SUM(amount)
+        FROM checks NOT INDEXED WHERE activated_at >= ?
+        GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+    """, lambda now: ((now - timedelta(hours=24)).strftime("%Y-%m-%d %H:00:00"),)),
+    "аккаунты за 7 дней": ("""
+        SELECT activated_by, bot_type, currency, COUNT(*), SUM(amount) AS total
+        FROM checks NOT INDEXED WHERE activated_at >= ?
+        GROUP BY 1, 2, 3 ORDER BY total DESC
+    """, lambda now: ((now - timedelta(days=7)).strftime("%Y-%m-%d"),)),
+    "топ чатов за 7 дней": ("""
+        SELECT source_chat, COUNT(*) AS checks_count, SUM(amount)
+        FROM checks NOT INDEXED WHERE activated_at >= ?
+        GROUP BY source_chat ORDER BY checks_count DESC LIMIT 10
+    """, lambda now: ((now - timedelta(days=7)).strftime("%Y-%m-%d %H:%M:%S"),)),
+    "топ чатов за все время": ("""
+        SELECT source_chat, COUNT(*) AS checks_count, SUM(amount)
+        FROM checks NOT INDEXED GROUP BY source_chat ORDER BY checks_count DESC LIMIT 10
+    """, lambda now: ()),
+}
+
+
+def populate(db_path: str, rows: int, days: int, seed: int):
+    """Заполнить таблицу checks синтетической историей (равномерно по времени)"""
+    rng = random.Random(seed)
+    accounts = [f"+7900000{i:04d} ({1000 + i})" for i in range(20)]
+    chats = [f"Чат {i}" for i in range(500)]
+    bots = [("cryptobot", "USDT"), ("cryptobot", "TON"), ("xrocket", "TON"), ("xrocket", "USDT")]
+    end = datetime.utcnow()
+    step = days * 86400 / rows
+
+    connection = sqlite3.connect(db_path)
+    connection.executescript(_LEGACY_SCHEMA)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=OFF")
+
+    def generate(start, stop):
+        for index in range(start, stop):
+            bot_type, currency = rng.choice(bots)
+            activated_at = end - timedelta(seconds=(rows - index) * step)
+            yield (
+                f"c{index:014x}", bot_type, round(rng.uniform(0.01, 5.0), 2), currency,
+                rng.choice(accounts), rng.choice(chats), index, activated_at.strftime("%Y-%m-%d %H:%M:%S"),
+            )
+
+    chunk = 500_000
+    for start in range(0, rows, chunk):
+        connection.executemany("""
+            INSERT INTO checks
+            (check_code, bot_type, amount, currency, activated_by, source_chat, message_id, activated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, generate(start, min(start + chunk, rows)))
+        connection.commit()
+    connection.close()
+
+
+def run_legacy(db_path: str, repeat: int):
+    connection = sqlite3.connect(db_path)
+    now = datetime.utcnow()
+    results = {}
+    for name, (query, params) in _LEGACY_QUERIES.items():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            connection.execute(query, params(now)).fetchall()
+        results[name] = (time.perf_counter() - started) / repeat
+    connection.close()
+    return results
+
+
+async def run_database(database: Database, repeat: int):
+    reports = {
+        "по часам за сутки": lambda: database.get_hourly_earnings(24),
+        "аккаунты за 7 дней": lambda: database.get_account_yield(7),
+        "топ чатов за 7 дней": lambda: database.get_top_source_chats(7),
+        "топ чатов за все время": lambda: database.get_top_source_chats(None),
+    }
+    results = {}
+    for name, report in reports.items():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            await report()
+        results[name] = (time.perf_counter() - started) / repeat
+    return results
+
+
+async def bench_inserts(database: Database, count: int) -> float:
+    """Запись count новых чеков через очередь (с обновлением индексов и сводок)"""
+    started = time.perf_counter()
+    for index in range(count):
+        await database.add_check(f"new{index:012x}", "cryptobot", 1.0, "USDT", "+79000000000 (1000)", "Чат 1")
+    await database.close()
+    return time.perf_counter() - started
+
+
+async def run(args):
+    tmp = None
+    db_path = args.db
+    if not db_path:
+        tmp = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmp.name, "reports.db")
+
+    if not os.path.exists(db_path):
+        started = time.perf_counter()
+        populate(db_path, args.rows, args.days, args.seed)
+        print(f"Заполнение {args.rows} чеков: {time.perf_counter() - started:.1f} с")
+
+    legacy = run_legacy(db_path, args.repeat)
+
+    database = Database(db_path)
+    # Без переноса в архив: отчеты сравниваются на одних и тех же данных, база --db не меняется
+    database.retention_days = 0
+    started = time.perf_counter()
+    await database.init()
+    print(f"Database.init (индексы и сводки при первом запуске): {time.perf_counter() - started:.1f} с")
+    current = await run_database(database, args.repeat)
+
+    print(f"{'отчет':26s} {'checks целиком':>16s} {'сводки/индексы':>16s}")
+    for name in legacy:
+        speedup = legacy[name] / current[name] if current[name] else float("inf")
+        print(f"{name:26s} {legacy[name] * 1000:13.1f} мс {current[name] * 1000:13.2f} мс  x{speedup:.0f}")
+
+    elapsed = await bench_inserts(database, args.inserts)
+    print(f"Запись {args.inserts} новых чеков (индексы + сводки): {elapsed:.2f} с")
+
+    if tmp:
+        tmp.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--inserts", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="Готовая база (если файла нет - будет заполнена)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
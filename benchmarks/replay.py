@@ -0,0 +1,365 @@
+"""
+Офлайн-прогон конвейера обработки сообщений без Telegram
+
+Сообщения (синтетические или записанные в JSONL) подаются в
+CheckGrabberBot.handle_message от имени нескольких фейковых клиентов.
+Фейковый клиент записывает вызовы send_message и по сценарию отвечает
+от имени бота через зарегистрированные обработчики (reply_waiter).
+
+Отчет: сообщений в секунду, p50/p99 времени до первой отправки /start,
+пиковое число задач asyncio и пиковая память (tracemalloc).
+При одинаковых --seed и параметрах нагрузка полностью повторяется.
+
+Запуск:
+    python benchmarks/replay.py --messages 5000 --accounts 5
+    python benchmarks/replay.py --input recorded.jsonl --json result.json
+
+Формат JSONL (одно сообщение в строке):
+    {"chat_id": -100123, "chat_title": "...", "message_id": 1, "text": "...",
+     "caption": null, "buttons": [{"text": "...", "url": "..."}]}
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyrogram import enums  # noqa: E402
+from pyrogram.types import (  # noqa: E402
+    Chat, InlineKeyboardButton, InlineKeyboardMarkup, Message, User
+)
+
+from account_manager import account_manager  # noqa: E402
+from check_processor import check_processor  # noqa: E402
+from chat_index import chat_index  # noqa: E402
+from intake_queue import intake_queue  # noqa: E402
+from config import (  # noqa: E402
+    CRYPTOBOT_USERNAME, XROCKET_USERNAME, INTAKE_QUEUE_SIZE, INTAKE_WORKERS, MAX_PENDING_CLAIMS
+)
+from database import db  # noqa: E402
+from intake import button_urls  # noqa: E402
+from reply_waiter import reply_waiter  # noqa: E402
+from rate_limiter import rate_limiter  # noqa: E402
+import main as main_module  # noqa: E402
+
+BOT_IDS = {CRYPTOBOT_USERNAME.lower(): 1559501630, XROCKET_USERNAME.lower(): 5014831088}
+
+
+def build_message(record: Dict) -> Message:
+    """Собрать pyrogram Message из записи JSONL"""
+    buttons = record.get("buttons") or []
+    markup = None
+    if buttons:
+        markup = InlineKeyboardMarkup([[
+            InlineKeyboardButton(button.get("text") or "🎁", url=button.get("url"))
+            for button in buttons
+        ]])
+    chat_id = record["chat_id"]
+    return Message(
+        id=record["message_id"],
+        chat=Chat(id=chat_id, type=enums.ChatType.SUPERGROUP, title=record.get("chat_title")),
+        from_user=User(id=record.get("sender_id", 777000), is_bot=False, first_name="sender"),
+        text=record.get("text"),
+        caption=record.get("caption"),
+        reply_markup=markup,
+        outgoing=False,
+    )
+
+
+def _code(rng: random.Random, prefix: str) -> str:
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+    return prefix + "".join(rng.choice(alphabet) for _ in range(14))
+
+
+def synthetic_records(count: int, rng: random.Random, check_ratio: float, cold_chats: int = 0) -> List[Dict]:
+    """
+    Синтетический поток: болтовня, посты с чеками в тексте, подписях и кнопках
+    cold_chats - дополнительные чаты только с болтовней (столько же сообщений, сколько в остальных)
+    """
+    chatter = [
+        "Всем привет, что нового?",
+        "Сегодня в 19:00 созвон, ссылка https://t.me/some_channel/99",
+        "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 3,
+        "👍",
+    ]
+    chats = [(-1001000000000 - i, f"Чат {i}") for i in range(40 + cold_chats)]
+    next_ids = {chat_id: 1 for chat_id, _ in chats}
+    records = []
+    for _ in range(count):
+        index = rng.randrange(len(chats))
+        chat_id, title = chats[index]
+        record = {"chat_id": chat_id, "chat_title": title, "message_id": next_ids[chat_id]}
+        next_ids[chat_id] += 1
+        if index < 40 and rng.random() < check_ratio:
+            kind = rng.random()
+            if kind < 0.4:
+                record["text"] = f"Раздача! https://t.me/CryptoBot?start={_code(rng, 'c')}"
+            elif kind < 0.7:
+                record["caption"] = "Чек под постом"
+                record["buttons"] = [{"text": "Забрать", "url": f"https://t.me/xrocket_bot?start=mci_{_code(rng, '')}"}]
+            else:
+                record["text"] = f"/start c{_code(rng, '')}"
+        else:
+            record["text"] = rng.choice(chatter)
+        records.append(record)
+    return records
+
+
+def expected_codes(message: Message) -> List[str]:
+    """Коды чеков в сообщении (для замера времени до первой отправки)"""
+    parts = list(button_urls(message)) + [message.text or "", message.caption or ""]
+    return [code for code, _ in check_processor.extract_checks(" ".join(parts))]
+
+
+def load_records(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayClient:
+    """Фейковый клиент: записывает отправки и отвечает по сценарию от имени бота"""
+
+    def __init__(self, name: str, stats: "ReplayStats", script: "BotScript"):
+        self.name = name
+        self.stats = stats
+        self.script = script
+        self.handlers = []
+        self.sent: List[tuple] = []
+        self.last_reply: Dict[str, Message] = {}
+        self._next_reply_id = 1
+
+    def add_handler(self, handler, group: int = 0):
+        self.handlers.append((group, handler))
+        self.handlers.sort(key=lambda item: item[0])
+
+    async def send_message(self, chat_id, text: str, **kwargs):
+        sent_at = time.perf_counter()
+        self.sent.append((chat_id, text, sent_at))
+        self.stats.on_send(text, sent_at)
+        reply = self.script.reply_for(self.name, str(chat_id), text)
+        if reply is not None:
+            delay, reply_text = reply
+            asyncio.get_running_loop().call_later(
+                delay, lambda: asyncio.ensure_future(self._deliver(str(chat_id), reply_text))
+            )
+
+    async def get_chat_history(self, chat_id, limit: int = 1):
+        message = self.last_reply.get(str(chat_id).lower())
+        if message is not None:
+            yield message
+
+    async def _deliver(self, bot_username: str, text: str):
+        username = bot_username.lower()
+        message = Message(
+            id=self._next_reply_id,
+            chat=Chat(id=BOT_IDS.get(username, 1), type=enums.ChatType.PRIVATE, username=bot_username),
+            from_user=User(id=BOT_IDS.get(username, 1), is_bot=True, first_name=bot_username),
+            text=text,
+            outgoing=False,
+        )
+        self._next_reply_id += 1
+        self.last_reply[username] = message
+        for _, handler in self.handlers:
+            if await handler.check(self, message):
+                await handler.callback(self, message)
+
+
+class BotScript:
+    """Сценарий ответов бота: первый аккаунт получает чек, остальные - 'уже активирован'"""
+
+    def __init__(self, rng: random.Random, reply_delay: float, no_reply_ratio: float):
+        self.rng = rng
+        self.reply_delay = reply_delay
+        self.no_reply_ratio = no_reply_ratio
+        self.claimed = set()
+
+    def reply_for(self, account: str, bot_username: str, text: str) -> Optional[tuple]:
+        if not text.startswith("/start "):
+            return None
+        code = text[7:]
+        if self.rng.random() < self.no_reply_ratio:
+            return None
+        delay = self.rng.lognormvariate(0, 0.5) * self.reply_delay
+        if code in self.claimed:
+            return delay, "Этот чек уже активирован."
+        self.claimed.add(code)
+        return delay, f"✅ Вы получили {self.rng.choice(['0.5', '1', '2.25'])} USDT. Чек активирован!"
+
+
+class ReplayStats:
+    def __init__(self):
+        self.injected_at: Dict[str, float] = {}
+        self.first_send: Dict[str, float] = {}
+        self.sends = 0
+        self.peak_tasks = 0
+
+    def on_send(self, text: str, sent_at: float):
+        self.sends += 1
+        if text.startswith("/start "):
+            self.first_send.setdefault(text[7:], sent_at)
+        self.sample_tasks()
+
+    def sample_tasks(self):
+        tasks = len(asyncio.all_tasks())
+        if tasks > self.peak_tasks:
+            self.peak_tasks = tasks
+
+    def latencies(self) -> List[float]:
+        return sorted(
+            self.first_send[code] - injected
+            for code, injected in self.injected_at.items() if code in self.first_send
+        )
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    index = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[index]
+
+
+def apply_overrides(args):
+    """Параметры прогона, отличающиеся от боевых (лимиты скорости, создание чеков, индекс чатов)"""
+    rate_limiter.configure(limit=args.rate_limit, human_delays=args.human_delays)
+    check_processor.create_check_after_activation = args.create_checks
+    check_processor.max_pending_claims = args.max_pending_claims
+    if args.chat_cold_after is not None:
+        chat_index.cold_after = args.chat_cold_after
+
+
+async def replay(args) -> Dict:
+    rng = random.Random(args.seed)
+    random.seed(args.seed)  # случайные задержки внутри check_processor
+    apply_overrides(args)
+
+    if args.input:
+        records = load_records(args.input)
+    else:
+        records = synthetic_records(args.messages, rng, args.check_ratio, args.cold_chats)
+    messages = [build_message(record) for record in records]
+    expected = [expected_codes(message) for message in messages]
+
+    stats = ReplayStats()
+    script = BotScript(random.Random(args.seed + 1), args.reply_delay, args.no_reply_ratio)
+    clients = [ReplayClient(f"+7000000{i:04d}", stats, script) for i in range(args.accounts)]
+    for index, client in enumerate(clients):
+        account_manager.clients[client.name] = client
+        account_manager.account_info[client.name] = f"{client.name} ({index})"
+        reply_waiter.attach(client)
+
+    bot = main_module.CheckGrabberBot()
+    tmp = tempfile.TemporaryDirectory()
+    db.db_path = os.path.join(tmp.name, "replay.db")
+    await db.init()
+    # --intake-workers 0: задача на каждое сообщение, как без очереди приема
+    intake_queue.maxsize = args.intake_queue_size
+    intake_queue.workers = args.intake_workers
+    if args.intake_workers:
+        intake_queue.start()
+
+    tracemalloc.start()
+    sampler_running = True
+
+    async def sampler():
+        while sampler_running:
+            stats.sample_tasks()
+            await asyncio.sleep(0.001)
+
+    sampler_task = asyncio.create_task(sampler())
+    interval = 1.0 / args.rate if args.rate else 0.0
+    started = time.perf_counter()
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output if not args.verbose else sys.stdout):
+        for message, codes in zip(messages, expected):
+            injected = time.perf_counter()
+            for code in codes:
+                stats.injected_at.setdefault(code, injected)
+            # Одно и то же сообщение приходит каждому аккаунту (через фильтр индекса чатов)
+            for client in clients:
+                if await chat_index.filter(client, message):
+                    await bot.handle_message(client, message)
+            if interval:
+                await asyncio.sleep(interval)
+            else:
+                await asyncio.sleep(0)
+        fed = time.perf_counter() - started
+
+        await intake_queue.close()
+        while check_processor.active_tasks or check_processor.create_tasks:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+
+        sampler_running = False
+        await sampler_task
+        await db.close()
+
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tmp.cleanup()
+
+    latencies = stats.latencies()
+    return {
+        "seed": args.seed,
+        "messages": len(messages),
+        "accounts": args.accounts,
+        "checks": len(stats.injected_at),
+        "sends": stats.sends,
+        "intake_messages_per_sec": len(messages) / fed if fed else float("inf"),
+        "end_to_end_seconds": elapsed,
+        "first_send_p50_ms": percentile(latencies, 0.50) * 1000,
+        "first_send_p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_tasks": stats.peak_tasks,
+        "peak_memory_mb": peak_memory / 2 ** 20,
+        "intake_peak_depth": intake_queue.peak_depth,
+        "intake_dropped": intake_queue.dropped,
+        "intake_expired": intake_queue.expired,
+        "intake_filtered": intake_queue.filtered,
+        "claims_waited": check_processor.claims_waited,
+        "creates_skipped": check_processor.creates_skipped,
+        "chats_cold": chat_index.cold_chats(),
+        "chat_messages_skipped": chat_index.skipped,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="JSONL с записанными сообщениями (по умолчанию - синтетика)")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--accounts", type=int, default=5)
+    parser.add_argument("--check-ratio", type=float, default=0.05, help="Доля сообщений с чеками")
+    parser.add_argument("--cold-chats", type=int, default=0, help="Дополнительные чаты без чеков")
+    parser.add_argument("--chat-cold-after", type=int, help="CHAT_COLD_AFTER (по умолчанию из config.py)")
+    parser.add_argument("--intake-workers", type=int, default=INTAKE_WORKERS, help="INTAKE_WORKERS (0 - без очереди)")
+    parser.add_argument("--intake-queue-size", type=int, default=INTAKE_QUEUE_SIZE, help="INTAKE_QUEUE_SIZE")
+    parser.add_argument("--max-pending-claims", type=int, default=MAX_PENDING_CLAIMS, help="MAX_PENDING_CLAIMS")
+    parser.add_argument("--rate", type=float, default=0, help="Сообщений в секунду (0 - без пауз)")
+    parser.add_argument("--reply-delay", type=float, default=0.05, help="Медианная задержка ответа бота, с")
+    parser.add_argument("--no-reply-ratio", type=float, default=0.0, help="Доля команд без ответа бота")
+    parser.add_argument("--rate-limit", type=int, default=0, help="RATE_LIMIT_PER_ACCOUNT (0 - выключен)")
+    parser.add_argument("--human-delays", action="store_true", help="Включить USE_HUMAN_LIKE_DELAYS")
+    parser.add_argument("--create-checks", action="store_true", help="Включить CREATE_CHECK_AFTER_ACTIVATION")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="Сохранить результат в JSON")
+    parser.add_argument("--verbose", action="store_true", help="Не скрывать вывод бота")
+    args = parser.parse_args()
+
+    result = asyncio.run(replay(args))
+    for key, value in result.items():
+        print(f"{key:26s} {value:.3f}" if isinstance(value, float) else f"{key:26s} {value}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
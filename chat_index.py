@@ -0,0 +1,133 @@
+"""
+Индекс доходности чатов: чаты, в которых не бывает чеков, отсекаются фильтром pyrogram
+"""
+import time
+from typing import Callable, Dict, Iterable, Optional, Set
+from pyrogram import filters
+from config import (
+    CHAT_INDEX_ENABLED, CHAT_COLD_AFTER, CHAT_REPROBE_INTERVAL, CHAT_ALLOW_LIST, CHAT_DENY_LIST
+)
+
+
+class _ChatStats:
+    __slots__ = ("messages", "candidates", "claims", "probe_messages", "cold_since")
+
+    def __init__(self):
+        self.messages = 0  # Уникальных сообщений за все время
+        self.candidates = 0  # Найдено кодов чеков
+        self.claims = 0  # Чеков отдано аккаунтам на активацию
+        self.probe_messages = 0  # Сообщений с начала текущей проверки
+        self.cold_since: Optional[float] = None  # Когда чат признан холодным
+
+
+async def _chat_filter(flt, client, message) -> bool:
+    # Корутина: pyrogram вызывает ее в цикле событий, а не в пуле потоков
+    chat = message.chat
+    return chat is None or flt.index.admits(chat.id)
+
+
+class ChatYieldIndex:
+    """
+    Статистика чатов и решение, пропускать ли их сообщения в обработку.
+
+    Для каждого чата считаются уникальные сообщения, найденные коды чеков
+    и отданные на активацию чеки. Чат, в котором за cold_after сообщений подряд
+    не нашлось ни одного кода (и никогда раньше не было чеков), становится
+    холодным: фильтр обработчиков pyrogram отсекает его сообщения до
+    handle_message - без отсева дубликатов и без задачи process_message.
+    Раз в reprobe_interval секунд холодный чат снова пропускается, и проверка
+    начинается заново (в чате могли начать раздавать чеки).
+    Ручные списки: allow - чат пропускается всегда, deny - никогда.
+    """
+
+    def __init__(self, cold_after: int = CHAT_COLD_AFTER, reprobe_interval: float = CHAT_REPROBE_INTERVAL,
+                 allow: Iterable[int] = CHAT_ALLOW_LIST, deny: Iterable[int] = CHAT_DENY_LIST,
+                 enabled: bool = CHAT_INDEX_ENABLED, clock: Callable[[], float] = time.monotonic):
+        self.cold_after = cold_after
+        self.reprobe_interval = reprobe_interval
+        self.enabled = enabled
+        self._clock = clock
+        self.allowed: Set[int] = set(allow)
+        self.denied: Set[int] = set(deny)
+        self._chats: Dict[int, _ChatStats] = {}
+        self.skipped = 0  # Сообщений отсечено фильтром
+        self.filter = filters.create(_chat_filter, "ChatYieldFilter", index=self)
+
+    def _stats(self, chat_id: int) -> _ChatStats:
+        stats = self._chats.get(chat_id)
+        if stats is None:
+            stats = self._chats[chat_id] = _ChatStats()
+        return stats
+
+    def admits(self, chat_id: int) -> bool:
+        """Пропускать ли сообщение чата в обработку"""
+        if chat_id in self.denied:
+            self.skipped += 1
+            return False
+        if not self.enabled or chat_id in self.allowed:
+            return True
+
+        stats = self._chats.get(chat_id)
+        if stats is None or stats.cold_since is None:
+            return True
+        if self._clock() - stats.cold_since >= self.reprobe_interval:
+            # Повторная проверка: чат снова получает cold_after сообщений
+            stats.cold_since = None
+            stats.probe_messages = 0
+            return True
+        self.skipped += 1
+        return False
+
+    def record_message(self, chat_id: int):
+        """Учесть уникальное сообщение чата"""
+        stats = self._stats(chat_id)
+        stats.messages += 1
+        stats.probe_messages += 1
+        if (stats.candidates == 0 and stats.probe_messages >= self.cold_after
+                and stats.cold_since is None and self.cold_after > 0):
+            stats.cold_since = self._clock()
+
+    def record_candidates(self, chat_id: int, count: int):
+        """Учесть найденные в сообщении коды чеков"""
+        stats = self._stats(chat_id)
+        stats.candidates += count
+        stats.cold_since = None
+
+    def record_claim(self, chat_id: int):
+        """Учесть чек, отданный аккаунтам на активацию"""
+        self._stats(chat_id).claims += 1
+
+    def allow(self, chat_id: int):
+        """Всегда пропускать чат"""
+        self.denied.discard(chat_id)
+        self.allowed.add(chat_id)
+
+    def deny(self, chat_id: int):
+        """Никогда не пропускать чат"""
+        self.allowed.discard(chat_id)
+        self.denied.add(chat_id)
+
+    def clear_override(self, chat_id: int):
+        """Убрать ручное решение: чат снова оценивается по статистике"""
+        self.allowed.discard(chat_id)
+        self.denied.discard(chat_id)
+
+    def cold_chats(self) -> int:
+        """Число холодных чатов"""
+        return sum(1 for stats in self._chats.values() if stats.cold_since is not None)
+
+    def tracked_chats(self) -> int:
+        """Число чатов со статистикой"""
+        return len(self._chats)
+
+    def top(self, limit: int = 5) -> Dict[int, dict]:
+        """Чаты с наибольшим числом отданных на активацию чеков"""
+        ranked = sorted(self._chats.items(), key=lambda item: (-item[1].claims, -item[1].candidates))
+        return {
+            chat_id: {"messages": stats.messages, "candidates": stats.candidates, "claims": stats.claims}
+            for chat_id, stats in ranked[:limit] if stats.candidates
+        }
+
+
+# Глобальный индекс чатов
+chat_index = ChatYieldIndex()
@@ -1,205 +1,204 @@
 """
 Модуль для обработки и активации чеков
 """
-import re
 import asyncio
-import random
-import time
-from collections import defaultdict
-from typing import List, Optional, Tuple
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
 from pyrogram import Client
 from pyrogram.types import Message
 from pyrogram.errors import FloodWait
 from config import (
-    CHECK_PATTERNS, CHECK_TIMEOUT, MAX_CONCURRENT_CHECKS,
+    CHECK_PATTERNS, CREATE_CHECK_TIMEOUT,
     CREATE_CHECK_AFTER_ACTIVATION, CHECK_DISTRIBUTION_CHAT_ID, CHECK_DISTRIBUTION_CHAT_USERNAME,
-    CHECK_AMOUNT, CHECK_CURRENCY, CHECK_ACTIVATION_DELAY, MAX_HISTORY_CHECK, USE_OPTIMISTIC_ACTIVATION,
-    CHECK_ACTIVATION_RETRY_DELAY, MAX_RETRY_ATTEMPTS, MIN_DELAY_BETWEEN_BOT_MESSAGES,
-    MAX_DELAY_BETWEEN_BOT_MESSAGES, RATE_LIMIT_PER_ACCOUNT, USE_HUMAN_LIKE_DELAYS
+    CHECK_AMOUNT, CHECK_CURRENCY, MAX_HISTORY_CHECK, USE_OPTIMISTIC_ACTIVATION,
+    USE_REPLY_WAITER,
+    DEDUP_WINDOW, DEDUP_MAX_KEYS, CHECK_OUTCOME_TTL, CLAIM_MAX_AGE,
+    MAX_PENDING_CLAIMS, MAX_PENDING_CREATES
 )
 from database import db
+from account_manager import account_manager
+from intake import CheckCandidate, button_urls, entity_urls
+from dedup import RecentKeys
+from outcome_cache import CheckOutcomeCache, DEAD_OUTCOMES, OUTCOME_ACTIVATED, OUTCOME_ALREADY_CLAIMED
+from check_scanner import CheckScanner
+from reply_waiter import reply_waiter
+from reply_classifier import reply_classifier, extract_check_link
+from scheduler import scheduler, PRIORITY_CLAIM, PRIORITY_BACKGROUND
+from rate_limiter import rate_limiter
+from latency import latency_model
+from chat_index import chat_index
+from metrics import (
+    metrics, now, STAGE_DISPATCH, STAGE_EXTRACT, STAGE_RATE_LIMIT,
+    STAGE_SEND, STAGE_REPLY, STAGE_TOTAL
+)
+
+
+# Бот, которому отправляется чек, по типу
+BOT_USERNAMES = {
+    "cryptobot": "CryptoBot",
+    "xrocket": "xrocket_bot",
+}
+
+# Варианты команды создания чека для каждого бота (по порядку перебора)
+CREATE_CHECK_COMMANDS = {
+    "cryptobot": ["/createCheck", "/createcheck", "/create", "/check", "/newcheck"],
+    "xrocket": ["/createcheck", "/create", "/check", "/newcheck", "/create_check"],
+}
 
 
 class CheckProcessor:
     def __init__(self):
         self.active_tasks = set()
-        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_CHECKS)
-        # Компилируем регулярные выражения заранее для ускорения
-        self.compiled_patterns = {
-            "cryptobot": [re.compile(p, re.IGNORECASE) for p in CHECK_PATTERNS["cryptobot"]],
-            "xrocket": [re.compile(p, re.IGNORECASE) for p in CHECK_PATTERNS["xrocket"]]
-        }
-        # Компилируем паттерны для извлечения суммы
-        self.amount_patterns = [
-            re.compile(r"(\d+(?:\.\d+)?)\s*(?:usd|usdt|руб|rub)", re.IGNORECASE),
-            re.compile(r"(?:получено|received|получили|got)\s*(\d+(?:\.\d+)?)", re.IGNORECASE),
-            re.compile(r"(\d+(?:\.\d+)?)\s*(?:\$|₽)", re.IGNORECASE),
-        ]
-        self.number_pattern = re.compile(r"\d+\.?\d*")
+        # Задач активации не больше max_pending_claims: process_message ждет места,
+        # и давление доходит до очереди приема, а не до числа задач
+        self.max_pending_claims = MAX_PENDING_CLAIMS
+        self._claim_waiters: Deque[asyncio.Future] = deque()
+        self.claims_waited = 0  # Сколько раз задача активации ждала места
+        # Создание и отправка чеков - фоновая работа: сверх лимита пропускается
+        self.create_tasks = set()
+        self.max_pending_creates = MAX_PENDING_CREATES
+        self.creates_skipped = 0
+        # Слоты MAX_CONCURRENT_CHECKS выдает планировщик: активации чеков раньше фоновых задач
+        self.scheduler = scheduler
+        # Настройки, которые можно менять на лету (control.py)
+        self.claim_max_age = CLAIM_MAX_AGE
+        self.create_check_after_activation = CREATE_CHECK_AFTER_ACTIVATION
+        # Все паттерны чеков собраны в один сканер (один проход по тексту)
+        self.scanner = CheckScanner(CHECK_PATTERNS)
+        # Ответы ботов разбираются по таблице шаблонов (статус, сумма и валюта)
+        self.reply_classifier = reply_classifier
+        
+        # Защита от блокировки - лимит скорости отправки сообщений для каждого аккаунта
+        self.rate_limiter = rate_limiter
+        
+        # Время ответа ботов задает ожидания при активации
+        self.latency = latency_model
+        
+        # Статистика чатов: найденные и отданные на активацию чеки
+        self.chat_index = chat_index
         
-        # Защита от блокировки - отслеживание скорости отправки сообщений
-        self.account_message_times = defaultdict(list)  # account_info -> список времени отправки сообщений
-        self.account_semaphores = defaultdict(lambda: asyncio.Semaphore(1))  # Семафор для каждого аккаунта
+        # Исходы активации, общие для всех аккаунтов (загружаются из базы при старте)
+        self.outcomes = CheckOutcomeCache(CHECK_OUTCOME_TTL)
+        
+        # Уже разосланные аккаунтам чеки
+        self.dispatched_checks = RecentKeys(DEDUP_WINDOW, DEDUP_MAX_KEYS)
+        
+        # Сработавшая команда создания чека для каждого бота (загружается из базы при старте)
+        self.create_commands: Dict[str, str] = {}
 
     def extract_checks(self, text: str) -> List[Tuple[str, str]]:
         """
-        Извлечь чеки из текста (оптимизировано для максимальной скорости)
+        Извлечь чеки из текста (один проход сканера по тексту)
         Возвращает список кортежей (check_code, bot_type)
         """
-        checks = []
-        
-        # Быстрая проверка наличия ключевых слов
-        if "start=" not in text and "/start" not in text.lower():
-            return checks
-        
-        # Очистка текста от лишних символов (минимальная обработка)
-        text_clean = text.replace("\\", "").replace("\n", " ").replace("\r", " ")
-        
-        # Поиск чеков CryptoBot (быстрый поиск с предкомпилированными паттернами)
-        for pattern in self.compiled_patterns["cryptobot"]:
-            matches = pattern.finditer(text_clean)
-            for match in matches:
-                url = match.group(0)
-                
-                # Быстрое извлечение кода чека
-                if "start=" in url:
-                    # Разделяем по start= и берем первую часть после знака =
-                    parts = url.split("start=", 1)
-                    if len(parts) > 1:
-                        check_code = parts[1].split("&")[0].split()[0].split("\n")[0].strip()
-                        if check_code.startswith("c") and len(check_code) >= 8:
-                            checks.append((check_code, "cryptobot"))
-                elif "/start" in url.lower():
-                    # Обработка /start команды
-                    parts = url.lower().split("/start", 1)
-                    if len(parts) > 1:
-                        check_code = parts[1].strip().split()[0].strip()
-                        if check_code.startswith("c") and len(check_code) >= 8:
-                            checks.append((check_code, "cryptobot"))
-                elif url.startswith("c") and len(url) >= 8:
-                    # Прямой код чека
-                    check_code = url.strip()
-                    if len(check_code) >= 8 and check_code.replace("_", "").replace("-", "").isalnum():
-                        checks.append((check_code, "cryptobot"))
-        
-        # Поиск чеков Xrocket (быстрый поиск с предкомпилированными паттернами)
-        for pattern in self.compiled_patterns["xrocket"]:
-            matches = pattern.finditer(text_clean)
-            for match in matches:
-                url = match.group(0)
-                if "start=" in url:
-                    parts = url.split("start=", 1)
-                    if len(parts) > 1:
-                        check_code = parts[1].split("&")[0].split()[0].split("\n")[0].strip()
-                        if len(check_code) >= 8:
-                            checks.append((check_code, "xrocket"))
-                elif "/start" in url.lower():
-                    parts = url.lower().split("/start", 1)
-                    if len(parts) > 1:
-                        check_code = parts[1].strip().split()[0].strip()
-                        if len(check_code) >= 8:
-                            checks.append((check_code, "xrocket"))
+        return self.scanner.scan(text)
+
+    def _classify_bot_reply(self, message: Message) -> Optional[dict]:
+        """
+        Разобрать сообщение бота
+        Возвращает данные об активации или None если сообщение не является ответом на активацию
+        """
+        # Минимальная проверка - только ключевые моменты
+        if not message.from_user or not message.from_user.is_bot:
+            return None
         
-        # Удаление дубликатов (быстрое)
-        seen = set()
-        unique_checks = []
-        for check in checks:
-            if check not in seen:
-                seen.add(check)
-                unique_checks.append(check)
+        text = message.text or ""
+        if not text:
+            return None
         
-        return unique_checks
+        bot_type = self.reply_classifier.bot_type(message.from_user.username)
+        return self.reply_classifier.classify(text, bot_type)
 
     async def _check_bot_response(self, client: Client, bot_username: str) -> Optional[dict]:
         """
-        Проверить ответ бота (быстрая проверка)
+        Проверить ответ бота в истории чата (быстрая проверка)
         Возвращает данные об активации или None если не найдено
         """
         async for message in client.get_chat_history(bot_username, limit=MAX_HISTORY_CHECK):
-            # Минимальная проверка - только ключевые моменты
             if not message.from_user or not message.from_user.is_bot:
                 continue
-            
-            text = message.text or ""
-            if not text:
+            if not message.text:
                 continue
-            
-            text_lower = text.lower()
-            
-            # Быстрая проверка успешной активации (приоритет - самые частые случаи первыми)
-            if "активирован" in text_lower or "activated" in text_lower or "получено" in text_lower:
-                # Извлекаем сумму и валюту (быстро, без лишних проверок)
-                amount = self._extract_amount(text)
-                currency = self._extract_currency(text)
-                return {
-                    "success": True,
-                    "amount": amount,
-                    "currency": currency,
-                    "text": text
-                }
-            elif "уже" in text_lower or "already" in text_lower:
-                return {"success": False, "error": "already_activated"}
-            elif "капча" in text_lower or "captcha" in text_lower:
-                return {"success": False, "error": "captcha_required"}
-            # Если нашли сообщение от бота, но нет нужных ключевых слов - выходим
-            break
+            # Если нашли сообщение от бота, но нет нужных ключевых слов - None
+            return self._classify_bot_reply(message)
         
         return None  # Не найдено ответа
 
-    async def _wait_for_rate_limit(self, account_info: str):
+    async def _poll_bot_response(self, client: Client, bot_username: str, bot_type: str,
+                                 sent_at: float) -> Optional[dict]:
         """
-        Ожидание для соблюдения лимита скорости (защита от блокировки)
+        Опрос истории чата с ботом (используется, если USE_REPLY_WAITER выключен)
+        Проверки повторяются с интервалом retry_delay, пока не истечет timeout
+        модели времени ответа (от sent_at - момента отправки /start)
+        Найденный ответ записывается в модель: бот ответил между началом прошлой
+        пустой проверки и началом проверки, нашедшей ответ - записывается середина
+        этого промежутка (иначе замер всегда не меньше first_wait и перцентили только растут)
         """
-        if not RATE_LIMIT_PER_ACCOUNT:
-            return
-        
-        async with self.account_semaphores[account_info]:
-            current_time = time.time()
+        retry_delay = self.latency.retry_delay(bot_type)
+        give_up_at = sent_at + self.latency.timeout(bot_type)
+        previous_check = sent_at
+        while True:
+            check_started = now()
+            result = await self._check_bot_response(client, bot_username)
+            if result:
+                self.latency.observe(bot_type, (previous_check + check_started) / 2 - sent_at)
+                return result
+            previous_check = check_started
             
-            # Очистка старых записей (старше 1 минуты)
-            self.account_message_times[account_info] = [
-                t for t in self.account_message_times[account_info]
-                if current_time - t < 60
-            ]
-            
-            # Если превышен лимит - ждем
-            if len(self.account_message_times[account_info]) >= RATE_LIMIT_PER_ACCOUNT:
-                oldest_time = min(self.account_message_times[account_info])
-                wait_time = 60 - (current_time - oldest_time) + 0.1
-                if wait_time > 0:
-                    await asyncio.sleep(wait_time)
-                    # Обновляем время
-                    current_time = time.time()
-                    self.account_message_times[account_info] = [
-                        t for t in self.account_message_times[account_info]
-                        if current_time - t < 60
-                    ]
-            
-            # Добавляем случайную задержку для имитации человеческого поведения
-            if USE_HUMAN_LIKE_DELAYS:
-                delay = random.uniform(MIN_DELAY_BETWEEN_BOT_MESSAGES, MAX_DELAY_BETWEEN_BOT_MESSAGES)
-                await asyncio.sleep(delay)
-            
-            # Записываем время отправки сообщения
-            self.account_message_times[account_info].append(time.time())
+            # Бот не успел ответить - повторная проверка (защита от пропуска медленного ответа)
+            remaining = give_up_at - now()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(retry_delay, remaining))
 
     async def activate_check(self, client: Client, check_code: str, bot_type: str,
-                           bot_username: str, account_info: str) -> Tuple[bool, Optional[dict]]:
+                           bot_username: str, account_info: str,
+                           received_at: Optional[float] = None) -> Tuple[bool, Optional[dict]]:
         """
         Активировать чек через бота (максимально агрессивная оптимизация для скорости)
-        Использует быструю проверку + повторную проверку если бот не успел ответить
+        Ответ бота приходит через обработчик входящих сообщений (reply_waiter),
+        поэтому задержка активации равна реальному времени ответа бота
         Защита от блокировки: лимиты скорости и случайные задержки
+        Чек старше CLAIM_MAX_AGE (от received_at) боту не отправляется
         Возвращает (успех, данные о чеке)
         """
-        async with self.semaphore:
+        # Чек уже забран, недействителен или активирован этим аккаунтом - боту не пишем
+        cached = self.outcomes.blocking_outcome(check_code, account_info)
+        if cached:
+            return False, {"error": cached, "cached": True}
+        
+        max_age = self.claim_max_age
+        deadline = received_at + max_age if received_at is not None and max_age else None
+        if not await self.scheduler.acquire(PRIORITY_CLAIM, deadline, bot_type):
+            return False, {"error": "claim_expired", "expired": True}
+        stage_started = now()
+        
+        try:
             try:
                 # Защита от блокировки - соблюдение лимита скорости
-                await self._wait_for_rate_limit(account_info)
+                # Чек, который не успеть отправить до срока, не занимает время отправки аккаунта
+                if await self.rate_limiter.wait(account_info, deadline) is None:
+                    self.scheduler.dropped[PRIORITY_CLAIM] += 1
+                    return False, {"error": "claim_expired", "expired": True}
+                stage_started = metrics.observe_since(STAGE_RATE_LIMIT, stage_started, bot_type)
+                
+                # За время ожидания исход мог сообщить другой аккаунт
+                cached = self.outcomes.blocking_outcome(check_code, account_info)
+                if cached:
+                    return False, {"error": cached, "cached": True}
+                if deadline is not None and stage_started >= deadline:
+                    self.scheduler.dropped[PRIORITY_CLAIM] += 1
+                    return False, {"error": "claim_expired", "expired": True}
+                
+                # Ожидание регистрируется до отправки, чтобы не пропустить быстрый ответ
+                reply = None
+                if USE_REPLY_WAITER:
+                    reply = reply_waiter.expect(client, bot_username, self._classify_bot_reply)
                 
                 # Отправляем команду боту (с обработкой FloodWait)
                 try:
-                    if USE_OPTIMISTIC_ACTIVATION:
-                        # Оптимистичная активация: отправляем и сразу проверяем параллельно (максимальная скорость)
+                    if reply is None and USE_OPTIMISTIC_ACTIVATION:
+                        # Оптимистичная активация: отправляем и сразу ждем параллельно
                         send_task = asyncio.create_task(
                             client.send_message(
                                 bot_username,
@@ -207,96 +206,85 @@ class CheckProcessor:
                                 disable_notification=True
                             )
                         )
-                        
-                        # Минимальная задержка (параллельно с отправкой)
-                        await asyncio.sleep(CHECK_ACTIVATION_DELAY)
+                        sent_at = now()
+                        await asyncio.sleep(self.latency.first_wait(bot_type))
                         await send_task  # Убеждаемся что отправлено
                     else:
-                        # Стандартная активация
                         await client.send_message(
                             bot_username,
                             f"/start {check_code}",
                             disable_notification=True
                         )
-                        await asyncio.sleep(CHECK_ACTIVATION_DELAY)
+                        sent_at = now()
+                        if reply is None:
+                            await asyncio.sleep(self.latency.first_wait(bot_type))
                 except FloodWait as e:
                     # Если получили FloodWait - ждем и возвращаем ошибку
+                    if reply:
+                        reply.cancel()
                     await asyncio.sleep(e.value)
                     return False, {"error": "flood_wait", "wait_time": e.value}
+                except Exception:
+                    if reply:
+                        reply.cancel()
+                    raise
+                stage_started = metrics.observe_since(STAGE_SEND, stage_started, bot_type)
                 
-                # Быстрая проверка ответа бота (первая попытка)
-                result = await self._check_bot_response(client, bot_username)
+                if reply:
+                    result = await reply_waiter.wait(reply, self.latency.timeout(bot_type))
+                    if result is None:
+                        # Страховка на случай пропущенного обновления - одна проверка истории
+                        result = await self._check_bot_response(client, bot_username)
+                    # Время ответа - в модель (ответ, найденный только в истории, пришел
+                    # позже таймаута и увеличит его; молчание бота не учитывается)
+                    if result is not None:
+                        self.latency.observe(bot_type, now() - stage_started)
+                else:
+                    result = await self._poll_bot_response(client, bot_username, bot_type, sent_at)
+                metrics.observe_since(STAGE_REPLY, stage_started, bot_type)
                 
                 if result:
                     if result.get("success"):
+                        self.outcomes.record(check_code, OUTCOME_ACTIVATED, account_info)
                         return True, {
                             "amount": result.get("amount"),
                             "currency": result.get("currency"),
                             "text": result.get("text")
                         }
                     else:
-                        return False, {"error": result.get("error", "unknown_error")}
-                
-                # Если бот не успел ответить за минимальное время - повторная проверка
-                # (это защита от пропуска активации, если бот медленный)
-                for attempt in range(MAX_RETRY_ATTEMPTS):
-                    await asyncio.sleep(CHECK_ACTIVATION_RETRY_DELAY)
-                    result = await self._check_bot_response(client, bot_username)
-                    
-                    if result:
-                        if result.get("success"):
-                            return True, {
-                                "amount": result.get("amount"),
-                                "currency": result.get("currency"),
-                                "text": result.get("text")
-                            }
-                        else:
-                            return False, {"error": result.get("error", "unknown_error")}
+                        error = result.get("error", "unknown_error")
+                        if error == OUTCOME_ALREADY_CLAIMED:
+                            # Ответ этому аккаунту: остальные аккаунты мульти-чек еще могут забрать
+                            self.outcomes.record(check_code, OUTCOME_ACTIVATED, account_info)
+                        elif error in DEAD_OUTCOMES:
+                            self.outcomes.record(check_code, error)
+                        return False, {"error": error}
                 
-                # Если после всех попыток не нашли ответ - возвращаем ошибку
+                # Если бот так и не ответил - возвращаем ошибку
                 return False, {"error": "unknown_response"}
                 
             except Exception as e:
                 return False, {"error": str(e)}
+        finally:
+            self.scheduler.release(PRIORITY_CLAIM)
 
-    def _extract_amount(self, text: str) -> Optional[float]:
-        """Извлечь сумму из текста (максимально быстро, с предкомпилированными паттернами)"""
-        # Быстрый поиск чисел (приоритет - первый паттерн, самый частый)
-        if self.amount_patterns:
-            match = self.amount_patterns[0].search(text)
-            if match:
-                try:
-                    return float(match.group(1))
-                except:
-                    pass
-        
-        # Просто поиск числа (используем скомпилированный паттерн)
-        numbers = self.number_pattern.findall(text)
-        if numbers:
-            try:
-                return float(numbers[0])
-            except:
-                pass
-        
-        return None
-
-    def _extract_currency(self, text: str) -> str:
-        """Извлечь валюту из текста (максимально быстро)"""
-        # Быстрая проверка (приоритет - самые частые валюты первыми)
-        if "$" in text or "usd" in text[:10].lower() or "usdt" in text[:10].lower():
-            return "USD"
-        elif "₽" in text or "руб" in text[:10].lower() or "rub" in text[:10].lower():
-            return "RUB"
-        elif "btc" in text[:10].lower():
-            return "BTC"
-        elif "eth" in text[:10].lower():
-            return "ETH"
-        return "UNKNOWN"
-
-    async def process_message(self, client: Client, message: Message, account_info: str):
+    def message_text(self, message: Message, full: bool = False) -> str:
         """
-        Обработать сообщение и активировать найденные чеки (максимально оптимизировано для скорости)
+        Текст для поиска чеков: ссылка из кнопки, иначе текст или подпись со скрытыми ссылками
+        full - все источники сразу (для измененных сообщений: новый чек может появиться
+        во второй кнопке или в тексте рядом с уже разосланным)
         """
+        if full:
+            parts = list(button_urls(message))
+            parts.append(message.text or message.caption or "")
+            parts.extend(entity_urls(message))
+            if message.reply_markup and getattr(message.reply_markup, "inline_keyboard", None):
+                parts.extend(
+                    button.text for row in message.reply_markup.inline_keyboard for button in row
+                    if not button.url and button.text and self.scanner.has_markers(button.text)
+                )
+            return " ".join(part for part in parts if part)
+        
         # Быстрое извлечение текста (приоритетные источники первыми)
         # Сначала проверяем кнопки - там чаще всего чеки (самый быстрый путь)
         text = ""
@@ -312,142 +300,199 @@ class CheckProcessor:
                 if text:
                     break
         
-        # Если нет в кнопках, проверяем основной текст
+        # Если нет в кнопках, проверяем основной текст и скрытые ссылки в нем
         if not text:
             text = message.text or message.caption or ""
+            links = entity_urls(message)
+            if links:
+                text = " ".join((text,) + links)
+        return text
+
+    def has_candidates(self, text: str) -> bool:
+        """Есть ли в тексте маркеры чеков (start=, /start)"""
+        return bool(text) and self.scanner.has_markers(text)
+
+    async def process_message(self, message: Message, received_at: Optional[float] = None,
+                              text: Optional[str] = None, edited: bool = False):
+        """
+        Обработать сообщение и активировать найденные чеки (максимально оптимизировано для скорости)
+        Сообщение разбирается один раз, найденные чеки раздаются всем аккаунтам из CLAIM_ACCOUNTS
+        received_at - время получения сообщения (metrics.now()) для замеров этапов
+        text - уже извлеченный message_text (из очереди приема)
+        edited - измененное сообщение: разбираются все источники, раздаются только новые коды
+        """
+        stage_started = now()
+        if received_at is not None:
+            metrics.observe(STAGE_DISPATCH, stage_started - received_at)
+        
+        if text is None:
+            text = self.message_text(message, full=edited)
         
         # Быстрая проверка на наличие чеков (ранний выход если нет ключевых слов)
-        if not text or ("start=" not in text and "/start" not in text.lower()):
+        if not self.has_candidates(text):
             return
         
         # Извлечение чеков (быстрое извлечение для максимальной скорости)
         checks = self.extract_checks(text)
+        metrics.observe_since(STAGE_EXTRACT, stage_started)
         
         if not checks:
             return
+        chat_id = message.chat.id
+        self.chat_index.record_candidates(chat_id, len(checks))
         
-        # Определение бота по типу
-        bot_usernames = {
-            "cryptobot": "CryptoBot",
-            "xrocket": "xrocket_bot"
-        }
+        claim_clients = account_manager.get_claim_clients()
+        source_chat = message.chat.title or str(chat_id)
         
         # Все аккаунты ловят один и тот же чек одновременно (максимальная скорость)
         # Параллельная активация всех чеков на всех аккаунтах (без ожидания)
         for check_code, bot_type in checks:
-            bot_username = bot_usernames.get(bot_type)
-            if not bot_username:
+            if bot_type not in BOT_USERNAMES:
+                continue
+            
+            # Один и тот же чек мог прийти из нескольких чатов или остаться в измененном
+            # сообщении - раздаем его один раз
+            if not self.dispatched_checks.add((check_code, bot_type)):
                 continue
+            self.chat_index.record_claim(chat_id)
             
-            # Создание задачи для активации (сразу запускается, без ожидания)
-            task = asyncio.create_task(
-                self._activate_check_task(
-                    client, check_code, bot_type, bot_username,
-                    account_info, message.chat.title or str(message.chat.id)
+            # Задачи активации держат только компактную запись, а не Message
+            candidate = CheckCandidate(check_code, bot_type, chat_id, message.id, received_at, source_chat)
+            for phone, client in claim_clients.items():
+                # Ждем места только при заполненном лимите задач активации
+                if len(self.active_tasks) >= self.max_pending_claims:
+                    await self._wait_claim_room()
+                # Создание задачи для активации (сразу запускается, без ожидания)
+                task = asyncio.create_task(
+                    self._activate_check_task(client, candidate, account_manager.get_account_info(phone))
                 )
-            )
-            self.active_tasks.add(task)
-            task.add_done_callback(self.active_tasks.discard)
-            # Не ждем завершения - максимальная параллельность
+                self.active_tasks.add(task)
+                task.add_done_callback(self._claim_done)
+                # Не ждем завершения - максимальная параллельность
+
+    async def _wait_claim_room(self):
+        """Дождаться, пока задач активации станет меньше max_pending_claims"""
+        self.claims_waited += 1
+        while len(self.active_tasks) >= self.max_pending_claims:
+            waiter = asyncio.get_running_loop().create_future()
+            self._claim_waiters.append(waiter)
+            await waiter
+
+    def _claim_done(self, task: asyncio.Task):
+        self.active_tasks.discard(task)
+        # Будим одного ожидающего, а не всех сразу
+        while self._claim_waiters:
+            waiter = self._claim_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def resize_pending_claims(self, limit: int):
+        """Изменить max_pending_claims на лету (ожидающие заново проверяют лимит)"""
+        self.max_pending_claims = limit
+        while self._claim_waiters:
+            waiter = self._claim_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def load_create_commands(self) -> int:
+        """Загрузить из базы команды создания чеков, сработавшие в прошлый раз"""
+        self.create_commands.update(await db.get_bot_commands())
+        return len(self.create_commands)
+
+    def _created_check_link(self, message: Message) -> Optional[str]:
+        """Ссылка на созданный чек из текста или кнопок сообщения бота"""
+        check_link = extract_check_link(message.text or "")
+        if check_link:
+            return check_link
+        
+        # Проверка на наличие кнопки со ссылкой
+        for url in button_urls(message):
+            if "start=" in url.lower():
+                return url
+        return None
+
+    def _classify_create_reply(self, message: Message) -> Optional[str]:
+        """
+        Разобрать ответ бота на команду создания чека
+        Возвращает ссылку на чек, "" если бот ответил без ссылки (команда не подошла)
+        или None, если это ответ на активацию чека (его ждет activate_check)
+        """
+        if not message.from_user or not message.from_user.is_bot:
+            return None
+        check_link = self._created_check_link(message)
+        if check_link:
+            return check_link
+        if self._classify_bot_reply(message) is not None:
+            return None
+        return ""
+
+    async def _find_created_check(self, client: Client, bot_username: str) -> Optional[str]:
+        """Поиск ссылки на чек в последних сообщениях бота"""
+        async for message in client.get_chat_history(bot_username, limit=5):
+            if message.from_user and message.from_user.is_bot:
+                check_link = self._created_check_link(message)
+                if check_link:
+                    return check_link
+        return None
+
+    async def _send_create_command(self, client: Client, bot_username: str, command: str) -> Optional[str]:
+        """Отправить команду создания чека и дождаться ответа бота; возвращает ссылку или None"""
+        # Ожидание регистрируется до отправки, чтобы не пропустить быстрый ответ
+        reply = None
+        if USE_REPLY_WAITER:
+            reply = reply_waiter.expect(client, bot_username, self._classify_create_reply)
+        
+        try:
+            await client.send_message(bot_username, command, disable_notification=True)
+        except Exception:
+            if reply:
+                reply.cancel()
+            raise
+        
+        if reply:
+            result = await reply_waiter.wait(reply, CREATE_CHECK_TIMEOUT)
+            if result is not None:
+                return result or None
+        else:
+            # Ждем ответ от бота
+            await asyncio.sleep(2.5)
+        
+        # Страховка на случай пропущенного обновления - одна проверка истории
+        return await self._find_created_check(client, bot_username)
 
     async def create_check(self, client: Client, bot_type: str, bot_username: str,
                           amount: float = None, currency: str = None) -> Optional[str]:
         """
         Создать новый чек через бота
+        Первой отправляется команда, сработавшая для бота в прошлый раз (хранится в базе),
+        ответ бота приходит через reply_waiter - обычно это один обмен сообщениями
         Возвращает ссылку на созданный чек или None
         """
         try:
             amount = amount or CHECK_AMOUNT
             currency = currency or CHECK_CURRENCY
             
-            if bot_type == "cryptobot":
-                # Создание чека в CryptoBot
-                # Пробуем различные форматы команд
-                commands = [
-                    f"/createCheck {amount} {currency}",
-                    f"/createcheck {amount} {currency}",
-                    f"/create {amount} {currency}",
-                    f"/check {amount} {currency}",
-                    f"/newcheck {amount} {currency}",
-                ]
-                
-                check_link = None
-                for cmd in commands:
-                    try:
-                        await client.send_message(
-                            bot_username,
-                            cmd,
-                            disable_notification=True
-                        )
-                        
-                        # Ждем ответ от бота
-                        await asyncio.sleep(2.5)
-                        
-                        # Получаем последние сообщения от бота
-                        async for message in client.get_chat_history(bot_username, limit=5):
-                            if message.from_user and message.from_user.is_bot:
-                                text = message.text or ""
-                                # Поиск ссылки на чек в ответе
-                                check_link = self._extract_check_link_from_text(text)
-                                if check_link:
-                                    return check_link
-                                
-                                # Проверка на наличие кнопки со ссылкой
-                                if message.reply_markup:
-                                    for row in message.reply_markup.inline_keyboard:
-                                        for button in row:
-                                            if button.url:
-                                                check_link = button.url
-                                                if "start=" in check_link.lower():
-                                                    return check_link
-                        
-                        # Если команда сработала (нет ошибки), выходим
-                        if check_link:
-                            break
-                    except:
-                        continue
-                            
-            elif bot_type == "xrocket":
-                # Создание чека в Xrocket
-                commands = [
-                    f"/createcheck {amount} {currency}",
-                    f"/create {amount} {currency}",
-                    f"/check {amount} {currency}",
-                    f"/newcheck {amount} {currency}",
-                    f"/create_check {amount} {currency}",
-                ]
+            commands = CREATE_CHECK_COMMANDS.get(bot_type, [])
+            learned = self.create_commands.get(bot_type)
+            if learned in commands:
+                commands = [learned] + [command for command in commands if command != learned]
+            
+            for command in commands:
+                try:
+                    check_link = await self._send_create_command(
+                        client, bot_username, f"{command} {amount} {currency}"
+                    )
+                except FloodWait:
+                    raise
+                except Exception:
+                    continue
                 
-                check_link = None
-                for cmd in commands:
-                    try:
-                        await client.send_message(
-                            bot_username,
-                            cmd,
-                            disable_notification=True
-                        )
-                        
-                        await asyncio.sleep(2.5)
-                        
-                        async for message in client.get_chat_history(bot_username, limit=5):
-                            if message.from_user and message.from_user.is_bot:
-                                text = message.text or ""
-                                check_link = self._extract_check_link_from_text(text)
-                                if check_link:
-                                    return check_link
-                                
-                                # Проверка на наличие кнопки со ссылкой
-                                if message.reply_markup:
-                                    for row in message.reply_markup.inline_keyboard:
-                                        for button in row:
-                                            if button.url:
-                                                check_link = button.url
-                                                if "start=" in check_link.lower():
-                                                    return check_link
-                        
-                        if check_link:
-                            break
-                    except:
-                        continue
+                if check_link:
+                    if command != learned:
+                        self.create_commands[bot_type] = command
+                        await db.set_bot_command(bot_type, command)
+                    return check_link
             
             return None
             
@@ -455,38 +500,6 @@ class CheckProcessor:
             print(f"Ошибка при создании чека: {e}")
             return None
 
-    def _extract_check_link_from_text(self, text: str) -> Optional[str]:
-        """Извлечь ссылку на чек из текста ответа бота"""
-        if not text:
-            return None
-        
-        # Поиск ссылок вида t.me/...?start=... (приоритет)
-        patterns = [
-            r"t\.me/[^\s\)\]]+\?start=[^\s\)\]]+",
-            r"https?://t\.me/[^\s\)\]]+\?start=[^\s\)\]]+",
-            r"t\.me/[^\s\)\]]+",
-            r"https?://t\.me/[^\s\)\]]+",
-            r"https?://[^\s\)\]]+",
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            if matches:
-                link = matches[0].strip().rstrip('.,!?)')
-                # Проверяем, что это действительно ссылка на чек
-                if "start=" in link.lower() or "t.me" in link.lower():
-                    return link
-        
-        # Поиск кода чека (начинается с 'c' для CryptoBot)
-        code_pattern = r"\bc[A-Za-z0-9_-]{10,}\b"
-        code_matches = re.findall(code_pattern, text)
-        if code_matches:
-            code = code_matches[0]
-            # Формируем ссылку
-            return f"https://t.me/CryptoBot?start={code}"
-        
-        return None
-
     async def send_check_to_chat(self, client: Client, check_link: str, bot_type: str):
         """Отправить созданный чек в указанный чат"""
         try:
@@ -514,63 +527,68 @@ class CheckProcessor:
             print(f"Ошибка при отправке чека в чат: {e}")
             return False
 
-    async def _activate_check_task(self, client: Client, check_code: str, bot_type: str,
-                                  bot_username: str, account_info: str, source_chat: str):
+    async def _activate_check_task(self, client: Client, candidate: CheckCandidate, account_info: str):
         """Задача для активации чека"""
+        bot_type = candidate.bot_type
+        bot_username = BOT_USERNAMES[bot_type]
         success, result = await self.activate_check(
-            client, check_code, bot_type, bot_username, account_info
+            client, candidate.code, bot_type, bot_username, account_info, candidate.received_at
         )
+        if candidate.received_at is not None and not (result and (result.get("cached") or result.get("expired"))):
+            metrics.observe_since(STAGE_TOTAL, candidate.received_at, bot_type)
         
         if success:
             amount = result.get("amount") if result else None
             currency = result.get("currency", "UNKNOWN") if result else "UNKNOWN"
             
-            # Асинхронное сохранение в базу данных (fire-and-forget для скорости)
-            asyncio.create_task(db.add_check(
-                check_code=check_code,
+            # Сохранение в базу данных: запись только ставится в очередь,
+            # фоновая задача базы запишет ее пачкой (и дозапишет при остановке)
+            await db.add_check(
+                check_code=candidate.code,
                 bot_type=bot_type,
                 amount=amount,
                 currency=currency,
                 activated_by=account_info,
-                source_chat=source_chat
-            ))
-            
-            # Асинхронное обновление статистики (fire-and-forget для скорости)
-            asyncio.create_task(db.update_stats(account_info, bot_type, amount or 0, currency))
-            
-            # Логирование
-            print(f"✅ Чек активирован: {bot_type} - {check_code} - {amount} {currency} ({account_info})")
+                source_chat=candidate.source_chat,
+                message_id=candidate.message_id
+            )
+            await db.update_stats(account_info, bot_type, amount or 0, currency)
             
-            # Асинхронное логирование
+            # Логирование: запись только ставится в очередь логгера (консоль, файл, сводка)
             try:
                 from logger import logger
-                await logger.log_activated_check(
-                    bot_type, check_code, amount or 0, currency, account_info, source_chat
-                )
+                await logger.log_activated_check(candidate, amount or 0, currency, account_info)
             except:
                 pass
             
             # Создание и отправка нового чека после активации
-            if CREATE_CHECK_AFTER_ACTIVATION:
-                asyncio.create_task(
+            if self.create_check_after_activation:
+                if len(self.create_tasks) >= self.max_pending_creates:
+                    self.creates_skipped += 1
+                    return
+                task = asyncio.create_task(
                     self._create_and_send_check_task(client, bot_type, bot_username, account_info)
                 )
+                self.create_tasks.add(task)
+                task.add_done_callback(self.create_tasks.discard)
 
     async def _create_and_send_check_task(self, client: Client, bot_type: str,
                                          bot_username: str, account_info: str):
-        """Задача для создания и отправки чека"""
+        """Задача для создания и отправки чека (фоновый приоритет планировщика)"""
         try:
-            # Создаем новый чек
-            check_link = await self.create_check(
-                client, bot_type, bot_username, CHECK_AMOUNT, CHECK_CURRENCY
-            )
+            # Создаем новый чек, когда нет ожидающих активаций
+            async with self.scheduler.slot(PRIORITY_BACKGROUND, bot_type=bot_type):
+                check_link = await self.create_check(
+                    client, bot_type, bot_username, CHECK_AMOUNT, CHECK_CURRENCY
+                )
             
             if check_link:
                 print(f"💰 Новый чек создан: {bot_type} - {check_link} ({account_info})")
                 
                 # Отправляем чек в указанный чат
                 if CHECK_DISTRIBUTION_CHAT_ID or CHECK_DISTRIBUTION_CHAT_USERNAME:
-                    sent = await self.send_check_to_chat(client, check_link, bot_type)
+                    async with self.scheduler.slot(PRIORITY_BACKGROUND, bot_type=bot_type):
+                        sent = await self.send_check_to_chat(client, check_link, bot_type)
                     if sent:
                         print(f"📤 Чек отправлен в чат: {bot_type} ({account_info})")
                     else:
@@ -0,0 +1,157 @@
+"""
+Однопроходный сканер кодов чеков
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+from config import CHECK_PATTERNS
+
+# Виды паттернов из CHECK_PATTERNS
+KIND_LINK = "link"  # ссылки вида t.me/<bot>?start=<code>
+KIND_COMMAND = "command"  # команды вида /start <code>
+KIND_DIRECT = "direct"  # коды без ссылки и команды
+
+# Обязательный префикс кода для каждого бота (как в прежней реализации)
+CODE_PREFIXES = {
+    "cryptobot": "c",
+}
+MIN_CODE_LENGTH = 8
+
+
+def _leading_char(pattern: str) -> Optional[str]:
+    """Первый обязательный литерал паттерна (None, если его нельзя определить)"""
+    if pattern.startswith(r"\b"):
+        pattern = pattern[2:]
+    if len(pattern) < 2 or pattern[1] in "?*{":
+        return None
+    first = pattern[0]
+    if first.isalnum() or first in "@/":
+        return first
+    return None
+
+
+def _pattern_kind(pattern: str) -> str:
+    """Определить вид паттерна по его тексту"""
+    if "start=" in pattern:
+        return KIND_LINK
+    if pattern.startswith("/start"):
+        return KIND_COMMAND
+    return KIND_DIRECT
+
+
+class CheckScanner:
+    """
+    Ищет коды чеков всех ботов за один проход по тексту.
+
+    Все паттерны из CHECK_PATTERNS объединяются в одно регулярное выражение
+    с именованными группами: ссылки, затем команды, затем прямые коды.
+    Совпадения, которые в прежней реализации находились сразу несколькими
+    паттернами (например, /start <code> для обоих ботов), досчитываются
+    только по найденному фрагменту, а не по всему тексту.
+    Регистр кода сохраняется всегда.
+    """
+
+    def __init__(self, patterns: Dict[str, List[str]] = None, prefilter: bool = True):
+        patterns = patterns or CHECK_PATTERNS
+        self.prefilter = prefilter
+        self.bot_types = list(patterns)
+
+        entries = []
+        for bot_type, bot_patterns in patterns.items():
+            for pattern in bot_patterns:
+                entries.append((bot_type, _pattern_kind(pattern), pattern))
+
+        order = {KIND_LINK: 0, KIND_COMMAND: 1, KIND_DIRECT: 2}
+        entries.sort(key=lambda entry: order[entry[1]])
+
+        self._groups: Dict[str, Tuple[str, str]] = {}
+        parts = []
+        for index, (bot_type, kind, pattern) in enumerate(entries):
+            name = f"p{index}"
+            self._groups[name] = (bot_type, kind)
+            parts.append(f"(?P<{name}>{pattern})")
+        combined = "|".join(parts)
+
+        # Опережающая проверка первого символа позволяет движку re быстро
+        # пропускать позиции, с которых не начинается ни один паттерн
+        leading = {_leading_char(pattern) for _, _, pattern in entries}
+        if None not in leading:
+            combined = f"(?=[{re.escape(''.join(sorted(leading)))}])(?:{combined})"
+        self._regex = re.compile(combined, re.IGNORECASE)
+
+        # Отдельные паттерны для досчета пересекающихся совпадений
+        self._commands = [
+            (bot_type, re.compile(pattern, re.IGNORECASE))
+            for bot_type, kind, pattern in entries if kind == KIND_COMMAND
+        ]
+        self._directs = [
+            (bot_type, re.compile(pattern, re.IGNORECASE))
+            for bot_type, kind, pattern in entries if kind == KIND_DIRECT
+        ]
+
+    @staticmethod
+    def has_markers(text: str) -> bool:
+        """Есть ли в тексте маркеры чеков (start= с учетом регистра или /start без учета)"""
+        if "start=" in text or "/start" in text:
+            return True
+        return "/" in text and "/start" in text.lower()
+
+    def scan(self, text: str) -> List[Tuple[str, str]]:
+        """
+        Найти чеки в тексте
+        Возвращает список кортежей (check_code, bot_type) без дубликатов
+        """
+        if not text:
+            return []
+        if self.prefilter and not self.has_markers(text):
+            return []
+
+        if "\\" in text:
+            text = text.replace("\\", "")
+
+        found: Dict[str, Dict[str, None]] = {bot_type: {} for bot_type in self.bot_types}
+        groups = self._groups
+
+        for match in self._regex.finditer(text):
+            bot_type, kind = groups[match.lastgroup]
+            fragment = match.group()
+
+            if kind == KIND_LINK:
+                index = fragment.find("start=")
+                if index < 0:
+                    self._scan_directs(found, fragment)
+                    continue
+                code = fragment[index + 6:]
+                self._accept(found, bot_type, code, False)
+                self._scan_directs(found, code)
+            elif kind == KIND_COMMAND:
+                code = fragment[6:].lstrip()
+                for command_bot, command in self._commands:
+                    if command_bot == bot_type or command.fullmatch(fragment):
+                        self._accept(found, command_bot, code, True)
+                self._scan_directs(found, code)
+            else:
+                self._accept(found, bot_type, fragment, False)
+
+        checks = []
+        for bot_type, codes in found.items():
+            for code in codes:
+                checks.append((code, bot_type))
+        return checks
+
+    @staticmethod
+    def _accept(found: Dict[str, Dict[str, None]], bot_type: str, code: str, any_case: bool):
+        """Проверить код по правилам бота и добавить его в результат"""
+        if len(code) < MIN_CODE_LENGTH:
+            return
+        prefix = CODE_PREFIXES.get(bot_type)
+        if prefix:
+            first = code[0].lower() if any_case else code[0]
+            if first != prefix:
+                return
+        found[bot_type][code] = None
+
+    def _scan_directs(self, found: Dict[str, Dict[str, None]], code: str):
+        """Найти прямые коды внутри уже найденного фрагмента"""
+        for bot_type, direct in self._directs:
+            for match in direct.finditer(code):
+                self._accept(found, bot_type, match.group(), False)
@@ -20,24 +20,46 @@ XROCKET_USERNAME = "xrocket_bot"
 
 # Настройки производительности
 MAX_CONCURRENT_CHECKS = 150  # Максимум одновременных активаций чеков (увеличено для скорости)
-CHECK_TIMEOUT = 1.5  # Таймаут активации чека (секунды) (уменьшено для скорости)
+BACKGROUND_MAX_SLOTS = 10  # Сколько из них могут занять фоновые задачи (создание и рассылка чеков, логи)
+CLAIM_MAX_AGE = 10.0  # Чек старше стольких секунд с момента получения сообщения боту уже не отправляется
+MAX_PENDING_CLAIMS = 1000  # Максимум задач активации (чек × аккаунт) сразу; при заполнении обработчики очереди приема ждут места
+CHECK_TIMEOUT = 1.5  # Таймаут ожидания ответа бота при активации чека, пока нет статистики ответов (секунды)
+CREATE_CHECK_TIMEOUT = 5.0  # Таймаут ожидания ответа бота на команду создания чека (секунды)
 UPDATE_CHECK_INTERVAL = 0.05  # Интервал проверки обновлений (секунды) (уменьшено)
-CHECK_ACTIVATION_DELAY = 0.05  # Задержка перед первой проверкой ответа бота (секунды) (минимальная для максимальной скорости)
-CHECK_ACTIVATION_RETRY_DELAY = 0.15  # Задержка перед повторной проверкой (если первая не нашла ответ)
+CHECK_ACTIVATION_DELAY = 0.05  # Задержка перед первой проверкой ответа бота, пока нет статистики ответов (секунды)
+CHECK_ACTIVATION_RETRY_DELAY = 0.15  # Задержка перед повторной проверкой, пока нет статистики ответов
 MAX_HISTORY_CHECK = 1  # Максимум сообщений для проверки в истории (только последнее сообщение для скорости)
 USE_OPTIMISTIC_ACTIVATION = True  # Оптимистичная активация - проверка параллельно с отправкой
-MAX_RETRY_ATTEMPTS = 2  # Максимум попыток проверки ответа бота (быстрая + повторная)
+USE_REPLY_WAITER = True  # Ждать ответ бота через обработчик входящих сообщений (без опроса истории)
+LATENCY_WINDOW = 200  # Сколько последних ответов каждого бота учитывать в модели времени ответа
+LATENCY_MIN_SAMPLES = 20  # С какого числа ответов ожидания берутся из модели, а не из констант выше
+LATENCY_TIMEOUT_FACTOR = 1.5  # Таймаут ожидания ответа = p99 времени ответа * множитель
+LATENCY_MIN_TIMEOUT = 0.5  # Границы таймаута ожидания ответа (секунды)
+LATENCY_MAX_TIMEOUT = 10.0
 
 # Защита от блокировки Telegram
 MIN_DELAY_BETWEEN_BOT_MESSAGES = 0.1  # Минимальная задержка между сообщениями боту (секунды) - защита от блокировки
 MAX_DELAY_BETWEEN_BOT_MESSAGES = 0.3  # Максимальная задержка между сообщениями боту (секунды) - имитация человека
 RATE_LIMIT_PER_ACCOUNT = 20  # Максимум сообщений боту в минуту с одного аккаунта (защита от блокировки)
-USE_HUMAN_LIKE_DELAYS = True  # Использовать случайные задержки для имитации человеческого поведения
+RATE_LIMIT_BURST = 3  # Сколько сообщений подряд можно отправить без паузы (входит в RATE_LIMIT_PER_ACCOUNT)
+USE_HUMAN_LIKE_DELAYS = True  # Разносить сообщения аккаунта случайными паузами для имитации человеческого поведения
 
 # Настройки мониторинга
 MONITOR_ALL_CHATS = True  # Мониторить все чаты
 IGNORE_PRIVATE_CHATS = False  # Игнорировать личные чаты с ботами
+RAW_INTAKE_FAST_PATH = False  # Собирать pyrogram Message только для сообщений с маркерами чеков (start=, /start)
 AUTO_JOIN_CHANNELS = True  # Автоматически подписываться на каналы
+DEDUP_WINDOW = 600  # Сколько секунд помнить обработанные сообщения и разосланные чеки
+DEDUP_MAX_KEYS = 200000  # Максимум ключей в памяти для отсева дубликатов
+INTAKE_QUEUE_SIZE = 5000  # Максимум сообщений с маркерами чеков в очереди приема (сообщения без маркеров и с истекшими чеками вытесняются первыми)
+INTAKE_WORKERS = 16  # Обработчиков очереди приема
+CHECK_OUTCOME_TTL = 3600  # Сколько секунд помнить исход активации чека (забран, недействителен, активирован)
+CLAIM_ACCOUNTS: List[str] = []  # Телефоны аккаунтов, которые активируют найденные чеки (пусто - все аккаунты)
+CHAT_INDEX_ENABLED = True  # Отсекать сообщения чатов, в которых не бывает чеков
+CHAT_COLD_AFTER = 2000  # Столько сообщений подряд без кодов чеков - и чат считается холодным
+CHAT_REPROBE_INTERVAL = 3600  # Раз в столько секунд холодный чат снова проверяется
+CHAT_ALLOW_LIST: List[int] = []  # ID чатов, которые обрабатываются всегда
+CHAT_DENY_LIST: List[int] = []  # ID чатов, которые не обрабатываются никогда
 
 # Антикапча
 ANTICAPTCHA_ENABLED = True
@@ -47,6 +69,14 @@ ANTICAPTCHA_API_KEY = os.getenv("ANTICAPTCHA_API_KEY", "")  # API ключ от
 LOG_CHAT_ID = None  # ID чата для отправки логов (None - отключено)
 LOG_ACTIVATED_CHECKS = True  # Логировать активированные чеки
 LOG_STATS_INTERVAL = 3600  # Интервал отправки статистики (секунды)
+LOG_DIGEST_INTERVAL = 30  # Активированные чеки отправляются в LOG_CHAT_ID одной сводкой раз в столько секунд
+LOG_JSONL_FILE = None  # Файл для записей лога в формате JSON lines (None - не писать)
+
+# Метрики (формат Prometheus, только локальный доступ)
+METRICS_ENABLED = True  # Запускать HTTP-эндпоинт /metrics
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+CONTROL_ENABLED = True  # GET/POST /tuning и /chats на сервере метрик: просмотр и изменение настроек на лету
 
 # Автовывод из CryptoBot
 AUTO_WITHDRAW_ENABLED = True
@@ -55,6 +85,7 @@ WITHDRAW_INTERVAL = 86400  # Интервал автовывода (секунд
 
 # Настройки создания и отправки чеков
 CREATE_CHECK_AFTER_ACTIVATION = True  # Создавать новый чек после активации
+MAX_PENDING_CREATES = 4  # Максимум задач создания и отправки чека сразу; сверх лимита новый чек не создается
 CHECK_DISTRIBUTION_CHAT_ID = -5011055445  # ID чата для отправки созданных чеков (None - отключено)
 CHECK_DISTRIBUTION_CHAT_USERNAME = None  # Username чата (например, @private_checks) - приоритетнее чем ID
 CHECK_AMOUNT = 1.0  # Сумма чека для создания (по умолчанию 1.0)
@@ -84,4 +115,14 @@ CHECK_PATTERNS = {
 
 # Настройки базы данных
 DB_PATH = "checks.db"  # SQLite база данных
+DB_FLUSH_INTERVAL = 0.05  # Окно группировки записей в одну транзакцию (секунды)
+DB_MAX_BATCH = 1000  # Максимум операций в одной транзакции
+DB_RETRY_DELAY = 0.1  # Пауза перед повтором пачки после ошибки записи (удваивается)
+DB_RETRY_MAX_DELAY = 5.0  # Максимальная пауза между повторами записи
+DB_SHUTDOWN_RETRIES = 5  # Повторов записи пачки при остановке (в работе пачка повторяется до успеха)
+CHECKS_RETENTION_DAYS = 0  # Сколько дней чеки хранятся в базе, более старые уходят в архив (0 - хранить все)
+ARCHIVE_DIR = "archive"  # Папка для архивов по месяцам (checks-ГГГГ-ММ.jsonl.gz)
+ARCHIVE_BATCH = 2000  # Чеков за один шаг переноса в архив
+ARCHIVE_INTERVAL = 3600  # Раз в столько секунд проверять, есть ли чеки для архива
+EXPORT_CHUNK_SIZE = 1000  # Строк за одно чтение при выгрузке (export.py)
 
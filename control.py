@@ -0,0 +1,273 @@
+"""
+Управление настройками на лету: локальные HTTP-эндпоинты /tuning и /chats рядом с /metrics
+"""
+import json
+from typing import Any, Callable, Dict, Optional
+from aiohttp import web
+from scheduler import scheduler
+from rate_limiter import rate_limiter
+from latency import latency_model
+from check_processor import check_processor
+from logger import logger
+from chat_index import chat_index
+
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    lowered = str(value).strip().lower()
+    if lowered in ("1", "true", "yes", "on"):
+        return True
+    if lowered in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"ожидается true/false, получено {value!r}")
+
+
+class _Knob:
+    __slots__ = ("kind", "getter", "setter", "minimum", "help")
+
+    def __init__(self, kind: type, getter: Callable[[], Any], setter: Callable[[Any], None],
+                 minimum: Optional[float], help_text: str):
+        self.kind = kind
+        self.getter = getter
+        self.setter = setter
+        self.minimum = minimum
+        self.help = help_text
+
+    def convert(self, value: Any) -> Any:
+        if self.kind is bool:
+            return _parse_bool(value)
+        converted = self.kind(value)
+        if self.minimum is not None and converted < self.minimum:
+            raise ValueError(f"значение меньше {self.minimum}")
+        return converted
+
+
+class RuntimeTuning:
+    """
+    Реестр настроек, которые меняются без перезапуска.
+
+    Каждая настройка - пара getter/setter над живым объектом (планировщик,
+    лимитер, модель времени ответа, процессор чеков). GET /tuning возвращает
+    текущие значения, POST /tuning с JSON {"имя": значение, ...} применяет
+    изменения (все или ни одного, если хоть одно значение некорректно).
+    """
+
+    def __init__(self):
+        self._knobs: Dict[str, _Knob] = {}
+
+    def register(self, name: str, kind: type, getter: Callable[[], Any], setter: Callable[[Any], None],
+                 help_text: str, minimum: Optional[float] = None):
+        """Зарегистрировать настройку"""
+        self._knobs[name] = _Knob(kind, getter, setter, minimum, help_text)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения всех настроек"""
+        return {name: knob.getter() for name, knob in sorted(self._knobs.items())}
+
+    def describe(self) -> Dict[str, Dict[str, Any]]:
+        """Значения настроек с типом и описанием"""
+        return {
+            name: {"value": knob.getter(), "type": knob.kind.__name__, "help": knob.help}
+            for name, knob in sorted(self._knobs.items())
+        }
+
+    def apply(self, changes: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Применить изменения; возвращает новые значения измененных настроек
+        ValueError - неизвестная настройка или некорректное значение (ничего не меняется)
+        """
+        converted = {}
+        for name, value in changes.items():
+            knob = self._knobs.get(name)
+            if knob is None:
+                raise ValueError(f"неизвестная настройка: {name}")
+            try:
+                converted[name] = knob.convert(value)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"{name}: {e}")
+
+        for name, value in converted.items():
+            self._knobs[name].setter(value)
+        return {name: self._knobs[name].getter() for name in converted}
+
+    def add_routes(self, app: web.Application):
+        """Добавить /tuning в приложение aiohttp (сервер метрик)"""
+        app.router.add_get("/tuning", self._handle_get)
+        app.router.add_post("/tuning", self._handle_post)
+
+    async def _handle_get(self, request: web.Request) -> web.Response:
+        return web.json_response(self.describe(), dumps=lambda data: json.dumps(data, ensure_ascii=False))
+
+    async def _handle_post(self, request: web.Request) -> web.Response:
+        try:
+            changes = await request.json()
+            if not isinstance(changes, dict):
+                raise ValueError("ожидается JSON-объект {\"имя\": значение}")
+            applied = self.apply(changes)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400,
+                                     dumps=lambda data: json.dumps(data, ensure_ascii=False))
+        print(f"⚙️ Настройки изменены: {applied}")
+        return web.json_response(applied)
+
+
+def _register_pipeline_knobs(tuning: RuntimeTuning):
+    """Настройки конвейера активации"""
+    tuning.register(
+        "max_concurrent_checks", int, lambda: scheduler.capacity,
+        lambda value: scheduler.resize(value),
+        "Слоты планировщика (MAX_CONCURRENT_CHECKS)", minimum=1,
+    )
+    tuning.register(
+        "background_max_slots", int, lambda: scheduler.background_slots,
+        lambda value: scheduler.resize(scheduler.capacity, value),
+        "Слоты для фоновых задач (BACKGROUND_MAX_SLOTS)", minimum=0,
+    )
+    tuning.register(
+        "claim_max_age", float, lambda: check_processor.claim_max_age,
+        lambda value: setattr(check_processor, "claim_max_age", value),
+        "Возраст чека, после которого боту не пишем, секунды (CLAIM_MAX_AGE, 0 - без ограничения)",
+        minimum=0,
+    )
+    tuning.register(
+        "max_pending_claims", int, lambda: check_processor.max_pending_claims,
+        lambda value: check_processor.resize_pending_claims(value),
+        "Задач активации сразу, сверх лимита очередь приема ждет (MAX_PENDING_CLAIMS)", minimum=1,
+    )
+    tuning.register(
+        "create_check_after_activation", bool, lambda: check_processor.create_check_after_activation,
+        lambda value: setattr(check_processor, "create_check_after_activation", value),
+        "Создавать чек после активации (CREATE_CHECK_AFTER_ACTIVATION)",
+    )
+    tuning.register(
+        "max_pending_creates", int, lambda: check_processor.max_pending_creates,
+        lambda value: setattr(check_processor, "max_pending_creates", value),
+        "Задач создания и отправки чека сразу, сверх лимита чек не создается (MAX_PENDING_CREATES)",
+        minimum=0,
+    )
+    tuning.register(
+        "rate_limit_per_account", int, lambda: rate_limiter.limit,
+        lambda value: rate_limiter.configure(limit=value),
+        "Сообщений боту в минуту с аккаунта (RATE_LIMIT_PER_ACCOUNT, 0 - без лимита)", minimum=0,
+    )
+    tuning.register(
+        "rate_limit_burst", int, lambda: rate_limiter.burst,
+        lambda value: rate_limiter.configure(burst=value),
+        "Сообщений подряд без паузы (RATE_LIMIT_BURST)", minimum=1,
+    )
+    tuning.register(
+        "use_human_like_delays", bool, lambda: rate_limiter.human_delays,
+        lambda value: rate_limiter.configure(human_delays=value),
+        "Случайные паузы между сообщениями аккаунта (USE_HUMAN_LIKE_DELAYS)",
+    )
+    tuning.register(
+        "min_delay_between_bot_messages", float, lambda: rate_limiter.min_delay,
+        lambda value: rate_limiter.configure(min_delay=value),
+        "Минимальная пауза между сообщениями аккаунта, секунды", minimum=0,
+    )
+    tuning.register(
+        "max_delay_between_bot_messages", float, lambda: rate_limiter.max_delay,
+        lambda value: rate_limiter.configure(max_delay=value),
+        "Максимальная пауза между сообщениями аккаунта, секунды", minimum=0,
+    )
+    tuning.register(
+        "check_activation_delay", float, lambda: latency_model.activation_delay,
+        lambda value: setattr(latency_model, "activation_delay", value),
+        "Первая проверка ответа, пока нет замеров, и минимальный интервал проверок, секунды "
+        "(CHECK_ACTIVATION_DELAY)", minimum=0,
+    )
+    tuning.register(
+        "check_activation_retry_delay", float, lambda: latency_model.retry_delay_default,
+        lambda value: setattr(latency_model, "retry_delay_default", value),
+        "Интервал повторных проверок ответа, пока нет замеров, секунды (CHECK_ACTIVATION_RETRY_DELAY)",
+        minimum=0,
+    )
+    tuning.register(
+        "check_timeout", float, lambda: latency_model.timeout_default,
+        lambda value: setattr(latency_model, "timeout_default", value),
+        "Срок ожидания ответа бота, пока нет замеров, секунды (CHECK_TIMEOUT)", minimum=0,
+    )
+    tuning.register(
+        "latency_timeout_factor", float, lambda: latency_model.timeout_factor,
+        lambda value: setattr(latency_model, "timeout_factor", value),
+        "Таймаут ответа = p99 * множитель (LATENCY_TIMEOUT_FACTOR)", minimum=1,
+    )
+    tuning.register(
+        "latency_min_timeout", float, lambda: latency_model.min_timeout,
+        lambda value: setattr(latency_model, "min_timeout", value),
+        "Нижняя граница таймаута ответа, секунды", minimum=0,
+    )
+    tuning.register(
+        "latency_max_timeout", float, lambda: latency_model.max_timeout,
+        lambda value: setattr(latency_model, "max_timeout", value),
+        "Верхняя граница таймаута ответа, секунды", minimum=0,
+    )
+    tuning.register(
+        "log_digest_interval", float, lambda: logger.digest_interval,
+        lambda value: setattr(logger, "digest_interval", value),
+        "Интервал сводок в LOG_CHAT_ID, секунды (со следующей сводки)", minimum=1,
+    )
+
+
+def _register_chat_knobs(tuning: RuntimeTuning):
+    """Настройки индекса чатов"""
+    tuning.register(
+        "chat_index_enabled", bool, lambda: chat_index.enabled,
+        lambda value: setattr(chat_index, "enabled", value),
+        "Отсекать сообщения холодных чатов (CHAT_INDEX_ENABLED)",
+    )
+    tuning.register(
+        "chat_cold_after", int, lambda: chat_index.cold_after,
+        lambda value: setattr(chat_index, "cold_after", value),
+        "Сообщений без кодов чеков до признания чата холодным (CHAT_COLD_AFTER, 0 - никогда)", minimum=0,
+    )
+    tuning.register(
+        "chat_reprobe_interval", float, lambda: chat_index.reprobe_interval,
+        lambda value: setattr(chat_index, "reprobe_interval", value),
+        "Интервал повторной проверки холодного чата, секунды (CHAT_REPROBE_INTERVAL)", minimum=0,
+    )
+
+
+async def _handle_chats_get(request: web.Request) -> web.Response:
+    return web.json_response({
+        "tracked": chat_index.tracked_chats(),
+        "cold": chat_index.cold_chats(),
+        "skipped": chat_index.skipped,
+        "allow": sorted(chat_index.allowed),
+        "deny": sorted(chat_index.denied),
+        "top": {str(chat_id): stats for chat_id, stats in chat_index.top(20).items()},
+    })
+
+
+async def _handle_chats_post(request: web.Request) -> web.Response:
+    """Ручные решения по чатам: {"allow": [id, ...], "deny": [...], "clear": [...]}"""
+    actions = {"allow": chat_index.allow, "deny": chat_index.deny, "clear": chat_index.clear_override}
+    try:
+        changes = await request.json()
+        if not isinstance(changes, dict) or set(changes) - set(actions):
+            raise ValueError("ожидается JSON-объект с ключами allow, deny, clear")
+        chat_ids = {action: [int(chat_id) for chat_id in ids] for action, ids in changes.items()}
+    except (TypeError, ValueError) as e:
+        return web.json_response({"error": str(e)}, status=400,
+                                 dumps=lambda data: json.dumps(data, ensure_ascii=False))
+    for action, ids in chat_ids.items():
+        for chat_id in ids:
+            actions[action](chat_id)
+    print(f"⚙️ Списки чатов изменены: {chat_ids}")
+    return await _handle_chats_get(request)
+
+
+def add_control_routes(app: web.Application):
+    """Добавить /tuning и /chats в приложение aiohttp (сервер метрик)"""
+    tuning.add_routes(app)
+    app.router.add_get("/chats", _handle_chats_get)
+    app.router.add_post("/chats", _handle_chats_post)
+
+
+# Глобальный реестр настроек
+tuning = RuntimeTuning()
+_register_pipeline_knobs(tuning)
+_register_chat_knobs(tuning)
@@ -3,135 +3,761 @@
 """
 import aiosqlite
 import asyncio
-from datetime import datetime
-from typing import Optional, List, Dict
-from config import DB_PATH
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional, List, Dict, Set, Tuple
+from config import (
+    DB_PATH, DB_FLUSH_INTERVAL, DB_MAX_BATCH, DB_RETRY_DELAY, DB_RETRY_MAX_DELAY, DB_SHUTDOWN_RETRIES,
+    CHECKS_RETENTION_DAYS, ARCHIVE_DIR, ARCHIVE_BATCH, ARCHIVE_INTERVAL, EXPORT_CHUNK_SIZE
+)
+from metrics import metrics, now, STAGE_DB_FLUSH
 
 
+# Запросы очереди записи
+_INSERT_CHECK_SQL = """
+    INSERT OR IGNORE INTO checks 
+    (check_code, bot_type, amount, currency, activated_by, source_chat, message_id, activated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+# Сводки по часам и дням: bucket x bot_type x account x currency
+_ROLLUP_TABLES = {
+    "checks_hourly": "%Y-%m-%d %H:00:00",
+    "checks_daily": "%Y-%m-%d",
+}
+_UPSERT_ROLLUP_SQL = """
+    INSERT INTO {table} (bucket, bot_type, account, currency, checks_count, total_amount)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(bucket, bot_type, account, currency) DO UPDATE SET
+        checks_count = checks_count + excluded.checks_count,
+        total_amount = total_amount + excluded.total_amount
+"""
+_REBUILD_ROLLUP_SQL = """
+    INSERT INTO {table} (bucket, bot_type, account, currency, checks_count, total_amount)
+    SELECT strftime('{bucket}', activated_at), bot_type, COALESCE(activated_by, ''), COALESCE(currency, ''),
+           COUNT(*), COALESCE(SUM(amount), 0)
+    FROM checks WHERE activated_at >= ? GROUP BY 1, 2, 3, 4
+"""
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # Как CURRENT_TIMESTAMP в SQLite (UTC)
+
+# Колонки checks в архиве (порядок SELECT при переносе)
+_ARCHIVE_COLUMNS = (
+    "id", "check_code", "bot_type", "amount", "currency", "activated_by",
+    "source_chat", "message_id", "activated_at", "status",
+)
+_ARCHIVE_VACUUM_PAGES = 500  # Свободных страниц, возвращаемых файлу после шага переноса
+_PENDING_SUFFIX = ".pending"  # Пачка, ожидающая удаления строк из базы
+
+_INSERT_STATS_SQL = """
+    INSERT OR IGNORE INTO stats (account_phone, bot_type, checks_count, total_amount, currency)
+    VALUES (?, ?, 0, 0, ?)
+"""
+_UPDATE_STATS_SQL = """
+    UPDATE stats SET
+        checks_count = checks_count + ?,
+        total_amount = total_amount + ?,
+        last_updated = CURRENT_TIMESTAMP
+    WHERE account_phone = ? AND bot_type = ?
+"""
+_UPSERT_COMMAND_SQL = """
+    INSERT INTO bot_commands (bot_type, command) VALUES (?, ?)
+    ON CONFLICT(bot_type) DO UPDATE SET command = excluded.command, updated_at = CURRENT_TIMESTAMP
+"""
+
+
+def _stage_archive(archive_dir: str, rows: List[tuple]) -> List[str]:
+    """
+    Подготовить пачку checks к переносу: по файлу на месяц рядом с архивом месяца
+    (checks-ГГГГ-ММ.jsonl.gz.<размер архива>.pending), данные сбрасываются на диск
+    В архив пачка попадает только после удаления строк из базы (_commit_archive)
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    by_month: Dict[str, List[tuple]] = {}
+    for row in rows:
+        by_month.setdefault(str(row[8])[:7], []).append(row)
+    staged = []
+    for month, month_rows in by_month.items():
+        path = os.path.join(archive_dir, f"checks-{month}.jsonl.gz")
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        pending = f"{path}.{size}{_PENDING_SUFFIX}"
+        _write_gzip_lines(pending, [dict(zip(_ARCHIVE_COLUMNS, row)) for row in month_rows])
+        staged.append(pending)
+    return staged
+
+
+def _write_gzip_lines(path: str, records: List[Dict]):
+    """Записать записи gzip JSON-строками (один gzip-член) и сбросить файл на диск"""
+    lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+    with open(path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+            archive.write(lines.encode("utf-8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def _commit_archive(staged: List[str]):
+    """
+    Дописать подготовленные пачки в архивы месяцев (отдельным gzip-членом) и удалить их
+    Архив сначала обрезается до размера из имени файла пачки: если дописывание
+    прервал сбой, повтор не задвоит строки
+    """
+    for pending in staged:
+        path, size = pending[:-len(_PENDING_SUFFIX)].rsplit(".", 1)
+        with open(pending, "rb") as f:
+            data = f.read()
+        with open(path, "ab") as raw:
+            raw.truncate(int(size))
+            raw.write(data)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.remove(pending)
+
+
+def _discard_archive(staged: List[str]):
+    """Удалить подготовленные пачки (строки остались в базе)"""
+    for pending in staged:
+        os.remove(pending)
+
+
+def _read_pending(path: str) -> List[Dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        return [json.loads(line) for line in archive]
+
 class Database:
-    def __init__(self):
-        self.db_path = DB_PATH
+    """
+    Долгоживущие соединения с SQLite (WAL): одно на запись, одно на чтение.
+    add_check и update_stats только ставят запись в очередь, фоновая задача
+    записывает все накопленное за DB_FLUSH_INTERVAL одной транзакцией.
+    Чеки старше retention_days фоновая задача переносит в архивы по месяцам
+    пачками по ARCHIVE_BATCH; удаление идет через ту же очередь записи,
+    а итоги остаются в сводке checks_daily.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or DB_PATH
         self.initialized = False
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._reader: Optional[aiosqlite.Connection] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._pending_codes: Set[str] = set()  # Чеки в очереди, еще не записанные в базу
+        # Итоги по типам ботов: загружаются один раз при старте и обновляются при записи
+        self._totals: Dict[str, Dict] = {}
+        self._bot_accounts: Dict[str, Set[str]] = {}
+        # Хранение и архив
+        self.retention_days = CHECKS_RETENTION_DAYS
+        self.archive_dir = ARCHIVE_DIR
+        self.archived = 0  # Чеков перенесено в архив с запуска
+        self._closing: Optional[asyncio.Event] = None
+        self._compaction_task: Optional[asyncio.Task] = None
 
     async def init(self):
         """Инициализация базы данных"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS checks (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    check_code TEXT UNIQUE NOT NULL,
+        if self.initialized:
+            return
+        
+        self._writer = await aiosqlite.connect(self.db_path)
+        db = self._writer
+        # Для новой базы: место после переноса в архив возвращается файлу (PRAGMA incremental_vacuum)
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute("PRAGMA synchronous=NORMAL")
+        
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS checks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                check_code TEXT UNIQUE NOT NULL,
+                bot_type TEXT NOT NULL,
+                amount REAL,
+                currency TEXT,
+                activated_by TEXT,
+                source_chat TEXT,
+                message_id INTEGER,
+                activated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                status TEXT DEFAULT 'activated'
+            )
+        """)
+        
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                account_phone TEXT,
+                bot_type TEXT,
+                checks_count INTEGER DEFAULT 0,
+                total_amount REAL DEFAULT 0,
+                currency TEXT,
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(account_phone, bot_type)
+            )
+        """)
+        
+        # Команда создания чека, сработавшая для бота в последний раз
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS bot_commands (
+                bot_type TEXT PRIMARY KEY,
+                command TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Сводки по часам и дням (обновляются при записи чеков)
+        for table in _ROLLUP_TABLES:
+            await db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    bucket TEXT NOT NULL,
                     bot_type TEXT NOT NULL,
-                    amount REAL,
-                    currency TEXT,
-                    activated_by TEXT,
-                    source_chat TEXT,
-                    message_id INTEGER,
-                    activated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    status TEXT DEFAULT 'activated'
-                )
-            """)
-            
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS stats (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    account_phone TEXT,
-                    bot_type TEXT,
-                    checks_count INTEGER DEFAULT 0,
-                    total_amount REAL DEFAULT 0,
-                    currency TEXT,
-                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(account_phone, bot_type)
-                )
-            """)
-            
-            await db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_check_code ON checks(check_code)
+                    account TEXT NOT NULL,
+                    currency TEXT NOT NULL,
+                    checks_count INTEGER NOT NULL DEFAULT 0,
+                    total_amount REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (bucket, bot_type, account, currency)
+                ) WITHOUT ROWID
             """)
-            
-            await db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_stats_account ON stats(account_phone, bot_type)
-            """)
-            
-            await db.commit()
+        
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_check_code ON checks(check_code)
+        """)
+        
+        # Отчеты за период и по чатам-источникам читают только индекс
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_checks_activated_at ON checks(activated_at, source_chat, amount)
+        """)
+        
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_checks_source_chat ON checks(source_chat, amount)
+        """)
+        
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_stats_account ON stats(account_phone, bot_type)
+        """)
+        
+        await db.commit()
+        await self._ensure_rollups()
+        
+        self._reader = await aiosqlite.connect(self.db_path)
+        await self._load_totals()
+        self._queue = asyncio.Queue()
+        self._closing = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        if self.retention_days:
+            self._compaction_task = asyncio.create_task(self._compaction_loop())
         self.initialized = True
 
+    async def close(self):
+        """Записать все из очереди и закрыть соединения"""
+        if not self.initialized:
+            return
+        self.initialized = False
+        
+        # Перенос в архив останавливается между пачками (удаления уже в очереди)
+        self._closing.set()
+        if self._compaction_task:
+            await self._compaction_task
+            self._compaction_task = None
+        
+        # Сигнал остановки встает в конец очереди - все поставленные ранее записи будут сохранены
+        self._queue.put_nowait(None)
+        await self._flush_task
+        
+        await self._writer.close()
+        await self._reader.close()
+
     async def add_check(self, check_code: str, bot_type: str, amount: Optional[float] = None,
                        currency: Optional[str] = None, activated_by: Optional[str] = None,
                        source_chat: Optional[str] = None, message_id: Optional[int] = None):
-        """Добавить активированный чек в базу"""
-        try:
-            async with aiosqlite.connect(self.db_path) as db:
-                await db.execute("""
-                    INSERT OR IGNORE INTO checks 
-                    (check_code, bot_type, amount, currency, activated_by, source_chat, message_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (check_code, bot_type, amount, currency, activated_by, source_chat, message_id))
-                await db.commit()
-                return True
-        except Exception as e:
-            print(f"Ошибка при добавлении чека: {e}")
+        """Добавить активированный чек в базу (через очередь записи)"""
+        if not self.initialized:
+            print("Ошибка при добавлении чека: база данных не инициализирована")
             return False
+        
+        self._pending_codes.add(check_code)
+        self._queue.put_nowait(("check", (
+            check_code, bot_type, amount, currency, activated_by, source_chat, message_id
+        )))
+        return True
+
+    def queue_depth(self) -> int:
+        """Количество операций в очереди записи"""
+        return self._queue.qsize() if self._queue else 0
 
     async def check_exists(self, check_code: str) -> bool:
         """Проверить, существует ли чек в базе"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute(
-                "SELECT 1 FROM checks WHERE check_code = ?", (check_code,)
-            ) as cursor:
-                return await cursor.fetchone() is not None
+        if check_code in self._pending_codes:
+            return True
+        async with self._reader.execute(
+            "SELECT 1 FROM checks WHERE check_code = ?", (check_code,)
+        ) as cursor:
+            return await cursor.fetchone() is not None
 
     async def update_stats(self, account_phone: str, bot_type: str, amount: float = 0, currency: str = ""):
-        """Обновить статистику аккаунта"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT OR IGNORE INTO stats (account_phone, bot_type, checks_count, total_amount, currency)
-                VALUES (?, ?, 0, 0, ?)
-            """, (account_phone, bot_type, currency))
-            await db.execute("""
-                UPDATE stats SET
-                    checks_count = checks_count + 1,
-                    total_amount = total_amount + ?,
-                    last_updated = CURRENT_TIMESTAMP
-                WHERE account_phone = ? AND bot_type = ?
-            """, (amount, account_phone, bot_type))
+        """Обновить статистику аккаунта (через очередь записи)"""
+        if not self.initialized:
+            print("Ошибка при обновлении статистики: база данных не инициализирована")
+            return
+        
+        self._queue.put_nowait(("stats", (account_phone, bot_type, amount, currency)))
+
+    async def _flush_loop(self):
+        """Фоновая запись очереди: одна транзакция на окно DB_FLUSH_INTERVAL"""
+        closing = False
+        while not closing:
+            batch = [await self._queue.get()]
+            
+            # Собираем все, что придет за окно группировки
+            if batch[0] is not None:
+                await asyncio.sleep(DB_FLUSH_INTERVAL)
+            while len(batch) < DB_MAX_BATCH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            
+            if None in batch:
+                closing = True
+                batch = [item for item in batch if item is not None]
+                # Забираем остаток очереди целиком
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not None:
+                        batch.append(item)
+            
+            if batch:
+                await self._flush_batch(batch)
+
+    async def _flush_batch(self, batch: List[Tuple[str, tuple]]):
+        """
+        Записать пачку, повторяя ее после ошибки (транзакция откатывается целиком)
+        Паузы между повторами растут от DB_RETRY_DELAY до DB_RETRY_MAX_DELAY;
+        новые операции тем временем ждут в очереди. В работе пачка повторяется
+        до успеха, при остановке - не больше DB_SHUTDOWN_RETRIES раз.
+        """
+        delay = DB_RETRY_DELAY
+        attempt = 1
+        try:
+            while not await self._write_batch(batch):
+                if self._closing.is_set() and attempt >= DB_SHUTDOWN_RETRIES:
+                    print(f"❌ При остановке не записано операций: {len(batch)} (попыток: {attempt})")
+                    return
+                print(f"⏳ Повтор записи через {delay:.1f} с (попытка {attempt + 1})")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, DB_RETRY_MAX_DELAY)
+                attempt += 1
+        finally:
+            for kind, params in batch:
+                if kind == "check":
+                    self._pending_codes.discard(params[0])
+                elif kind == "archive" and not params[1].done():
+                    params[1].set_result(False)
+
+    async def _write_batch(self, batch: List[Tuple[str, tuple]]) -> bool:
+        """Записать пачку операций одной транзакцией; False - ошибка (транзакция откачена)"""
+        checks = []
+        stats: Dict[Tuple[str, str], list] = {}
+        commands: Dict[str, str] = {}
+        archived: List[Tuple[List[int], asyncio.Future]] = []
+        hourly_before = None
+        for kind, params in batch:
+            if kind == "check":
+                checks.append(params)
+            elif kind == "command":
+                bot_type, command = params
+                commands[bot_type] = command
+            elif kind == "archive":
+                archived.append(params)
+            elif kind == "compact":
+                hourly_before = params
+            else:
+                account_phone, bot_type, amount, currency = params
+                entry = stats.setdefault((account_phone, bot_type), [0, 0.0, currency])
+                entry[0] += 1
+                entry[1] += amount or 0
+        
+        inserted = []
+        started = now()
+        try:
+            db = self._writer
+            if checks:
+                inserted = await self._new_checks(checks)
+                activated_at = datetime.utcnow()
+                await db.executemany(_INSERT_CHECK_SQL, [
+                    params + (activated_at.strftime(_TIMESTAMP_FORMAT),) for params in inserted
+                ])
+                await self._update_rollups(inserted, activated_at)
+            if stats:
+                await db.executemany(_INSERT_STATS_SQL, [
+                    (account_phone, bot_type, entry[2])
+                    for (account_phone, bot_type), entry in stats.items()
+                ])
+                await db.executemany(_UPDATE_STATS_SQL, [
+                    (entry[0], entry[1], account_phone, bot_type)
+                    for (account_phone, bot_type), entry in stats.items()
+                ])
+            if commands:
+                await db.executemany(_UPSERT_COMMAND_SQL, list(commands.items()))
+            for ids, _ in archived:
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    await db.execute(f"DELETE FROM checks WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            if hourly_before:
+                # Почасовые сводки старше срока хранения не нужны: итоги остаются в checks_daily
+                await db.execute("DELETE FROM checks_hourly WHERE bucket < ?", (hourly_before,))
             await db.commit()
+            metrics.observe_since(STAGE_DB_FLUSH, started)
+            self._apply_totals(inserted)
+            for _, done in archived:
+                done.set_result(True)
+        except Exception as e:
+            print(f"Ошибка при записи в базу ({len(batch)} операций): {e}")
+            try:
+                await self._writer.rollback()
+            except Exception:
+                pass
+            return False
+        if archived:
+            try:
+                await db.execute(f"PRAGMA incremental_vacuum({_ARCHIVE_VACUUM_PAGES})")
+            except Exception as e:
+                print(f"Ошибка возврата места файлу базы: {e}")
+        return True
+
+    async def _new_checks(self, checks: List[tuple]) -> List[tuple]:
+        """Оставить только чеки, которых еще нет в базе (и первые вхождения внутри пачки)"""
+        codes = list({params[0] for params in checks})
+        existing = set()
+        for start in range(0, len(codes), 500):
+            chunk = codes[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            async with self._writer.execute(
+                f"SELECT check_code FROM checks WHERE check_code IN ({placeholders})", chunk
+            ) as cursor:
+                existing.update(row[0] for row in await cursor.fetchall())
+        
+        new_checks = []
+        for params in checks:
+            if params[0] not in existing:
+                existing.add(params[0])
+                new_checks.append(params)
+        return new_checks
+
+    async def _update_rollups(self, inserted: List[tuple], activated_at: datetime):
+        """Добавить записанные чеки в сводки по часам и дням (в той же транзакции)"""
+        if not inserted:
+            return
+        groups: Dict[Tuple[str, str, str], list] = {}
+        for check_code, bot_type, amount, currency, activated_by, source_chat, message_id in inserted:
+            entry = groups.setdefault((bot_type, activated_by or "", currency or ""), [0, 0.0])
+            entry[0] += 1
+            entry[1] += amount or 0
+        for table, bucket_format in _ROLLUP_TABLES.items():
+            bucket = activated_at.strftime(bucket_format)
+            await self._writer.executemany(_UPSERT_ROLLUP_SQL.format(table=table), [
+                (bucket, bot_type, account, currency, count, amount)
+                for (bot_type, account, currency), (count, amount) in groups.items()
+            ])
+
+    async def _ensure_rollups(self):
+        """Построить сводки по существующим чекам (один раз - для базы без сводок)"""
+        async with self._writer.execute("SELECT 1 FROM checks_daily LIMIT 1") as cursor:
+            if await cursor.fetchone():
+                return
+        async with self._writer.execute("SELECT 1 FROM checks LIMIT 1") as cursor:
+            if not await cursor.fetchone():
+                return
+        await self.rebuild_rollups()
+
+    async def rebuild_rollups(self):
+        """
+        Пересчитать сводки по часам и дням из таблицы checks
+        Пересчитываются только периоды, чеки которых еще в базе: итоги по чекам,
+        перенесенным в архив, остаются в сводках как есть
+        """
+        db = self._writer
+        async with db.execute("SELECT MIN(activated_at) FROM checks") as cursor:
+            oldest, = await cursor.fetchone()
+        if oldest is None:
+            return
+        oldest_time = datetime.strptime(str(oldest)[:19], _TIMESTAMP_FORMAT)
+        for table, bucket_format in _ROLLUP_TABLES.items():
+            # Граница - начало периода самого старого чека (первый период пересчитывается целиком)
+            bucket = oldest_time.strftime(bucket_format)
+            await db.execute(f"DELETE FROM {table} WHERE bucket >= ?", (bucket,))
+            await db.execute(_REBUILD_ROLLUP_SQL.format(table=table, bucket=bucket_format), (bucket,))
+        await db.commit()
+
+    async def _compaction_loop(self):
+        """Фоновый перенос старых чеков в архив раз в ARCHIVE_INTERVAL секунд"""
+        try:
+            await self._recover_archive()
+        except Exception as e:
+            print(f"Ошибка восстановления архива: {e}")
+        while not self._closing.is_set():
+            try:
+                await self.archive_old_checks()
+            except Exception as e:
+                print(f"Ошибка переноса чеков в архив: {e}")
+            try:
+                await asyncio.wait_for(self._closing.wait(), ARCHIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def archive_old_checks(self, batch_size: int = ARCHIVE_BATCH) -> int:
+        """
+        Перенести чеки старше retention_days в архивы по месяцам
+        Пачка читается отдельным соединением, готовится к переносу на диске (в потоке)
+        и удаляется через очередь записи - запись новых чеков не ждет переноса;
+        в архив месяца она дописывается только после удаления строк из базы
+        Возвращает число перенесенных чеков
+        """
+        cutoff_time = datetime.utcnow() - timedelta(days=self.retention_days)
+        cutoff = cutoff_time.strftime(_TIMESTAMP_FORMAT)
+        archived = 0
+        while not self._closing.is_set():
+            async with self._reader.execute(
+                f"SELECT {', '.join(_ARCHIVE_COLUMNS)} FROM checks WHERE activated_at < ? "
+                f"ORDER BY activated_at LIMIT ?",
+                (cutoff, batch_size)
+            ) as cursor:
+                rows = await cursor.fetchall()
+            if not rows:
+                break
+            staged = await asyncio.to_thread(_stage_archive, self.archive_dir, rows)
+            done = asyncio.get_running_loop().create_future()
+            self._queue.put_nowait(("archive", ([row[0] for row in rows], done)))
+            if not await done:
+                await asyncio.to_thread(_discard_archive, staged)
+                break
+            await asyncio.to_thread(_commit_archive, staged)
+            archived += len(rows)
+        
+        if archived:
+            self._queue.put_nowait(("compact", cutoff_time.strftime(_ROLLUP_TABLES["checks_hourly"])))
+            self.archived += archived
+            print(f"🗄️ В архив перенесено чеков: {archived} (старше {self.retention_days} дн.)")
+        return archived
+
+    async def _recover_archive(self):
+        """
+        Довести до конца пачки, оставшиеся после сбоя: строки, которых уже нет в базе,
+        дописываются в архив месяца, остальные остаются в базе до следующего переноса
+        """
+        if not os.path.isdir(self.archive_dir):
+            return
+        for name in sorted(os.listdir(self.archive_dir)):
+            if not name.endswith(_PENDING_SUFFIX):
+                continue
+            pending = os.path.join(self.archive_dir, name)
+            records = await asyncio.to_thread(_read_pending, pending)
+            ids = [record["id"] for record in records]
+            remaining = set()
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                async with self._reader.execute(
+                    f"SELECT id FROM checks WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ) as cursor:
+                    remaining.update(row[0] for row in await cursor.fetchall())
+            deleted = [record for record in records if record["id"] not in remaining]
+            if not deleted:
+                await asyncio.to_thread(_discard_archive, [pending])
+                continue
+            if len(deleted) < len(records):
+                await asyncio.to_thread(_write_gzip_lines, pending, deleted)
+            await asyncio.to_thread(_commit_archive, [pending])
+            print(f"🗄️ Восстановлена пачка архива после сбоя: {len(deleted)} чеков ({name})")
+
+    async def _load_totals(self):
+        """Загрузить итоги из сводки checks_daily (включает чеки, перенесенные в архив)"""
+        self._totals = {}
+        self._bot_accounts = {}
+        async with self._reader.execute("""
+            SELECT bot_type, SUM(checks_count), SUM(total_amount) FROM checks_daily GROUP BY bot_type
+        """) as cursor:
+            async for bot_type, total_checks, total_amount in cursor:
+                self._totals[bot_type] = {
+                    "total_checks": total_checks,
+                    "total_amount": total_amount or 0,
+                }
+        async with self._reader.execute("""
+            SELECT DISTINCT bot_type, account FROM checks_daily WHERE account != ''
+        """) as cursor:
+            async for bot_type, account in cursor:
+                self._bot_accounts.setdefault(bot_type, set()).add(account)
+
+    def _apply_totals(self, inserted: List[tuple]):
+        """Учесть записанные чеки в итогах"""
+        for check_code, bot_type, amount, currency, activated_by, source_chat, message_id in inserted:
+            totals = self._totals.setdefault(bot_type, {"total_checks": 0, "total_amount": 0})
+            totals["total_checks"] += 1
+            totals["total_amount"] += amount or 0
+            if activated_by is not None:
+                self._bot_accounts.setdefault(bot_type, set()).add(activated_by)
+
+    async def get_recent_activations(self, max_age: float) -> List[Tuple[str, str]]:
+        """Получить чеки, активированные за последние max_age секунд: (check_code, activated_by)"""
+        async with self._reader.execute(
+            "SELECT check_code, activated_by FROM checks WHERE activated_at >= datetime('now', ?)",
+            (f"-{int(max_age)} seconds",)
+        ) as cursor:
+            return await cursor.fetchall()
+
+    async def set_bot_command(self, bot_type: str, command: str):
+        """Запомнить сработавшую команду создания чека для бота (через очередь записи)"""
+        if not self.initialized:
+            return
+        self._queue.put_nowait(("command", (bot_type, command)))
+
+    async def get_bot_commands(self) -> Dict[str, str]:
+        """Получить сработавшие команды создания чеков: bot_type -> команда"""
+        async with self._reader.execute("SELECT bot_type, command FROM bot_commands") as cursor:
+            return dict(await cursor.fetchall())
+
+    async def _fetch_dicts(self, query: str, params: tuple = ()) -> List[Dict]:
+        async with self._reader.execute(query, params) as cursor:
+            rows = await cursor.fetchall()
+            columns = [desc[0] for desc in cursor.description]
+            return [dict(zip(columns, row)) for row in rows]
+
+    async def get_hourly_earnings(self, hours: int = 24, bot_type: Optional[str] = None) -> List[Dict]:
+        """Заработок по часам за последние hours часов: bucket, bot_type, currency, checks_count, total_amount"""
+        since = (datetime.utcnow() - timedelta(hours=hours)).strftime(_ROLLUP_TABLES["checks_hourly"])
+        query = """
+            SELECT bucket, bot_type, currency, SUM(checks_count) AS checks_count, SUM(total_amount) AS total_amount
+            FROM checks_hourly WHERE bucket >= ?
+        """
+        params: tuple = (since,)
+        if bot_type:
+            query += " AND bot_type = ?"
+            params += (bot_type,)
+        query += " GROUP BY bucket, bot_type, currency ORDER BY bucket, bot_type, currency"
+        return await self._fetch_dicts(query, params)
+
+    async def get_daily_earnings(self, days: int = 30, bot_type: Optional[str] = None) -> List[Dict]:
+        """Заработок по дням за последние days дней: bucket, bot_type, currency, checks_count, total_amount"""
+        since = (datetime.utcnow() - timedelta(days=days)).strftime(_ROLLUP_TABLES["checks_daily"])
+        query = """
+            SELECT bucket, bot_type, currency, SUM(checks_count) AS checks_count, SUM(total_amount) AS total_amount
+            FROM checks_daily WHERE bucket >= ?
+        """
+        params: tuple = (since,)
+        if bot_type:
+            query += " AND bot_type = ?"
+            params += (bot_type,)
+        query += " GROUP BY bucket, bot_type, currency ORDER BY bucket, bot_type, currency"
+        return await self._fetch_dicts(query, params)
+
+    async def get_account_yield(self, days: int = 7) -> List[Dict]:
+        """Доход аккаунтов за последние days дней: account, bot_type, currency, checks_count, total_amount"""
+        since = (datetime.utcnow() - timedelta(days=days)).strftime(_ROLLUP_TABLES["checks_daily"])
+        return await self._fetch_dicts("""
+            SELECT account, bot_type, currency, SUM(checks_count) AS checks_count, SUM(total_amount) AS total_amount
+            FROM checks_daily WHERE bucket >= ?
+            GROUP BY account, bot_type, currency ORDER BY total_amount DESC
+        """, (since,))
+
+    async def get_top_source_chats(self, days: Optional[int] = 7, limit: int = 10) -> List[Dict]:
+        """
+        Чаты, из которых пришло больше всего чеков (days=None - за все время)
+        За период - диапазон по idx_checks_activated_at: без подсказки планировщик
+        выбирает обход idx_checks_source_chat целиком ради GROUP BY
+        """
+        if days is None:
+            return await self._fetch_dicts("""
+                SELECT source_chat, COUNT(*) AS checks_count, COALESCE(SUM(amount), 0) AS total_amount
+                FROM checks GROUP BY source_chat ORDER BY checks_count DESC LIMIT ?
+            """, (limit,))
+        since = (datetime.utcnow() - timedelta(days=days)).strftime(_TIMESTAMP_FORMAT)
+        return await self._fetch_dicts("""
+            SELECT source_chat, COUNT(*) AS checks_count, COALESCE(SUM(amount), 0) AS total_amount
+            FROM checks INDEXED BY idx_checks_activated_at WHERE activated_at >= ?
+            GROUP BY source_chat ORDER BY checks_count DESC LIMIT ?
+        """, (since, limit))
+
+    async def _iter_dicts(self, query: str, params: tuple = (),
+                          chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[List[Dict]]:
+        """Строки запроса пачками по chunk_size (в памяти только текущая пачка)"""
+        async with self._reader.execute(query, params) as cursor:
+            columns = [desc[0] for desc in cursor.description]
+            while True:
+                rows = await cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield [dict(zip(columns, row)) for row in rows]
+
+    async def iter_checks(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          bot_type: Optional[str] = None, account: Optional[str] = None,
+                          chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[List[Dict]]:
+        """
+        Чеки в порядке активации пачками по chunk_size, activated_at в [since, until)
+        Обход по idx_checks_activated_at: без подсказки планировщик может выбрать
+        обход таблицы с сортировкой всего результата
+        """
+        query = f"SELECT {', '.join(_ARCHIVE_COLUMNS)} FROM checks INDEXED BY idx_checks_activated_at WHERE 1"
+        params: tuple = ()
+        if since:
+            query += " AND activated_at >= ?"
+            params += (since.strftime(_TIMESTAMP_FORMAT),)
+        if until:
+            query += " AND activated_at < ?"
+            params += (until.strftime(_TIMESTAMP_FORMAT),)
+        if bot_type:
+            query += " AND bot_type = ?"
+            params += (bot_type,)
+        if account:
+            query += " AND activated_by = ?"
+            params += (account,)
+        query += " ORDER BY activated_at"
+        async for chunk in self._iter_dicts(query, params, chunk_size):
+            yield chunk
+
+    async def iter_daily_earnings(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                                  bot_type: Optional[str] = None, account: Optional[str] = None,
+                                  chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[List[Dict]]:
+        """Сводка checks_daily пачками по chunk_size (включает чеки, перенесенные в архив)"""
+        bucket_format = _ROLLUP_TABLES["checks_daily"]
+        query = "SELECT bucket, bot_type, account, currency, checks_count, total_amount FROM checks_daily WHERE 1"
+        params: tuple = ()
+        if since:
+            query += " AND bucket >= ?"
+            params += (since.strftime(bucket_format),)
+        if until:
+            query += " AND bucket < ?"
+            params += (until.strftime(bucket_format),)
+        if bot_type:
+            query += " AND bot_type = ?"
+            params += (bot_type,)
+        if account:
+            query += " AND account = ?"
+            params += (account,)
+        query += " ORDER BY bucket, bot_type, account, currency"
+        async for chunk in self._iter_dicts(query, params, chunk_size):
+            yield chunk
+
+    async def iter_stats(self, account_phone: Optional[str] = None, bot_type: Optional[str] = None,
+                         chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[List[Dict]]:
+        """Статистика аккаунтов пачками по chunk_size"""
+        query = "SELECT * FROM stats WHERE 1"
+        params: tuple = ()
+        if account_phone:
+            query += " AND account_phone = ?"
+            params += (account_phone,)
+        if bot_type:
+            query += " AND bot_type = ?"
+            params += (bot_type,)
+        query += " ORDER BY checks_count DESC"
+        async for chunk in self._iter_dicts(query, params, chunk_size):
+            yield chunk
 
     async def get_stats(self, account_phone: Optional[str] = None) -> List[Dict]:
         """Получить статистику"""
-        async with aiosqlite.connect(self.db_path) as db:
-            if account_phone:
-                query = "SELECT * FROM stats WHERE account_phone = ?"
-                params = (account_phone,)
-            else:
-                query = "SELECT * FROM stats ORDER BY checks_count DESC"
-                params = ()
-            
-            async with db.execute(query, params) as cursor:
-                rows = await cursor.fetchall()
-                columns = [desc[0] for desc in cursor.description]
-                return [dict(zip(columns, row)) for row in rows]
+        return [row async for chunk in self.iter_stats(account_phone) for row in chunk]
 
     async def get_total_stats(self) -> Dict:
-        """Получить общую статистику"""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute("""
-                SELECT 
-                    COUNT(*) as total_checks,
-                    SUM(amount) as total_amount,
-                    bot_type,
-                    COUNT(DISTINCT activated_by) as unique_accounts
-                FROM checks
-                GROUP BY bot_type
-            """) as cursor:
-                rows = await cursor.fetchall()
-                result = {}
-                for row in rows:
-                    result[row[2]] = {
-                        "total_checks": row[0],
-                        "total_amount": row[1] or 0,
-                        "unique_accounts": row[3]
-                    }
-                return result
+        """Получить общую статистику (из счетчиков в памяти, без запроса к базе)"""
+        return {
+            bot_type: {
+                "total_checks": totals["total_checks"],
+                "total_amount": totals["total_amount"],
+                "unique_accounts": len(self._bot_accounts.get(bot_type, ())),
+            }
+            for bot_type, totals in self._totals.items()
+        }
 
 
 # Глобальный экземпляр базы данных
@@ -0,0 +1,54 @@
+"""
+Ограниченная по времени и размеру структура для отсева дубликатов
+"""
+import time
+from typing import Callable, Hashable, Set
+
+
+class RecentKeys:
+    """
+    Множество недавно виденных ключей из двух поколений.
+
+    Новые ключи попадают в текущее поколение. Когда оно старше max_age / 2
+    или в нем max_size / 2 ключей, текущее поколение становится предыдущим,
+    а самое старое выбрасывается целиком (обмен ссылок, без перестроения).
+    Гарантия: ключ, добавленный не раньше max_age / 2 назад и не раньше
+    max_size / 2 вставок назад, будет найден; в памяти не больше max_size ключей.
+    """
+
+    def __init__(self, max_age: float, max_size: int,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_age = max_age
+        self.max_size = max_size
+        self._clock = clock
+        self._half_age = max_age / 2
+        self._half_size = max(max_size // 2, 1)
+        self._current: Set[Hashable] = set()
+        self._previous: Set[Hashable] = set()
+        self._rotated_at = clock()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._current or key in self._previous
+
+    def __len__(self) -> int:
+        return len(self._current) + len(self._previous)
+
+    def add(self, key: Hashable) -> bool:
+        """Добавить ключ; возвращает False, если ключ уже был виден"""
+        if key in self._current or key in self._previous:
+            return False
+        now = self._clock()
+        if len(self._current) >= self._half_size or now - self._rotated_at >= self._half_age:
+            self._rotate(now)
+        self._current.add(key)
+        return True
+
+    def _rotate(self, now: float):
+        """Сменить поколения"""
+        # После долгого простоя текущее поколение уже старше max_age - выбрасываем оба
+        if now - self._rotated_at >= self.max_age:
+            self._previous = set()
+        else:
+            self._previous = self._current
+        self._current = set()
+        self._rotated_at = now
@@ -0,0 +1,131 @@
+"""
+Выгрузка чеков и статистики в CSV или JSON Lines без загрузки всей таблицы в память
+
+Запуск рядом с main.py (можно при работающем боте - база в режиме WAL):
+    python export.py checks --since 2026-01-01 --until 2026-02-01 --bot cryptobot -o checks.csv
+    python export.py checks --archive --format jsonl -o all_checks.jsonl
+    python export.py daily --account "+79000000000 (1000)" --format csv
+    python export.py stats
+Время --since/--until - UTC, как activated_at в базе; без -o выгрузка идет в stdout.
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import os
+import sys
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, TextIO
+from config import ARCHIVE_DIR, EXPORT_CHUNK_SIZE
+from database import db
+
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # Как activated_at в базе
+FORMATS = ("csv", "jsonl")
+KINDS = ("checks", "daily", "stats")
+
+
+async def iter_archive(archive_dir: str = ARCHIVE_DIR, since: Optional[datetime] = None,
+                       until: Optional[datetime] = None, bot_type: Optional[str] = None,
+                       account: Optional[str] = None,
+                       chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[List[Dict]]:
+    """Чеки из архивов по месяцам (checks-ГГГГ-ММ.jsonl.gz) пачками по chunk_size, с теми же фильтрами"""
+    if not os.path.isdir(archive_dir):
+        return
+    since_text = since.strftime(_TIMESTAMP_FORMAT) if since else None
+    until_text = until.strftime(_TIMESTAMP_FORMAT) if until else None
+    for name in sorted(os.listdir(archive_dir)):
+        if not (name.startswith("checks-") and name.endswith(".jsonl.gz")):
+            continue
+        month = name[len("checks-"):-len(".jsonl.gz")]
+        if (since_text and month < since_text[:7]) or (until_text and month > until_text[:7]):
+            continue
+        chunk = []
+        with gzip.open(os.path.join(archive_dir, name), "rt", encoding="utf-8") as archive:
+            for line in archive:
+                row = json.loads(line)
+                activated_at = str(row["activated_at"])
+                if since_text and activated_at < since_text:
+                    continue
+                if until_text and activated_at >= until_text:
+                    continue
+                if bot_type and row["bot_type"] != bot_type:
+                    continue
+                if account and row["activated_by"] != account:
+                    continue
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+                    # Отдаем управление циклу событий между пачками
+                    await asyncio.sleep(0)
+        if chunk:
+            yield chunk
+
+
+async def write_rows(chunks: AsyncIterator[List[Dict]], stream: TextIO, fmt: str,
+                     header: bool = True) -> int:
+    """Записать пачки строк в stream в формате csv или jsonl; возвращает число строк"""
+    written = 0
+    writer = None
+    async for chunk in chunks:
+        if fmt == "csv":
+            if writer is None:
+                writer = csv.DictWriter(stream, fieldnames=list(chunk[0]))
+                if header:
+                    writer.writeheader()
+            writer.writerows(chunk)
+        else:
+            stream.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in chunk))
+        written += len(chunk)
+    return written
+
+
+async def export(kind: str, stream: TextIO, fmt: str = "csv", since: Optional[datetime] = None,
+                 until: Optional[datetime] = None, bot_type: Optional[str] = None,
+                 account: Optional[str] = None, with_archive: bool = False) -> int:
+    """Выгрузить checks, daily (сводка checks_daily) или stats; возвращает число строк"""
+    if kind == "checks":
+        written = 0
+        if with_archive:
+            # Архив старше данных в базе - идет первым, заголовок CSV пишется один раз
+            written = await write_rows(iter_archive(db.archive_dir, since, until, bot_type, account), stream, fmt)
+        return written + await write_rows(
+            db.iter_checks(since, until, bot_type, account), stream, fmt, header=not written
+        )
+    if kind == "daily":
+        return await write_rows(db.iter_daily_earnings(since, until, bot_type, account), stream, fmt)
+    return await write_rows(db.iter_stats(account, bot_type), stream, fmt)
+
+
+async def main(args):
+    # Перенос в архив - работа основного процесса, выгрузка только читает
+    db.retention_days = 0
+    await db.init()
+    stream = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        written = await export(
+            args.kind, stream, args.format, args.since, args.until, args.bot, args.account, args.archive
+        )
+    finally:
+        if args.output:
+            stream.close()
+        await db.close()
+    print(f"📤 Выгружено строк: {written} ({args.kind}, {args.format})", file=sys.stderr)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Выгрузка чеков и статистики из базы")
+    parser.add_argument("kind", choices=KINDS, help="checks - чеки, daily - сводка по дням, stats - по аккаунтам")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("-o", "--output", help="Файл выгрузки (по умолчанию stdout)")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="С этого времени UTC включительно")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="До этого времени UTC")
+    parser.add_argument("--bot", help="Тип бота: cryptobot или xrocket")
+    parser.add_argument("--account", help="Аккаунт, как в activated_by")
+    parser.add_argument("--archive", action="store_true", help="Для checks: добавить чеки из архива")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
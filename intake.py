@@ -0,0 +1,52 @@
+"""
+Общий прием сообщений: одно сообщение разбирается один раз для всех аккаунтов
+"""
+from typing import NamedTuple, Optional, Tuple
+from pyrogram import enums
+from pyrogram.types import Message
+
+
+def button_urls(message: Message) -> Tuple[str, ...]:
+    """Ссылки из inline-кнопок сообщения"""
+    markup = message.reply_markup
+    keyboard = getattr(markup, "inline_keyboard", None) if markup else None
+    if not keyboard:
+        return ()
+    return tuple(button.url for row in keyboard for button in row if button.url)
+
+
+def entity_urls(message: Message) -> Tuple[str, ...]:
+    """Скрытые ссылки (text_link) из текста или подписи сообщения"""
+    entities = message.entities or message.caption_entities
+    if not entities:
+        return ()
+    return tuple(
+        entity.url for entity in entities
+        if entity.type == enums.MessageEntityType.TEXT_LINK and entity.url
+    )
+
+
+def content_hash(message: Message) -> int:
+    """Хеш содержимого сообщения: текст, подпись, скрытые ссылки и ссылки кнопок"""
+    return hash((message.text, message.caption, entity_urls(message), button_urls(message)))
+
+
+def message_key(message: Message) -> Tuple[int, int, int]:
+    """
+    Ключ сообщения, общий для всех аккаунтов: (chat_id, message_id, хеш содержимого)
+    Одна и та же публикация в общем чате, полученная несколькими аккаунтами, дает один ключ
+    """
+    return message.chat.id, message.id, content_hash(message)
+
+
+class CheckCandidate(NamedTuple):
+    """
+    Найденный в сообщении чек - все, что нужно активации, логам и базе
+    Собирается один раз при разборе сообщения; сам Message дальше не передается
+    """
+    code: str
+    bot_type: str
+    chat_id: int
+    message_id: int
+    received_at: Optional[float]  # metrics.now() при получении сообщения
+    source_chat: str  # Название чата (или его ID) для логов и базы
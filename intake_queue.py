@@ -0,0 +1,135 @@
+"""
+Ограниченная очередь приема сообщений с фиксированным пулом обработчиков
+"""
+import asyncio
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+from pyrogram.types import Message
+from config import INTAKE_QUEUE_SIZE, INTAKE_WORKERS
+from check_processor import check_processor
+from metrics import now
+
+# Элемент очереди: (сообщение, время получения, текст для поиска чеков, изменено ли)
+_Item = Tuple[Message, Optional[float], str, bool]
+
+
+class IntakeQueue:
+    """
+    Очередь между handle_message и process_message.
+
+    Вместо задачи на каждое сообщение его обрабатывает один из workers
+    постоянных обработчиков. При постановке в очередь извлекается текст
+    и проверяются маркеры чеков (start=, /start): сообщения без маркеров
+    в очередь не попадают (в них нечего искать), обработчик получает готовый текст.
+    Обработчики ждут места для задач активации (check_processor.max_pending_claims),
+    поэтому при перегрузке растет очередь, а не число задач.
+    Сообщения старше claim_max_age из очереди вытесняются без разбора: их чеки
+    боту уже не отправятся. Если очередь заполнена (maxsize) и таких нет,
+    вытесняется самое старое сообщение - обработчик приема нельзя заставить ждать
+    (через него же приходят ответы ботов), а старый чек ближе к своему сроку.
+    До start() и после close() сообщения обрабатываются отдельной задачей, как раньше.
+    """
+
+    def __init__(self, maxsize: int = INTAKE_QUEUE_SIZE, workers: int = INTAKE_WORKERS):
+        self.maxsize = maxsize
+        self.workers = workers
+        self._items: Deque[_Item] = deque()
+        self._idle: Deque[asyncio.Future] = deque()  # Свободные обработчики
+        self._worker_tasks: List[asyncio.Task] = []
+        self._running = False
+        self.accepted = 0  # Принято в очередь
+        self.filtered = 0  # Сообщений без маркеров (в очередь не ставились)
+        self.expired = 0  # Сообщений вытеснено по сроку (их чеки боту уже не отправятся)
+        self.dropped = 0  # Сообщений с непросроченными чеками вытеснено из заполненной очереди
+        self.peak_depth = 0
+
+    @property
+    def depth(self) -> int:
+        """Сообщений в очереди"""
+        return len(self._items)
+
+    def start(self):
+        """Запустить обработчики"""
+        if self._running:
+            return
+        self._running = True
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        """Дообработать очередь и остановить обработчики"""
+        if not self._running:
+            return
+        self._running = False
+        while self._idle:
+            self._wake_one()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def submit(self, message: Message, received_at: Optional[float] = None, edited: bool = False) -> bool:
+        """Поставить сообщение в очередь; False - в сообщении нет маркеров чеков"""
+        text = check_processor.message_text(message, full=edited)
+        if not check_processor.has_candidates(text):
+            self.filtered += 1
+            return False
+
+        if not self._running:
+            asyncio.create_task(check_processor.process_message(message, received_at, text, edited))
+            return True
+
+        if len(self._items) >= self.maxsize:
+            self._evict_expired()
+        if len(self._items) >= self.maxsize:
+            self._items.popleft()
+            self.dropped += 1
+
+        self._items.append((message, received_at, text, edited))
+        self.accepted += 1
+        if len(self._items) > self.peak_depth:
+            self.peak_depth = len(self._items)
+        self._wake_one()
+        return True
+
+    def _evict_expired(self):
+        # Очередь упорядочена по времени получения: просроченные - в начале
+        max_age = check_processor.claim_max_age
+        if not max_age:
+            return
+        oldest = now() - max_age
+        while self._items:
+            received_at = self._items[0][1]
+            if received_at is None or received_at >= oldest:
+                return
+            self._items.popleft()
+            self.expired += 1
+
+    def _wake_one(self):
+        # Будим один свободный обработчик, а не все сразу
+        while self._idle:
+            waiter = self._idle.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    async def _worker(self):
+        while True:
+            if not self._items:
+                if not self._running:
+                    return
+                waiter = asyncio.get_running_loop().create_future()
+                self._idle.append(waiter)
+                await waiter
+                continue
+
+            self._evict_expired()
+            if not self._items:
+                continue
+            message, received_at, text, edited = self._items.popleft()
+            try:
+                await check_processor.process_message(message, received_at, text, edited)
+            except Exception:
+                # Ошибка одного сообщения не должна останавливать обработчик
+                pass
+
+
+# Глобальная очередь приема
+intake_queue = IntakeQueue()
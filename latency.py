@@ -0,0 +1,99 @@
+"""
+Модель времени ответа ботов: скользящие перцентили задают ожидания при активации
+"""
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from config import (
+    CHECK_TIMEOUT, CHECK_ACTIVATION_DELAY, CHECK_ACTIVATION_RETRY_DELAY,
+    LATENCY_WINDOW, LATENCY_MIN_SAMPLES, LATENCY_TIMEOUT_FACTOR, LATENCY_MIN_TIMEOUT, LATENCY_MAX_TIMEOUT
+)
+
+
+class _BotLatency:
+    __slots__ = ("samples", "ordered")
+
+    def __init__(self, window: int):
+        self.samples: Deque[float] = deque(maxlen=window)  # в порядке поступления
+        self.ordered: List[float] = []  # те же значения по возрастанию
+
+
+class LatencyModel:
+    """
+    Скользящее окно последних времен ответа каждого бота (от отправки /start до ответа).
+
+    По перцентилям окна задаются:
+      first_wait  - первая проверка ответа (p50),
+      retry_delay - интервал повторных проверок (p90 - p50),
+      timeout     - сколько всего ждать ответ (p99 * timeout_factor).
+    Пока ответов меньше min_samples, используются начальные значения
+    (CHECK_ACTIVATION_DELAY, CHECK_ACTIVATION_RETRY_DELAY, CHECK_TIMEOUT;
+    меняются на лету через control.py, как и остальные поля).
+    Ответ, найденный в истории уже после таймаута, тоже записывается: если бот
+    замедлился, перцентили растут и следующий таймаут становится длиннее
+    (не больше max_timeout). Неответы не записываются, чтобы молчащий
+    бот не растягивал таймаут до максимума.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = LATENCY_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self.timeout_factor = LATENCY_TIMEOUT_FACTOR
+        self.min_timeout = LATENCY_MIN_TIMEOUT
+        self.max_timeout = LATENCY_MAX_TIMEOUT
+        self.activation_delay = CHECK_ACTIVATION_DELAY  # Первая проверка без замеров и нижняя граница интервала
+        self.retry_delay_default = CHECK_ACTIVATION_RETRY_DELAY  # Интервал повторных проверок без замеров
+        self.timeout_default = CHECK_TIMEOUT  # Срок ожидания ответа без замеров
+        self._bots: Dict[str, _BotLatency] = {}
+
+    def observe(self, bot_type: str, seconds: float):
+        """Записать время ответа бота"""
+        bot = self._bots.get(bot_type)
+        if bot is None:
+            bot = self._bots[bot_type] = _BotLatency(self.window)
+        if len(bot.samples) == bot.samples.maxlen:
+            oldest = bot.samples[0]
+            del bot.ordered[bisect_left(bot.ordered, oldest)]
+        bot.samples.append(seconds)
+        insort(bot.ordered, seconds)
+
+    def samples(self, bot_type: str) -> int:
+        """Число ответов в окне"""
+        bot = self._bots.get(bot_type)
+        return len(bot.samples) if bot else 0
+
+    def percentile(self, bot_type: str, q: float) -> Optional[float]:
+        """Перцентиль времени ответа (q от 0 до 1); None, пока ответов меньше min_samples"""
+        bot = self._bots.get(bot_type)
+        if bot is None or len(bot.ordered) < self.min_samples:
+            return None
+        ordered = bot.ordered
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def first_wait(self, bot_type: str) -> float:
+        """Пауза перед первой проверкой ответа"""
+        p50 = self.percentile(bot_type, 0.5)
+        return self.activation_delay if p50 is None else p50
+
+    def retry_delay(self, bot_type: str) -> float:
+        """Интервал между повторными проверками ответа"""
+        p50 = self.percentile(bot_type, 0.5)
+        p90 = self.percentile(bot_type, 0.9)
+        if p50 is None:
+            return self.retry_delay_default
+        return max(p90 - p50, self.activation_delay)
+
+    def timeout(self, bot_type: str) -> float:
+        """Сколько всего ждать ответ бота"""
+        p99 = self.percentile(bot_type, 0.99)
+        if p99 is None:
+            return self.timeout_default
+        return min(max(p99 * self.timeout_factor, self.min_timeout), self.max_timeout)
+
+    def bot_types(self) -> List[str]:
+        """Боты, для которых есть замеры"""
+        return sorted(self._bots)
+
+
+# Глобальная модель времени ответа ботов
+latency_model = LatencyModel()
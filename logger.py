@@ -1,76 +1,196 @@
 """
 Модуль для логирования
 """
+import asyncio
+import json
+import time
 from datetime import datetime
+from typing import List, Optional
 from colorama import init, Fore, Style
-from config import LOG_CHAT_ID
+from config import LOG_CHAT_ID, LOG_DIGEST_INTERVAL, LOG_JSONL_FILE
 from account_manager import account_manager
+from scheduler import scheduler, PRIORITY_BACKGROUND
+from intake import CheckCandidate
 
 init(autoreset=True)
 
+TELEGRAM_MESSAGE_LIMIT = 4096  # Максимальная длина сообщения Telegram
+
+# Уровни: (цвет, значок)
+_LEVELS = {
+    "info": (Fore.CYAN, ""),
+    "success": (Fore.GREEN, " ✅"),
+    "warning": (Fore.YELLOW, " ⚠️"),
+    "error": (Fore.RED, " ❌"),
+}
+
 
 class Logger:
-    @staticmethod
-    def info(message: str):
+    """
+    Логгер с очередью: вызовы из горячего пути только ставят запись в очередь,
+    фоновая задача форматирует ее, печатает и (если задан LOG_JSONL_FILE)
+    дописывает JSON-строкой в файл. Сообщения для Telegram копятся и уходят
+    одной сводкой раз в LOG_DIGEST_INTERVAL секунд.
+    До start() и после close() записи печатаются сразу.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = LOG_JSONL_FILE,
+                 digest_interval: float = LOG_DIGEST_INTERVAL):
+        self.jsonl_path = jsonl_path
+        self.digest_interval = digest_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer_task: Optional[asyncio.Task] = None
+        self._digest_task: Optional[asyncio.Task] = None
+        self._digest: List[str] = []  # Строки для следующей сводки в Telegram
+        self._client = None  # Клиент для отправки логов в Telegram
+        self._file = None
+
+    async def start(self):
+        """Запустить фоновую запись логов и отправку сводок"""
+        if self._queue is not None:
+            return
+        if self.jsonl_path:
+            self._file = open(self.jsonl_path, "a", encoding="utf-8")
+        self._queue = asyncio.Queue()
+        self._consumer_task = asyncio.create_task(self._consume(self._queue))
+        if LOG_CHAT_ID:
+            self._digest_task = asyncio.create_task(self._digest_loop())
+
+    async def close(self):
+        """Дописать очередь, отправить последнюю сводку и остановить фоновые задачи"""
+        if self._queue is None:
+            return
+        # Поздние записи печатаются сразу, поставленные ранее - дописываются
+        queue, self._queue = self._queue, None
+        queue.put_nowait(None)
+        await self._consumer_task
+        if self._digest_task:
+            self._digest_task.cancel()
+            self._digest_task = None
+        await self.flush_digest()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _emit(self, level: str, message: str, event: Optional[str] = None, **fields):
+        record = (time.time(), level, message, event, fields)
+        if self._queue is None:
+            self._write([record])
+        else:
+            self._queue.put_nowait(record)
+
+    def info(self, message: str, **fields):
         """Информационное сообщение"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"{Fore.CYAN}[{timestamp}]{Style.RESET_ALL} {message}")
-    
-    @staticmethod
-    def success(message: str):
+        self._emit("info", message, **fields)
+
+    def success(self, message: str, **fields):
         """Сообщение об успехе"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"{Fore.GREEN}[{timestamp}] ✅{Style.RESET_ALL} {message}")
-    
-    @staticmethod
-    def warning(message: str):
+        self._emit("success", message, **fields)
+
+    def warning(self, message: str, **fields):
         """Предупреждение"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"{Fore.YELLOW}[{timestamp}] ⚠️{Style.RESET_ALL} {message}")
-    
-    @staticmethod
-    def error(message: str):
+        self._emit("warning", message, **fields)
+
+    def error(self, message: str, **fields):
         """Ошибка"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"{Fore.RED}[{timestamp}] ❌{Style.RESET_ALL} {message}")
-    
-    @staticmethod
-    async def log_to_telegram(message: str, client=None):
+        self._emit("error", message, **fields)
+
+    async def _consume(self, queue: asyncio.Queue):
+        """Фоновая запись: все накопленное в очереди пишется за один проход"""
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            self._write([record for record in batch if record is not None])
+            if None in batch:
+                return
+
+    def _write(self, records):
+        lines = []
+        for created, level, message, event, fields in records:
+            color, icon = _LEVELS[level]
+            timestamp = datetime.fromtimestamp(created).strftime("%H:%M:%S")
+            print(f"{color}[{timestamp}]{icon}{Style.RESET_ALL} {message}")
+            if self._file:
+                entry = {"ts": created, "level": level, "message": message}
+                if event:
+                    entry["event"] = event
+                entry.update(fields)
+                lines.append(json.dumps(entry, ensure_ascii=False, default=str))
+        if lines:
+            try:
+                self._file.write("\n".join(lines) + "\n")
+                self._file.flush()
+            except Exception as e:
+                print(f"Ошибка записи лога в файл: {e}")
+
+    async def _digest_loop(self):
+        while True:
+            await asyncio.sleep(self.digest_interval)
+            await self.flush_digest()
+
+    async def flush_digest(self):
+        """
+        Отправить накопленные строки одной сводкой (с разбиением по лимиту Telegram)
+        Если клиентов уже нет (остановлены), сводка пишется в консоль и файл логов
+        """
+        if not self._digest:
+            return
+        lines, self._digest = self._digest, []
+        if not self._telegram_client():
+            self._write([(time.time(), "warning", "Сводка не отправлена в Telegram (нет клиента):\n"
+                          + "\n\n".join(lines), "digest_unsent", {})])
+            return
+        chunk = f"🧾 Сводка за {self.digest_interval:.0f} с ({len(lines)}):"
+        for line in lines:
+            if len(chunk) + len(line) + 2 > TELEGRAM_MESSAGE_LIMIT:
+                await self.log_to_telegram(chunk)
+                chunk = line
+            else:
+                chunk += "\n\n" + line
+        await self.log_to_telegram(chunk)
+
+    def _telegram_client(self):
+        """Клиент для логов: выбирается один раз и меняется, только если он отключен"""
+        clients = account_manager.get_all_clients()
+        if self._client is None or self._client not in clients.values():
+            self._client = next(iter(clients.values()), None)
+        return self._client
+
+    async def log_to_telegram(self, message: str, client=None):
         """Отправить лог в Telegram"""
         if not LOG_CHAT_ID:
             return
-        
+
+        client = client or self._telegram_client()
         if not client:
-            clients = account_manager.get_all_clients()
-            if not clients:
-                return
-            client = list(clients.values())[0]
-        
+            return
+
         try:
-            await client.send_message(LOG_CHAT_ID, message)
+            # Логи уступают слоты активациям чеков
+            async with scheduler.slot(PRIORITY_BACKGROUND):
+                await client.send_message(LOG_CHAT_ID, message)
         except:
             pass
-    
-    @staticmethod
-    async def log_activated_check(bot_type: str, check_code: str, amount: float,
-                                  currency: str, account_info: str, source_chat: str):
-        """Логировать активированный чек"""
-        message = (
-            f"💰 Чек активирован!\n\n"
-            f"Бот: {bot_type.upper()}\n"
-            f"Код: {check_code[:20]}...\n"
-            f"Сумма: {amount} {currency}\n"
-            f"Аккаунт: {account_info}\n"
-            f"Источник: {source_chat}"
+
+    async def log_activated_check(self, candidate: CheckCandidate, amount: float,
+                                  currency: str, account_info: str):
+        """Логировать активированный чек (только постановка в очередь и в сводку)"""
+        self._emit(
+            "success", f"Чек активирован: {candidate.bot_type} - {amount} {currency}",
+            event="check_activated", bot_type=candidate.bot_type, check_code=candidate.code,
+            amount=amount, currency=currency, account=account_info, source_chat=candidate.source_chat,
+            chat_id=candidate.chat_id, message_id=candidate.message_id,
         )
-        
-        Logger.success(f"Чек активирован: {bot_type} - {amount} {currency}")
-        
+
         if LOG_CHAT_ID:
-            await Logger.log_to_telegram(message)
+            self._digest.append(
+                f"💰 {candidate.bot_type.upper()} {amount} {currency}\n"
+                f"Код: {candidate.code[:20]}...\n"
+                f"Аккаунт: {account_info}\n"
+                f"Источник: {candidate.source_chat}"
+            )
 
 
 # Глобальный логгер
 logger = Logger()
-
-
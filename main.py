@@ -3,7 +3,6 @@
 """
 import asyncio
 import sys
-from typing import Set
 from pyrogram import Client, filters
 from pyrogram.types import Message
 from pyrogram.errors import FloodWait
@@ -12,48 +11,71 @@ from config import (
     CRYPTOBOT_USERNAME, XROCKET_USERNAME, MONITOR_ALL_CHATS,
     IGNORE_PRIVATE_CHATS, AUTO_JOIN_CHANNELS, LOG_CHAT_ID,
     LOG_ACTIVATED_CHECKS, LOG_STATS_INTERVAL, AUTO_WITHDRAW_ENABLED,
-    WITHDRAW_MAIN_ACCOUNT, WITHDRAW_INTERVAL
+    WITHDRAW_MAIN_ACCOUNT, WITHDRAW_INTERVAL, DEDUP_WINDOW, DEDUP_MAX_KEYS,
+    METRICS_ENABLED, METRICS_HOST, METRICS_PORT, RAW_INTAKE_FAST_PATH, CONTROL_ENABLED
 )
 from account_manager import account_manager
 from check_processor import check_processor
+from scheduler import scheduler, PRIORITY_NAMES
+from reply_waiter import reply_waiter
+from raw_intake import raw_intake_gate
+from intake import message_key
+from dedup import RecentKeys
+from metrics import metrics, now, MetricsServer
 from database import db
+from logger import logger
 from anticaptcha import anticaptcha
+from chat_index import chat_index
+from intake_queue import intake_queue
+from control import add_control_routes
 
 
 class CheckGrabberBot:
     def __init__(self):
-        self.processed_messages: Set[int] = set()  # Для отслеживания обработанных сообщений
+        # Для отслеживания обработанных сообщений (ограничено по времени и размеру)
+        self.processed_messages = RecentKeys(DEDUP_WINDOW, DEDUP_MAX_KEYS)
         self.stats_task = None
         self.status_task = None
+        self.metrics_server = None
         self.messages_processed = 0
+        self.edits_processed = 0  # Изменения с новым содержимым
+        self.edits_unchanged = 0  # Изменения без новых текста, подписи и ссылок (отсеяны по хешу)
         self.checks_found = 0
         self.start_time = None
         
     async def setup_handlers(self):
         """Настройка обработчиков для всех клиентов"""
         for phone, client in account_manager.get_all_clients().items():
-            account_info = account_manager.get_account_info(phone)
+            # Обработчик новых сообщений (холодные чаты отсекает индекс чатов)
+            @client.on_message(filters.all & ~filters.me & ~filters.chat("me") & chat_index.filter)
+            async def message_handler(cl: Client, msg: Message):
+                await self.handle_message(cl, msg)
             
-            # Создаем замыкание для правильной работы с account_info
-            def make_handler(acc_info):
-                # Обработчик новых сообщений
-                @client.on_message(filters.all & ~filters.me & ~filters.chat("me"))
-                async def message_handler(cl: Client, msg: Message):
-                    await self.handle_message(cl, msg, acc_info)
-                
-                # Обработчик редактированных сообщений
-                @client.on_edited_message(filters.all & ~filters.me & ~filters.chat("me"))
-                async def edited_message_handler(cl: Client, msg: Message):
-                    await self.handle_message(cl, msg, acc_info)
+            # Обработчик редактированных сообщений
+            @client.on_edited_message(filters.all & ~filters.me & ~filters.chat("me") & chat_index.filter)
+            async def edited_message_handler(cl: Client, msg: Message):
+                await self.handle_message(cl, msg, edited=True)
+            
+            # Ответы CryptoBot/xRocket на активации приходят через отдельный обработчик
+            reply_waiter.attach(client)
             
-            make_handler(account_info)
+            # Быстрый путь: Message собирается только для обновлений с маркерами чеков
+            if RAW_INTAKE_FAST_PATH:
+                raw_intake_gate.install(client)
             
             # Подписка на каналы с ботами
             if AUTO_JOIN_CHANNELS:
                 asyncio.create_task(self.auto_join_channels(client, phone))
 
-    async def handle_message(self, client: Client, message: Message, account_info: str):
-        """Обработка сообщения"""
+    async def handle_message(self, client: Client, message: Message, edited: bool = False):
+        """
+        Обработка сообщения
+        Сообщение из общего чата приходит от каждого аккаунта, но разбирается один раз:
+        ключ дубликата не зависит от аккаунта, а найденные чеки раздаются всем аккаунтам
+        edited - изменение сообщения: без нового содержимого отсеивается по хешу,
+        иначе разбирается целиком и раздаются только еще не разосланные коды
+        """
+        received_at = now()
         try:
             # Игнорируем свои сообщения
             if message.from_user and message.from_user.is_self:
@@ -64,29 +86,24 @@ class CheckGrabberBot:
                 if message.from_user and (message.from_user.username in [CRYPTOBOT_USERNAME.lower(), XROCKET_USERNAME.lower()]):
                     return
             
-            # Проверка на дубликаты для этого аккаунта (оптимизировано для скорости)
-            message_id = message.id
-            chat_id = message.chat.id
-            unique_id = f"{account_info}_{chat_id}_{message_id}"
+            # Проверка на дубликаты: (chat_id, message_id, хеш содержимого), общая для всех аккаунтов
+            unique_id = message_key(message)
             
-            if unique_id in self.processed_messages:
+            # Старые ключи вытесняются поколениями, без перестроения множества
+            if not self.processed_messages.add(unique_id):
+                if edited:
+                    self.edits_unchanged += 1
                 return
-            
-            self.processed_messages.add(unique_id)
-            
-            # Очистка старых ID (более эффективная очистка для экономии памяти)
-            if len(self.processed_messages) > 20000:
-                # Оставляем только последние 5000 записей (меньше для экономии памяти)
-                self.processed_messages = set(list(self.processed_messages)[-5000:])
+            if edited:
+                self.edits_processed += 1
             
             # Счетчик обработанных сообщений
             self.messages_processed += 1
+            chat_index.record_message(message.chat.id)
             
-            # Параллельная обработка сообщения (не блокируем выполнение)
-            # Все аккаунты будут обрабатывать одно и то же сообщение одновременно
-            asyncio.create_task(
-                check_processor.process_message(client, message, account_info)
-            )
+            # Обработка в пуле обработчиков очереди приема (не блокируем выполнение)
+            # Найденные чеки сразу раздаются всем аккаунтам
+            intake_queue.submit(message, received_at, edited)
             
         except FloodWait as e:
             await asyncio.sleep(e.value)
@@ -94,6 +111,67 @@ class CheckGrabberBot:
             # Тихая обработка ошибок для скорости
             pass
 
+    def register_gauges(self):
+        """Гейджи состояния конвейера для /metrics"""
+        metrics.gauge("active_tasks", "Активные задачи активации (len(active_tasks))",
+                      lambda: len(check_processor.active_tasks))
+        metrics.gauge("semaphore_in_use", "Занятые слоты планировщика (MAX_CONCURRENT_CHECKS)",
+                      lambda: scheduler.in_use)
+        metrics.gauge("semaphore_waiting", "Ожидающие слота планировщика (все приоритеты)",
+                      scheduler.waiting)
+        metrics.gauge("semaphore_capacity", "Размер пула слотов планировщика",
+                      lambda: scheduler.capacity)
+        for priority, name in PRIORITY_NAMES.items():
+            metrics.gauge(f"scheduler_{name}_running", f"Слоты, занятые приоритетом {name}",
+                          lambda priority=priority: scheduler.running[priority])
+            metrics.gauge(f"scheduler_{name}_waiting", f"Ожидающие слота с приоритетом {name}",
+                          lambda priority=priority: scheduler.waiting(priority))
+            metrics.gauge(f"scheduler_{name}_dropped", f"Отброшенные по сроку ({name})",
+                          lambda priority=priority: scheduler.dropped[priority])
+        metrics.gauge("edits_processed", "Изменения сообщений с новым содержимым",
+                      lambda: self.edits_processed)
+        metrics.gauge("edits_unchanged", "Изменения сообщений без нового содержимого (отсеяны по хешу, с копиями от всех аккаунтов)",
+                      lambda: self.edits_unchanged)
+        metrics.gauge("intake_queue_depth", "Сообщения в очереди приема",
+                      lambda: intake_queue.depth)
+        metrics.gauge("intake_queue_dropped", "Сообщения с непросроченными чеками, вытесненные из заполненной очереди приема",
+                      lambda: intake_queue.dropped)
+        metrics.gauge("intake_queue_expired", "Сообщения, вытесненные из очереди приема по сроку (CLAIM_MAX_AGE)",
+                      lambda: intake_queue.expired)
+        metrics.gauge("intake_queue_filtered", "Сообщения без маркеров чеков (в очередь приема не ставились)",
+                      lambda: intake_queue.filtered)
+        metrics.gauge("claims_waited", "Ожидания места для задач активации (MAX_PENDING_CLAIMS)",
+                      lambda: check_processor.claims_waited)
+        metrics.gauge("create_tasks", "Задачи создания и отправки чека",
+                      lambda: len(check_processor.create_tasks))
+        metrics.gauge("creates_skipped", "Пропущенные создания чека (MAX_PENDING_CREATES)",
+                      lambda: check_processor.creates_skipped)
+        metrics.gauge("db_queue_depth", "Операции в очереди записи базы данных",
+                      db.queue_depth)
+        metrics.gauge("db_checks_archived", "Чеки, перенесенные в архив с запуска (CHECKS_RETENTION_DAYS)",
+                      lambda: db.archived)
+        metrics.gauge("messages_processed", "Уникальные обработанные сообщения",
+                      lambda: self.messages_processed)
+        metrics.labeled_gauge("rate_limit_wait_seconds", "Суммарное ожидание лимита скорости по аккаунтам",
+                              "account", lambda: check_processor.rate_limiter.waited)
+        metrics.labeled_gauge("rate_limit_admitted", "Отправки, допущенные лимитом скорости, по аккаунтам",
+                              "account", lambda: check_processor.rate_limiter.admitted)
+        metrics.labeled_gauge("reply_timeout_seconds", "Текущий таймаут ожидания ответа по ботам",
+                              "bot", lambda: {
+                                  bot_type: check_processor.latency.timeout(bot_type)
+                                  for bot_type in check_processor.latency.bot_types()
+                              })
+        metrics.gauge("chats_tracked", "Чаты со статистикой в индексе чатов",
+                      chat_index.tracked_chats)
+        metrics.gauge("chats_cold", "Холодные чаты (сообщения отсекаются фильтром)",
+                      chat_index.cold_chats)
+        metrics.gauge("chat_messages_skipped", "Сообщения, отсеченные индексом чатов",
+                      lambda: chat_index.skipped)
+        metrics.gauge("raw_updates_seen", "Сырые сообщения, проверенные быстрым путем",
+                      lambda: raw_intake_gate.seen)
+        metrics.gauge("raw_updates_parsed", "Сырые сообщения, переданные в разбор pyrogram",
+                      lambda: raw_intake_gate.passed)
+
     async def auto_join_channels(self, client: Client, phone: str):
         """Автоматическая подписка на каналы с ботами"""
         try:
@@ -130,13 +208,6 @@ class CheckGrabberBot:
                 
                 stats = await db.get_total_stats()
                 
-                # Получаем первый клиент для отправки сообщения
-                clients = account_manager.get_all_clients()
-                if not clients:
-                    continue
-                
-                client = list(clients.values())[0]
-                
                 stats_text = "📊 Статистика активации чеков:\n\n"
                 for bot_type, data in stats.items():
                     stats_text += f"{bot_type.upper()}:\n"
@@ -144,10 +215,7 @@ class CheckGrabberBot:
                     stats_text += f"  Общая сумма: {data.get('total_amount', 0)}\n"
                     stats_text += f"  Аккаунтов: {data.get('unique_accounts', 0)}\n\n"
                 
-                try:
-                    await client.send_message(LOG_CHAT_ID, stats_text)
-                except:
-                    pass
+                await logger.log_to_telegram(stats_text)
                     
             except Exception as e:
                 pass
@@ -167,7 +235,7 @@ class CheckGrabberBot:
                 else:
                     uptime_str = "00:00:00"
                 
-                # Получаем статистику из базы данных
+                # Итоги из счетчиков базы данных (стоимость не зависит от размера истории)
                 stats = await db.get_total_stats()
                 total_checks = sum(data.get('total_checks', 0) for data in stats.values())
                 total_amount = sum(data.get('total_amount', 0) for data in stats.values())
@@ -180,7 +248,11 @@ class CheckGrabberBot:
                 print(f"{'='*60}")
                 print(f"⏱️  Время работы: {uptime_str}")
                 print(f"👥 Активных аккаунтов: {active_accounts}")
-                print(f"📨 Обработано сообщений: {self.messages_processed}")
+                print(f"📨 Обработано сообщений: {self.messages_processed} "
+                      f"(в очереди: {intake_queue.depth}, отброшено: {intake_queue.dropped}, "
+                      f"просрочено: {intake_queue.expired})")
+                print(f"💬 Чатов: {chat_index.tracked_chats()}, холодных: {chat_index.cold_chats()} "
+                      f"(отсечено сообщений: {chat_index.skipped})")
                 print(f"💰 Всего активировано чеков: {total_checks}")
                 print(f"💵 Общая сумма: {total_amount:.2f}")
                 
@@ -189,6 +261,22 @@ class CheckGrabberBot:
                     for bot_type, data in stats.items():
                         print(f"   {bot_type.upper()}: {data.get('total_checks', 0)} чеков, {data.get('total_amount', 0):.2f}")
                 
+                latency = check_processor.latency
+                if latency.bot_types():
+                    print(f"\n⏱️  Время ответа ботов (p50 / p90 / p99, таймаут):")
+                    for bot_type in latency.bot_types():
+                        percentiles = [latency.percentile(bot_type, q) for q in (0.5, 0.9, 0.99)]
+                        shown = " / ".join("—" if value is None else f"{value * 1000:.0f}" for value in percentiles)
+                        print(f"   {bot_type.upper()}: {shown} мс, таймаут {latency.timeout(bot_type):.2f} с "
+                              f"({latency.samples(bot_type)} ответов)")
+                
+                waited = check_processor.rate_limiter.waited
+                if waited:
+                    print(f"\n⏳ Ожидание лимита скорости:")
+                    for account_info, seconds in sorted(waited.items(), key=lambda item: -item[1]):
+                        admitted = check_processor.rate_limiter.admitted[account_info]
+                        print(f"   {account_info}: {seconds:.1f} с на {admitted} сообщений")
+                
                 print(f"{'='*60}\n")
                 
             except Exception as e:
@@ -246,6 +334,16 @@ class CheckGrabberBot:
         await db.init()
         print("✅ База данных инициализирована")
         
+        # Логи пишет фоновая задача, активации уходят в Telegram сводками
+        await logger.start()
+        
+        # Исходы недавних активаций - чтобы не отправлять боту уже активированные чеки
+        loaded = await check_processor.outcomes.load(db)
+        print(f"✅ Загружено исходов активации: {loaded}")
+        
+        # Команды создания чеков, сработавшие в прошлый раз
+        await check_processor.load_create_commands()
+        
         # Инициализация аккаунтов
         count = await account_manager.init_all_accounts()
         
@@ -255,10 +353,28 @@ class CheckGrabberBot:
         
         account_manager.running = True
         
+        # Сообщения обрабатывает постоянный пул, а не задача на каждое сообщение
+        intake_queue.start()
+        
         # Настройка обработчиков
         await self.setup_handlers()
         print("✅ Обработчики настроены")
         
+        # Метрики задержек по этапам и состояние очередей (локальный /metrics)
+        if METRICS_ENABLED:
+            self.register_gauges()
+            self.metrics_server = MetricsServer(metrics)
+            if CONTROL_ENABLED:
+                add_control_routes(self.metrics_server.app)
+            try:
+                await self.metrics_server.start()
+                print(f"✅ Метрики: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+                if CONTROL_ENABLED:
+                    print(f"✅ Настройки на лету: http://{METRICS_HOST}:{METRICS_PORT}/tuning, /chats")
+            except OSError as e:
+                print(f"⚠️ Не удалось запустить сервер метрик: {e}")
+                self.metrics_server = None
+        
         # Запуск фоновых задач
         self.stats_task = asyncio.create_task(self.start_logging())
         self.status_task = asyncio.create_task(self.show_status())
@@ -281,11 +397,19 @@ class CheckGrabberBot:
         except KeyboardInterrupt:
             print("\n🛑 Получен сигнал остановки...")
         finally:
+            # Последняя сводка уходит в Telegram, пока клиенты еще подключены
+            await logger.flush_digest()
             await account_manager.stop_all()
+            await intake_queue.close()
             if self.stats_task:
                 self.stats_task.cancel()
             if self.status_task:
                 self.status_task.cancel()
+            if self.metrics_server:
+                await self.metrics_server.stop()
+            # Дозаписываем очередь базы данных и логов
+            await db.close()
+            await logger.close()
             print("✅ Бот остановлен")
 
 
@@ -0,0 +1,152 @@
+"""
+Модуль метрик: гистограммы задержек по этапам и локальный HTTP-эндпоинт в формате Prometheus
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+from aiohttp import web
+from config import METRICS_HOST, METRICS_PORT
+
+METRICS_PREFIX = "checkgrabber"
+
+# Границы корзин гистограмм (секунды)
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+# Этапы конвейера handle_message → process_message → activate_check → _activate_check_task
+STAGE_DISPATCH = "dispatch"  # от получения сообщения до начала разбора
+STAGE_EXTRACT = "extract"  # извлечение чеков из сообщения
+STAGE_SEMAPHORE = "semaphore_wait"  # ожидание слота планировщика активацией чека
+STAGE_BACKGROUND_WAIT = "background_wait"  # ожидание слота фоновой задачей (создание чека, логи)
+STAGE_RATE_LIMIT = "rate_limit_wait"  # ожидание лимита скорости аккаунта
+STAGE_SEND = "send"  # отправка /start боту
+STAGE_REPLY = "reply_wait"  # ожидание ответа бота
+STAGE_DB_FLUSH = "db_flush"  # запись пачки в базу данных
+STAGE_TOTAL = "total"  # от получения сообщения до результата активации
+
+ALL_BOTS = "all"
+
+
+def now() -> float:
+    """Монотонные часы для замеров этапов"""
+    return time.monotonic()
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последняя корзина - +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """Реестр гистограмм этапов (по этапу и типу бота) и датчиков-гейджей"""
+
+    def __init__(self):
+        self._stages: Dict[Tuple[str, str], Histogram] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+        self._labeled: Dict[str, Tuple[str, str, Callable[[], Dict[str, float]]]] = {}
+
+    def observe(self, stage: str, seconds: float, bot_type: str = ALL_BOTS):
+        """Записать длительность этапа"""
+        histogram = self._stages.get((stage, bot_type))
+        if histogram is None:
+            histogram = self._stages[(stage, bot_type)] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_since(self, stage: str, started_at: float, bot_type: str = ALL_BOTS) -> float:
+        """Записать длительность этапа от started_at до текущего момента; возвращает текущее время"""
+        current = now()
+        self.observe(stage, current - started_at, bot_type)
+        return current
+
+    def gauge(self, name: str, help_text: str, getter: Callable[[], float]):
+        """Зарегистрировать гейдж (значение читается при каждом запросе метрик)"""
+        self._gauges[name] = (help_text, getter)
+
+    def labeled_gauge(self, name: str, help_text: str, label: str,
+                      getter: Callable[[], Dict[str, float]]):
+        """Зарегистрировать гейдж с меткой (getter возвращает {значение метки: значение})"""
+        self._labeled[name] = (help_text, label, getter)
+
+    def render(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        lines: List[str] = []
+        name = f"{METRICS_PREFIX}_stage_seconds"
+        lines.append(f"# HELP {name} Длительность этапов обработки чеков")
+        lines.append(f"# TYPE {name} histogram")
+        for (stage, bot_type), histogram in sorted(self._stages.items()):
+            labels = f'stage="{stage}",bot="{bot_type}"'
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += histogram.counts[-1]
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        for gauge_name, (help_text, getter) in sorted(self._gauges.items()):
+            full_name = f"{METRICS_PREFIX}_{gauge_name}"
+            try:
+                value = float(getter())
+            except Exception:
+                continue
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} gauge")
+            lines.append(f"{full_name} {value}")
+
+        for gauge_name, (help_text, label, getter) in sorted(self._labeled.items()):
+            full_name = f"{METRICS_PREFIX}_{gauge_name}"
+            try:
+                values = {key: float(value) for key, value in getter().items()}
+            except Exception:
+                continue
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} gauge")
+            for key, value in sorted(values.items()):
+                escaped = str(key).replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{full_name}{{{label}="{escaped}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Локальный HTTP-сервер с эндпоинтом /metrics"""
+
+    def __init__(self, registry: Metrics, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self.app.router.add_get("/metrics", self._handle_metrics)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        """Запустить сервер"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        """Остановить сервер"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+
+# Глобальный реестр метрик
+metrics = Metrics()
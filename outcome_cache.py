@@ -0,0 +1,85 @@
+"""
+Общий кеш исходов активации чеков (для всех аккаунтов)
+"""
+import time
+from typing import Callable, Dict, Optional, Set
+
+OUTCOME_ACTIVATED = "activated"  # чек активирован (запоминаются аккаунты)
+OUTCOME_ALREADY_ACTIVATED = "already_activated"  # чек уже забран
+OUTCOME_INVALID = "invalid_check"  # чек не существует или истек
+OUTCOME_ALREADY_CLAIMED = "already_claimed"  # этот аккаунт уже забирал чек (другие еще могут)
+
+# Исходы, после которых чек бесполезен для любого аккаунта
+DEAD_OUTCOMES = (OUTCOME_ALREADY_ACTIVATED, OUTCOME_INVALID)
+
+
+class _Outcome:
+    __slots__ = ("status", "accounts", "recorded_at")
+
+    def __init__(self, status: str, recorded_at: float):
+        self.status = status
+        self.accounts: Set[str] = set()
+        self.recorded_at = recorded_at
+
+
+class CheckOutcomeCache:
+    """
+    Исходы активации по коду чека с TTL.
+
+    Если чек уже забран или недействителен - он пропускается всеми аккаунтами.
+    Если чек активирован - он пропускается только теми аккаунтами, которые
+    его активировали (мульти-чеки могут забрать и остальные).
+    """
+
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: Dict[str, _Outcome] = {}  # в порядке записи, старые первыми
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def blocking_outcome(self, check_code: str, account_info: str) -> Optional[str]:
+        """Исход, из-за которого аккаунту не нужно отправлять чек боту (None - отправлять)"""
+        entry = self._entries.get(check_code)
+        if entry is None:
+            return None
+        if self._clock() - entry.recorded_at >= self.ttl:
+            del self._entries[check_code]
+            return None
+        if entry.status in DEAD_OUTCOMES:
+            return entry.status
+        if account_info in entry.accounts:
+            return OUTCOME_ACTIVATED
+        return None
+
+    def record(self, check_code: str, status: str, account_info: Optional[str] = None):
+        """Записать исход активации"""
+        now = self._clock()
+        self._purge(now)
+
+        entry = self._entries.pop(check_code, None)
+        if entry is None or now - entry.recorded_at >= self.ttl:
+            entry = _Outcome(status, now)
+        elif status in DEAD_OUTCOMES or entry.status not in DEAD_OUTCOMES:
+            entry.status = status
+            entry.recorded_at = now
+        if status == OUTCOME_ACTIVATED and account_info:
+            entry.accounts.add(account_info)
+        self._entries[check_code] = entry
+
+    async def load(self, database):
+        """Загрузить недавно активированные чеки из таблицы checks"""
+        rows = await database.get_recent_activations(self.ttl)
+        for check_code, activated_by in rows:
+            self.record(check_code, OUTCOME_ACTIVATED, activated_by)
+        return len(rows)
+
+    def _purge(self, now: float):
+        """Удалить просроченные записи из начала"""
+        entries = self._entries
+        while entries:
+            check_code = next(iter(entries))
+            if now - entries[check_code].recorded_at < self.ttl:
+                break
+            del entries[check_code]
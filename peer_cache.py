@@ -0,0 +1,105 @@
+"""
+Закрепленные InputPeer ботов и чата рассылки для каждого клиента
+"""
+import re
+import time
+from typing import Dict, List, Optional, Union
+from pyrogram import Client, raw
+from config import (
+    CRYPTOBOT_USERNAME, XROCKET_USERNAME, CHECK_DISTRIBUTION_CHAT_ID, CHECK_DISTRIBUTION_CHAT_USERNAME
+)
+
+PeerId = Union[int, str]
+
+
+def peer_targets() -> List[PeerId]:
+    """Пиры, к которым аккаунты обращаются при активации и создании чеков"""
+    targets: List[PeerId] = [CRYPTOBOT_USERNAME, XROCKET_USERNAME]
+    distribution_chat = CHECK_DISTRIBUTION_CHAT_USERNAME or CHECK_DISTRIBUTION_CHAT_ID
+    if distribution_chat:
+        targets.append(distribution_chat)
+    return targets
+
+
+def _normalize(peer_id: PeerId) -> PeerId:
+    """Ключ пира так же, как его нормализует pyrogram (username без @ в нижнем регистре)"""
+    if isinstance(peer_id, str):
+        return re.sub(r"[@+\s]", "", peer_id.lower())
+    return peer_id
+
+
+class PeerCache:
+    """
+    Кеш InputPeer для каждого клиента.
+
+    send_message и get_chat_history по username каждый раз вызывают
+    client.resolve_peer: запрос в хранилище сессии, а при промахе - запрос
+    contacts.ResolveUsername в сеть. При старте пиры ботов и чата рассылки
+    разрешаются один раз (warm_up), а resolve_peer клиента подменяется:
+    закрепленные пиры отдаются из словаря, остальные - как обычно.
+    """
+
+    def __init__(self):
+        self._peers: Dict[int, Dict[PeerId, raw.base.InputPeer]] = {}
+        self.resolve_times: Dict[str, Dict[PeerId, Optional[float]]] = {}  # аккаунт -> пир -> секунды (None - ошибка)
+        self._installed = set()
+
+    def get(self, client: Client, peer_id: PeerId) -> Optional[raw.base.InputPeer]:
+        """Закрепленный пир клиента или None"""
+        return self._peers.get(id(client), {}).get(_normalize(peer_id))
+
+    async def warm_up(self, client: Client, account_info: str,
+                      targets: Optional[List[PeerId]] = None) -> Dict[PeerId, Optional[float]]:
+        """Разрешить и закрепить пиры для клиента; возвращает время разрешения каждого пира"""
+        pinned = self._peers.setdefault(id(client), {})
+        self._install(client)
+        timings: Dict[PeerId, Optional[float]] = {}
+        for target in targets if targets is not None else peer_targets():
+            started = time.perf_counter()
+            try:
+                pinned[_normalize(target)] = await client.resolve_peer(target)
+                timings[target] = time.perf_counter() - started
+            except Exception as e:
+                print(f"⚠️ Не удалось разрешить {target} для {account_info}: {e}")
+                timings[target] = None
+        self.resolve_times[account_info] = timings
+        return timings
+
+    def _install(self, client: Client):
+        if id(client) in self._installed:
+            return
+        self._installed.add(id(client))
+        original = client.resolve_peer
+        pinned = self._peers[id(client)]
+
+        async def resolve_peer(peer_id: PeerId):
+            peer = pinned.get(_normalize(peer_id))
+            if peer is not None:
+                return peer
+            return await original(peer_id)
+
+        client.resolve_peer = resolve_peer
+
+    def report(self, elapsed: float) -> str:
+        """Итог разрешения пиров для вывода при старте (elapsed - общее время прогрева)"""
+        resolved = [
+            seconds for timings in self.resolve_times.values()
+            for seconds in timings.values() if seconds is not None
+        ]
+        failed = sum(
+            1 for timings in self.resolve_times.values()
+            for seconds in timings.values() if seconds is None
+        )
+        if not resolved:
+            return f"⚠️ Пиры ботов не закреплены (ошибок: {failed})"
+        text = (
+            f"✅ Пиры ботов закреплены: {len(resolved)} для {len(self.resolve_times)} аккаунтов, "
+            f"за {elapsed * 1000:.0f} мс (самый долгий пир - {max(resolved) * 1000:.0f} мс)"
+        )
+        if failed:
+            text += f", ошибок: {failed}"
+        return text
+
+
+# Глобальный кеш пиров
+peer_cache = PeerCache()
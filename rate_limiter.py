@@ -0,0 +1,106 @@
+"""
+Лимит скорости сообщений ботам для каждого аккаунта (GCRA, без блокировок на время ожидания)
+"""
+import asyncio
+import random
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Optional
+from config import (
+    RATE_LIMIT_PER_ACCOUNT, RATE_LIMIT_BURST, USE_HUMAN_LIKE_DELAYS,
+    MIN_DELAY_BETWEEN_BOT_MESSAGES, MAX_DELAY_BETWEEN_BOT_MESSAGES
+)
+
+RATE_LIMIT_PERIOD = 60.0  # Окно лимита RATE_LIMIT_PER_ACCOUNT (секунды)
+
+
+class AccountRateLimiter:
+    """
+    GCRA (generic cell rate algorithm) для каждого аккаунта.
+
+    Для аккаунта хранится одно число - теоретическое время следующей отправки
+    (TAT). Допуск за O(1): отправка разрешена с момента TAT - tolerance,
+    после чего TAT сдвигается на interval. Время отправки резервируется сразу,
+    поэтому ожидающие не стоят в очереди за спящим: каждый спит ровно до своего
+    момента, блокировка на время сна не нужна.
+
+    interval и tolerance подобраны так, чтобы в любом окне period было не больше
+    limit отправок, включая всплеск из burst сообщений подряд:
+    interval = period / (limit - burst + 1), tolerance = (burst - 1) * interval.
+
+    Случайные задержки (human_delays) разносят соседние отправки аккаунта
+    не менее чем на min_delay..max_delay (MIN/MAX_DELAY_BETWEEN_BOT_MESSAGES).
+    """
+
+    def __init__(self, limit: int = RATE_LIMIT_PER_ACCOUNT, burst: int = RATE_LIMIT_BURST,
+                 human_delays: bool = USE_HUMAN_LIKE_DELAYS, period: float = RATE_LIMIT_PERIOD,
+                 clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.period = period
+        self._tat: Dict[str, float] = {}
+        self._last_send: Dict[str, float] = {}
+        self.waited: Dict[str, float] = defaultdict(float)  # Суммарное ожидание лимита по аккаунтам (секунды)
+        self.admitted: Dict[str, int] = defaultdict(int)  # Допущено отправок по аккаунтам
+        self.min_delay = MIN_DELAY_BETWEEN_BOT_MESSAGES
+        self.max_delay = MAX_DELAY_BETWEEN_BOT_MESSAGES
+        self.configure(limit, burst, human_delays)
+
+    def configure(self, limit: Optional[int] = None, burst: Optional[int] = None,
+                  human_delays: Optional[bool] = None, min_delay: Optional[float] = None,
+                  max_delay: Optional[float] = None):
+        """Изменить параметры лимита (действуют для следующих отправок)"""
+        if limit is not None:
+            self.limit = limit
+        if burst is not None:
+            self.burst = burst
+        if human_delays is not None:
+            self.human_delays = human_delays
+        if min_delay is not None:
+            self.min_delay = min_delay
+        if max_delay is not None:
+            self.max_delay = max_delay
+        if self.limit:
+            burst = min(max(self.burst, 1), self.limit)
+            self.interval = self.period / (self.limit - burst + 1)
+            self.tolerance = (burst - 1) * self.interval
+
+    def reserve(self, account_info: str, deadline: Optional[float] = None) -> Optional[float]:
+        """
+        Зарезервировать отправку; возвращает, сколько секунд ждать до нее
+        deadline - крайний момент отправки (по часам лимитера): если до него не успеть,
+        возвращается None и время отправки аккаунта не сдвигается
+        """
+        if not self.limit:
+            return 0.0
+
+        current = self._clock()
+        tat = max(self._tat.get(account_info, current), current)
+        send_at = max(current, tat - self.tolerance)
+
+        if self.human_delays:
+            last_send = self._last_send.get(account_info)
+            if last_send is not None:
+                spacing = random.uniform(self.min_delay, self.max_delay)
+                send_at = max(send_at, last_send + spacing)
+
+        if deadline is not None and send_at > deadline:
+            return None
+        if self.human_delays:
+            self._last_send[account_info] = send_at
+
+        self._tat[account_info] = max(tat, send_at) + self.interval
+        delay = send_at - current
+        self.waited[account_info] += delay
+        self.admitted[account_info] += 1
+        return delay
+
+    async def wait(self, account_info: str, deadline: Optional[float] = None) -> Optional[float]:
+        """Дождаться своей очереди на отправку; возвращает время ожидания (None - не успеть до deadline)"""
+        delay = self.reserve(account_info, deadline)
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+
+# Глобальный экземпляр лимитера
+rate_limiter = AccountRateLimiter()
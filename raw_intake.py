@@ -0,0 +1,87 @@
+"""
+Быстрый путь приема: сообщения без маркеров чеков отбрасываются до сборки pyrogram Message
+"""
+from typing import Dict, List
+from pyrogram import Client, raw
+from pyrogram.dispatcher import Dispatcher
+from check_scanner import CheckScanner
+from config import CRYPTOBOT_USERNAME, XROCKET_USERNAME
+
+_MESSAGE_UPDATES = Dispatcher.NEW_MESSAGE_UPDATES + Dispatcher.EDIT_MESSAGE_UPDATES
+
+
+class RawIntakeGate:
+    """
+    Фильтр сырых обновлений перед разбором pyrogram.
+
+    Диспетчер pyrogram собирает полный Message для каждого нового или
+    измененного сообщения еще до проверки фильтров обработчиков. Шлюз
+    подменяет парсеры этих обновлений: сырое сообщение проверяется на
+    маркеры (start= или /start) в тексте, скрытых ссылках и кнопках,
+    и только прошедшие проверку собираются в Message. Ответы отслеживаемых
+    ботов в личном чате пропускаются всегда (их ждет reply_waiter).
+    """
+
+    def __init__(self, bot_usernames: List[str] = None):
+        usernames = bot_usernames or [CRYPTOBOT_USERNAME, XROCKET_USERNAME]
+        self.bot_usernames = {username.lower() for username in usernames}
+        self.seen = 0  # Сырых сообщений проверено
+        self.passed = 0  # Сообщений передано в разбор pyrogram
+        self._installed = set()
+
+    def install(self, client: Client):
+        """Подменить парсеры сообщений в диспетчере клиента"""
+        if id(client) in self._installed:
+            return
+        self._installed.add(id(client))
+
+        parsers = client.dispatcher.update_parsers
+        for update_type in _MESSAGE_UPDATES:
+            original = parsers.get(update_type)
+            if original is not None:
+                parsers[update_type] = self._gated(original)
+
+    def _gated(self, original):
+        async def parser(update, users, chats):
+            self.seen += 1
+            if not self.passes(update.message, users):
+                return None, type(None)
+            self.passed += 1
+            return await original(update, users, chats)
+        return parser
+
+    def passes(self, message, users: Dict[int, "raw.base.User"]) -> bool:
+        """Нужно ли собирать полный Message для сырого сообщения"""
+        if not isinstance(message, raw.types.Message) or message.out:
+            return False
+
+        has_markers = CheckScanner.has_markers
+        if message.message and has_markers(message.message):
+            return True
+
+        for entity in message.entities or ():
+            url = getattr(entity, "url", None)
+            if url and has_markers(url):
+                return True
+
+        markup = message.reply_markup
+        if isinstance(markup, raw.types.ReplyInlineMarkup):
+            for row in markup.rows:
+                for button in row.buttons:
+                    url = getattr(button, "url", None)
+                    if (url and has_markers(url)) or (button.text and has_markers(button.text)):
+                        return True
+
+        # Ответы CryptoBot/xRocket в личном чате
+        peer = message.peer_id
+        if isinstance(peer, raw.types.PeerUser):
+            user = users.get(peer.user_id)
+            username = getattr(user, "username", None)
+            if username and username.lower() in self.bot_usernames:
+                return True
+
+        return False
+
+
+# Глобальный экземпляр
+raw_intake_gate = RawIntakeGate()
@@ -0,0 +1,177 @@
+"""
+Табличный разбор ответов ботов: статус активации, сумма и валюта одним вызовом
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+from config import CRYPTOBOT_USERNAME, XROCKET_USERNAME
+from outcome_cache import OUTCOME_ACTIVATED, OUTCOME_ALREADY_ACTIVATED, OUTCOME_ALREADY_CLAIMED, OUTCOME_INVALID
+
+OUTCOME_CAPTCHA = "captcha_required"
+
+# Сумма и валюта: "1.5 USDT", "0,25 TON", "10 руб", "$1.00", "100₽"
+_NUMBER = r"\d+(?:[.,]\d+)?"
+_CURRENCY = r"[A-Za-z]{2,10}\b|\$|₽|руб\w*|rub\b"
+_AMOUNT = (
+    rf"(?:(?P<amount>{_NUMBER})\s*(?P<currency>{_CURRENCY})"
+    rf"|(?P<sign>\$|₽)\s*(?P<signed>{_NUMBER}))"
+)
+
+# Порядок проверки статусов: первым срабатывает более специфичный
+# ("вы уже активировали" - ответ этому аккаунту, "уже активирован" - чек забран, а не успех)
+_STATUS_ORDER = [
+    OUTCOME_ALREADY_CLAIMED, OUTCOME_ALREADY_ACTIVATED, OUTCOME_INVALID, OUTCOME_CAPTCHA, OUTCOME_ACTIVATED
+]
+
+# Шаблоны, общие для всех ботов
+_GENERIC_TEMPLATES: List[Tuple[str, str]] = [
+    (OUTCOME_ALREADY_CLAIMED, r"вы\s+уже\s+(?:активирова|получ|использова|забра)"
+                              r"|you\s+(?:have\s+)?already\s+(?:activated|claimed|used|received)"),
+    (OUTCOME_ALREADY_ACTIVATED, r"уже\s+(?:был\s+)?(?:активирова|получ|использова|забра)"
+                                r"|already\s+(?:been\s+)?(?:activated|claimed|used|received)"),
+    (OUTCOME_INVALID, r"не\s+найден|недействител|истек|not\s+found|invalid|expired"
+                      r"|закончил|исчерпа|no\s+longer\s+available|больше\s+недоступ"),
+    (OUTCOME_CAPTCHA, r"капч|captcha"),
+    (OUTCOME_ACTIVATED, r"активирован|activated|получено|получили|you\s+received|you\s+got"),
+]
+
+# Шаблоны конкретных ботов проверяются раньше общих шаблонов того же статуса
+_BOT_TEMPLATES: Dict[str, List[Tuple[str, str]]] = {
+    "cryptobot": [
+        (OUTCOME_ACTIVATED, r"(?:вы\s+получили|you\s+received)\s+" + _AMOUNT),
+    ],
+    "xrocket": [
+        (OUTCOME_ACTIVATED, r"(?:вы\s+получили|получено|you\s+received|you\s+got)\s*:?\s*" + _AMOUNT),
+    ],
+}
+
+# Валюта по ее записи в ответе
+_CURRENCY_ALIASES = {"$": "USD", "₽": "RUB", "rub": "RUB", "toncoin": "TON"}
+
+# Ссылки на чек в ответе на команду создания (по убыванию приоритета)
+_LINK_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r"t\.me/[^\s\)\]]+\?start=[^\s\)\]]+",
+        r"https?://t\.me/[^\s\)\]]+\?start=[^\s\)\]]+",
+        r"t\.me/[^\s\)\]]+",
+        r"https?://t\.me/[^\s\)\]]+",
+        r"https?://[^\s\)\]]+",
+    )
+]
+_CODE_PATTERN = re.compile(r"\bc[A-Za-z0-9_-]{10,}\b")
+
+
+def normalize_currency(raw_currency: str) -> str:
+    """Код валюты из записи в ответе бота"""
+    lowered = raw_currency.lower()
+    if lowered.startswith("руб"):
+        return "RUB"
+    return _CURRENCY_ALIASES.get(lowered, raw_currency.upper())
+
+
+class ReplyClassifier:
+    """
+    Разбор ответов CryptoBot и xRocket по таблице шаблонов.
+
+    Для каждого бота таблица - предкомпилированные шаблоны по порядку статусов
+    (внутри статуса свои раньше общих). Текст приводится к нижнему регистру
+    один раз и проверяется шаблонами по порядку; первый сработавший дает статус
+    (поэтому "уже активирован" - повторная активация, хотя в тексте есть и
+    "активирован"). Шаблоны успешной активации захватывают сумму и валюту
+    в том же совпадении; если в шаблоне их нет, они добираются из текста
+    после ключевого слова.
+    Отдельные выражения быстрее одного общего: для каждого работает поиск
+    по литеральному префиксу, а общее выражение пробует все ветви на каждой позиции.
+    """
+
+    def __init__(self, bot_templates: Dict[str, List[Tuple[str, str]]] = None,
+                 generic_templates: List[Tuple[str, str]] = None):
+        bot_templates = _BOT_TEMPLATES if bot_templates is None else bot_templates
+        generic_templates = _GENERIC_TEMPLATES if generic_templates is None else generic_templates
+        self._tables: Dict[Optional[str], List[Tuple[re.Pattern, str]]] = {
+            bot_type: self._compile(templates + generic_templates)
+            for bot_type, templates in bot_templates.items()
+        }
+        self._tables[None] = self._compile(generic_templates)
+        self._amount_after = re.compile(_AMOUNT)
+        self._bot_types = {
+            CRYPTOBOT_USERNAME.lower(): "cryptobot",
+            XROCKET_USERNAME.lower(): "xrocket",
+        }
+
+    @staticmethod
+    def _compile(templates: List[Tuple[str, str]]) -> List[Tuple[re.Pattern, str]]:
+        """Шаблоны таблицы в порядке проверки: (выражение, статус)"""
+        templates = sorted(templates, key=lambda template: _STATUS_ORDER.index(template[0]))
+        return [(re.compile(pattern), status) for status, pattern in templates]
+
+    def bot_type(self, username: Optional[str]) -> Optional[str]:
+        """Тип бота по username отправителя (None - неизвестный бот)"""
+        return self._bot_types.get((username or "").lower())
+
+    def classify(self, text: str, bot_type: Optional[str] = None) -> Optional[dict]:
+        """
+        Разобрать текст ответа бота
+        Возвращает {"success": True, "amount", "currency", "text"},
+        {"success": False, "error": <исход>} или None, если это не ответ на активацию
+        """
+        if not text:
+            return None
+        lowered = text.lower()
+        for pattern, status in self._tables.get(bot_type) or self._tables[None]:
+            match = pattern.search(lowered)
+            if match:
+                break
+        else:
+            return None
+
+        if status != OUTCOME_ACTIVATED:
+            return {"success": False, "error": status}
+
+        amount, currency = self._amount(match.groupdict())
+        if amount is None:
+            found = self._amount_after.search(lowered, match.end())
+            if found:
+                amount, currency = self._amount(found.groupdict())
+        return {
+            "success": True,
+            "amount": amount,
+            "currency": currency or "UNKNOWN",
+            "text": text,
+        }
+
+    @staticmethod
+    def _amount(groups: Dict[str, Optional[str]]) -> Tuple[Optional[float], Optional[str]]:
+        number = groups.get("amount")
+        raw_currency = groups.get("currency")
+        if number is None:
+            number = groups.get("signed")
+            raw_currency = groups.get("sign")
+        if number is None:
+            return None, None
+        return float(number.replace(",", ".")), normalize_currency(raw_currency)
+
+
+def extract_check_link(text: str) -> Optional[str]:
+    """Извлечь ссылку на чек из текста ответа бота на команду создания"""
+    if not text:
+        return None
+
+    for pattern in _LINK_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            link = match.group(0).strip().rstrip('.,!?)')
+            # Проверяем, что это действительно ссылка на чек
+            lowered = link.lower()
+            if "start=" in lowered or "t.me" in lowered:
+                return link
+
+    # Поиск кода чека (начинается с 'c' для CryptoBot)
+    code_match = _CODE_PATTERN.search(text)
+    if code_match:
+        return f"https://t.me/CryptoBot?start={code_match.group(0)}"
+
+    return None
+
+
+# Глобальный экземпляр классификатора
+reply_classifier = ReplyClassifier()
@@ -0,0 +1,96 @@
+"""
+Модуль для ожидания ответов ботов по входящим сообщениям (без опроса истории)
+"""
+import asyncio
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from pyrogram import Client, filters
+from pyrogram.handlers import EditedMessageHandler, MessageHandler
+from pyrogram.types import Message
+from config import CRYPTOBOT_USERNAME, XROCKET_USERNAME
+
+# Группа обработчиков ответов ботов (выполняется раньше основных обработчиков)
+REPLY_HANDLER_GROUP = -1
+
+
+class _PendingReply:
+    __slots__ = ("future", "classify")
+
+    def __init__(self, future: asyncio.Future, classify: Callable[[Message], Optional[Any]]):
+        self.future = future
+        self.classify = classify
+
+
+class ReplyWaiter:
+    """
+    Сопоставляет входящие сообщения ботов с ожидающими их активациями.
+
+    Ожидание регистрируется до отправки команды боту, входящее сообщение
+    от бота отдается первому (по порядку отправки) ожиданию этого клиента,
+    для которого classify вернул не None.
+    """
+
+    def __init__(self, bot_usernames: List[str] = None):
+        usernames = bot_usernames or [CRYPTOBOT_USERNAME, XROCKET_USERNAME]
+        self.bot_usernames = [username.lower() for username in usernames]
+        self._pending: Dict[Tuple[int, str], Deque[_PendingReply]] = defaultdict(deque)
+        self._attached = set()
+
+    def attach(self, client: Client):
+        """Подключить обработчики ответов ботов к клиенту"""
+        if id(client) in self._attached:
+            return
+        self._attached.add(id(client))
+
+        bot_filter = filters.private & filters.incoming & filters.chat(self.bot_usernames)
+        client.add_handler(MessageHandler(self._on_reply, bot_filter), group=REPLY_HANDLER_GROUP)
+        client.add_handler(EditedMessageHandler(self._on_reply, bot_filter), group=REPLY_HANDLER_GROUP)
+
+    def expect(self, client: Client, bot_username: str,
+               classify: Callable[[Message], Optional[Any]]) -> asyncio.Future:
+        """
+        Зарегистрировать ожидание ответа бота (вызывать до отправки команды)
+        Возвращает future, который получит результат classify
+        """
+        queue = self._pending[(id(client), bot_username.lower())]
+        self._purge(queue)
+        future = asyncio.get_running_loop().create_future()
+        queue.append(_PendingReply(future, classify))
+        return future
+
+    async def wait(self, future: asyncio.Future, timeout: float) -> Optional[Any]:
+        """Дождаться ответа бота; None если бот не ответил за timeout"""
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _on_reply(self, client: Client, message: Message):
+        """Обработчик входящего сообщения от бота"""
+        username = (message.chat.username or "").lower()
+        queue = self._pending.get((id(client), username))
+        if not queue:
+            return
+
+        self._purge(queue)
+        for pending in queue:
+            if pending.future.done():
+                continue
+            try:
+                result = pending.classify(message)
+            except Exception:
+                continue
+            if result is not None:
+                pending.future.set_result(result)
+                break
+        self._purge(queue)
+
+    @staticmethod
+    def _purge(queue: Deque[_PendingReply]):
+        """Удалить завершенные (или отмененные по таймауту) ожидания из начала очереди"""
+        while queue and queue[0].future.done():
+            queue.popleft()
+
+
+# Глобальный экземпляр
+reply_waiter = ReplyWaiter()
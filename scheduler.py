@@ -0,0 +1,179 @@
+"""
+Планировщик активаций: очереди по приоритетам вместо общего семафора
+"""
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from config import MAX_CONCURRENT_CHECKS, BACKGROUND_MAX_SLOTS
+from metrics import metrics, now, STAGE_SEMAPHORE, STAGE_BACKGROUND_WAIT, ALL_BOTS
+
+PRIORITY_CLAIM = 0  # Активация найденного чека
+PRIORITY_BACKGROUND = 1  # Создание и рассылка чеков, логи в Telegram
+
+PRIORITY_NAMES = {PRIORITY_CLAIM: "claim", PRIORITY_BACKGROUND: "background"}
+
+
+class _Waiter:
+    __slots__ = ("future", "deadline", "enqueued_at", "timer")
+
+    def __init__(self, future: asyncio.Future, deadline: Optional[float], enqueued_at: float):
+        self.future = future
+        self.deadline = deadline
+        self.enqueued_at = enqueued_at
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class ActivationScheduler:
+    """
+    Ограничение одновременных обращений к ботам с приоритетами и сроками.
+
+    Слоты выдаются строго по приоритету: пока ждет хоть одна активация чека,
+    фоновые задачи слот не получают. Внутри приоритета первым обслуживается
+    ожидающий с самым ранним сроком (deadline), без срока - в порядке очереди.
+    Ожидающий, чей срок истек, снимается из очереди и получает отказ -
+    сообщение боту для устаревшего чека не отправляется.
+    Фоновые задачи занимают не больше background_slots слотов одновременно,
+    чтобы долгие create_check не вытесняли активации.
+    """
+
+    def __init__(self, capacity: int = MAX_CONCURRENT_CHECKS,
+                 background_slots: int = BACKGROUND_MAX_SLOTS):
+        self.capacity = capacity
+        self.background_slots = background_slots
+        self.running: Dict[int, int] = {priority: 0 for priority in PRIORITY_NAMES}
+        self.dropped: Dict[int, int] = {priority: 0 for priority in PRIORITY_NAMES}
+        self._queues: Dict[int, List] = {priority: [] for priority in PRIORITY_NAMES}
+        self._waiting: Dict[int, int] = {priority: 0 for priority in PRIORITY_NAMES}
+        self._sequence = itertools.count()
+
+    @property
+    def in_use(self) -> int:
+        """Занятые слоты"""
+        return sum(self.running.values())
+
+    def waiting(self, priority: Optional[int] = None) -> int:
+        """Ожидающие слота (всего или для приоритета)"""
+        if priority is None:
+            return sum(self._waiting.values())
+        return self._waiting[priority]
+
+    def _can_run(self, priority: int) -> bool:
+        if self.in_use >= self.capacity:
+            return False
+        if priority == PRIORITY_BACKGROUND:
+            return self.running[priority] < self.background_slots and not self._waiting[PRIORITY_CLAIM]
+        return True
+
+    async def acquire(self, priority: int = PRIORITY_CLAIM, deadline: Optional[float] = None,
+                      bot_type: str = ALL_BOTS) -> bool:
+        """
+        Дождаться слота
+        deadline - момент (по часам metrics.now), после которого слот уже не нужен
+        Возвращает False, если срок истек раньше, чем освободился слот
+        """
+        enqueued_at = now()
+        if deadline is not None and enqueued_at >= deadline:
+            self.dropped[priority] += 1
+            return False
+
+        if not self._waiting[priority] and self._can_run(priority):
+            self.running[priority] += 1
+            self._observe_wait(priority, enqueued_at, bot_type)
+            return True
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), deadline, enqueued_at)
+        order = deadline if deadline is not None else float("inf")
+        heapq.heappush(self._queues[priority], (order, next(self._sequence), waiter))
+        self._waiting[priority] += 1
+        if deadline is not None:
+            waiter.timer = asyncio.get_running_loop().call_later(
+                deadline - enqueued_at, self._expire, priority, waiter
+            )
+
+        try:
+            granted = await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.result():
+                # Слот выдан одновременно с отменой - возвращаем его
+                self.release(priority)
+            else:
+                self._forget(priority, waiter)
+            raise
+
+        if granted:
+            self._observe_wait(priority, enqueued_at, bot_type)
+        return granted
+
+    def release(self, priority: int = PRIORITY_CLAIM):
+        """Освободить слот"""
+        self.running[priority] -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_BACKGROUND, deadline: Optional[float] = None,
+                   bot_type: str = ALL_BOTS):
+        """
+        Контекст со слотом планировщика; внутри блока True, если слот получен
+        (False - срок истек, работу выполнять не нужно)
+        """
+        granted = await self.acquire(priority, deadline, bot_type)
+        try:
+            yield granted
+        finally:
+            if granted:
+                self.release(priority)
+
+    def resize(self, capacity: int, background_slots: Optional[int] = None):
+        """Изменить число слотов на лету (занятые слоты не отбираются)"""
+        self.capacity = capacity
+        if background_slots is not None:
+            self.background_slots = background_slots
+        self._wake()
+
+    def _wake(self):
+        """Раздать свободные слоты ожидающим в порядке приоритета"""
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            while queue and self._can_run(priority):
+                _, _, waiter = heapq.heappop(queue)
+                if waiter.future.done():
+                    continue
+                self._waiting[priority] -= 1
+                if waiter.timer:
+                    waiter.timer.cancel()
+                if waiter.deadline is not None and now() >= waiter.deadline:
+                    self.dropped[priority] += 1
+                    waiter.future.set_result(False)
+                    continue
+                self.running[priority] += 1
+                waiter.future.set_result(True)
+
+    def _expire(self, priority: int, waiter: _Waiter):
+        """Срок ожидающего истек до выдачи слота"""
+        if waiter.future.done():
+            return
+        self._waiting[priority] -= 1
+        self.dropped[priority] += 1
+        waiter.future.set_result(False)
+        # Запись остается в куче и пропускается в _wake (future уже завершен)
+        self._wake()
+
+    def _forget(self, priority: int, waiter: _Waiter):
+        """Ожидающий отменен до выдачи слота"""
+        if waiter.timer:
+            waiter.timer.cancel()
+        if not waiter.future.done():
+            waiter.future.cancel()
+        if waiter.future.cancelled():
+            self._waiting[priority] -= 1
+        self._wake()
+
+    def _observe_wait(self, priority: int, enqueued_at: float, bot_type: str):
+        stage = STAGE_SEMAPHORE if priority == PRIORITY_CLAIM else STAGE_BACKGROUND_WAIT
+        metrics.observe_since(stage, enqueued_at, bot_type)
+
+
+# Глобальный экземпляр планировщика
+scheduler = ActivationScheduler()